@@ -0,0 +1,219 @@
+import os
+import sys
+import json
+import signal
+import argparse
+import multiprocessing
+
+from chromaforge_engine import (
+    PIL_IMPORT_ERROR,
+    OUTPUT_STRATEGIES,
+    PNG_PROFILES,
+    BatchJob,
+    JobControl,
+    PreviewJob,
+    SpriteSheetJob,
+    TilemapJob,
+    format_replace_map,
+    iter_events,
+    load_plan,
+    load_replace_map,
+    save_plan,
+)
+from chromaforge_index import INDEX_NAME
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+INDEX_PATH = os.path.join(os.path.dirname(APP_DIR), "settings", INDEX_NAME)
+JOBS = ["color", "preview", "sprites", "tiles"]
+CONFLICT_CHOICES = ["cancel", "overwrite", "copy"]
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_INVALID = 2
+EXIT_CANCELED = 3
+
+EVENT_FIELDS = {
+    "log": ["message"],
+    "status": ["message"],
+    "progress": ["processed", "total", "eta"],
+    "done": ["files", "changed_files", "converted"],
+    "sheet_log": ["message"],
+    "sheet_done": ["sheets", "folders", "canceled"],
+    "sheet_error": ["message"],
+    "tile_log": ["message"],
+    "tile_done": ["tilemaps", "folders", "canceled"],
+    "tile_error": ["message"],
+    "preview": ["message"],
+    "preview_error": ["message"],
+    "error": ["message"],
+}
+
+
+def write_event(kind, **fields):
+    payload = {"event": kind}
+    payload.update(fields)
+    sys.stdout.write(json.dumps(payload) + "\n")
+    sys.stdout.flush()
+
+
+class EventPrinter:
+    def __init__(self):
+        self.failed = False
+        self.canceled = False
+
+    def __call__(self, msg):
+        kind = msg[0]
+        names = EVENT_FIELDS.get(kind, [])
+        fields = {name: value for name, value in zip(names, msg[1:])}
+        if kind in ("error", "sheet_error", "tile_error", "preview_error"):
+            self.failed = True
+        elif kind == "status" and msg[1] == "Canceled":
+            self.canceled = True
+        elif kind in ("sheet_done", "tile_done") and msg[3]:
+            self.canceled = True
+        write_event(kind, **fields)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="chromaforge_cli",
+        description="Run ChromaForge batch jobs without the GUI. Progress is written to stdout as JSON lines.",
+    )
+    parser.add_argument("settings", help="Settings or preset JSON (same format as Save Preset / last_settings.json).")
+    parser.add_argument("--job", choices=JOBS, default="color", help="Job to run (default: color).")
+    parser.add_argument("--input", help="Override the input folder from the settings file.")
+    parser.add_argument("--output", help="Override the output folder from the settings file.")
+    parser.add_argument("--workers", type=int, help="Parallel workers for the color job (default: settings value or CPU count).")
+    parser.add_argument("--dry-run", action="store_true", help="Count matches without writing files.")
+    parser.add_argument("--stream", action="store_true", help="Start processing while the input folder is still being scanned.")
+    parser.add_argument("--incremental", action="store_true", help="Skip inputs unchanged since the last run (uses the manifest in the output folder).")
+    parser.add_argument("--csv-timings", action="store_true", help="Add encode time, output size, per-operation counts, duplicate source and per-stage timing columns to the CSV log.")
+    parser.add_argument("--resume", action="store_true", help="With --job color: skip inputs the interrupted last run into this output folder already finished (per its journal).")
+    parser.add_argument("--dedupe", action="store_true", help="Process byte-identical inputs once and copy or link the other outputs.")
+    parser.add_argument("--scan-threads", type=int, help="Folders listed in parallel while scanning the input (default: settings value or 8).")
+    parser.add_argument("--output-strategy", choices=OUTPUT_STRATEGIES, help="How Rename only folders and passed-through files are written.")
+    parser.add_argument("--pass-through", action="store_true", help="Write the original file when nothing in it matched instead of re-encoding.")
+    parser.add_argument("--png-profile", choices=PNG_PROFILES, help="PNG encoder profile for written images (default: settings value or default).")
+    parser.add_argument(
+        "--replace-map",
+        nargs="+",
+        metavar="FILE",
+        help="Run replace mode with this map: a CSV of source,destination colors, or a source and a destination .gpl/.hex palette.",
+    )
+    parser.add_argument("--strip-threshold", type=float, metavar="MP", help="Process images above this many megapixels in strips to bound memory (0 = never).")
+    parser.add_argument("--tolerance", type=int, help="RGB distance for key/replace color matching (default: settings value or 0 = exact).")
+    parser.add_argument("--save-plan", help="With --job preview: save the routing plan to this file.")
+    parser.add_argument("--plan", help="With --job color: run a saved routing plan instead of scanning the input.")
+    parser.add_argument("--no-index", action="store_true", help="Walk the input folder directly instead of using the shared input index.")
+    parser.add_argument(
+        "--on-conflict",
+        choices=CONFLICT_CHOICES,
+        default="cancel",
+        help="What to do when output names collide (default: cancel).",
+    )
+    return parser
+
+
+def load_settings(args):
+    with open(args.settings, "r", encoding="utf-8") as handle:
+        settings = json.load(handle)
+    if not isinstance(settings, dict):
+        raise ValueError("Settings file must contain a JSON object.")
+    if args.input:
+        settings["input"] = args.input
+    if args.output:
+        settings["output"] = args.output
+    if args.dry_run:
+        settings["dry_run"] = True
+    if args.stream:
+        settings["streaming"] = True
+    if args.incremental:
+        settings["incremental"] = True
+    if args.dedupe:
+        settings["dedupe_inputs"] = True
+    if args.csv_timings:
+        settings["csv_timings"] = True
+    if args.output_strategy:
+        settings["output_strategy"] = args.output_strategy
+    if args.png_profile:
+        settings["png_profile"] = args.png_profile
+    if args.pass_through:
+        settings["pass_through_unchanged"] = True
+    if args.scan_threads is not None:
+        settings["scan_threads"] = args.scan_threads
+    if args.strip_threshold is not None:
+        settings["strip_threshold_mp"] = args.strip_threshold
+    if args.tolerance is not None:
+        settings["tolerance"] = args.tolerance
+        # An operation chain carries its own tolerances, which replace the top-level one.
+        settings["operations"] = [
+            dict(op, tolerance=args.tolerance) if isinstance(op, dict) and op.get("mode") != "fill" else op
+            for op in settings.get("operations") or []
+        ]
+    if args.replace_map:
+        if len(args.replace_map) > 2:
+            raise ValueError("--replace-map takes a CSV file or two palette files.")
+        settings["mode"] = "replace"
+        settings["replace_map"] = format_replace_map(load_replace_map(*args.replace_map))
+        settings["operations"] = []
+    return settings
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if PIL_IMPORT_ERROR is not None:
+        write_event("error", message=f"Pillow is not installed: {PIL_IMPORT_ERROR}")
+        return EXIT_FAILED
+
+    try:
+        settings = load_settings(args)
+        index_path = None if args.no_index else INDEX_PATH
+        if args.job == "color":
+            if args.workers is not None:
+                settings["workers"] = args.workers
+            job = BatchJob.from_settings(settings, APP_DIR, index_path)
+            if args.plan:
+                job.plan = load_plan(args.plan)
+            job.resume = args.resume
+        elif args.job == "preview":
+            job = PreviewJob.from_settings(settings, index_path)
+        elif args.job == "sprites":
+            job = SpriteSheetJob.from_settings(settings, index_path)
+        else:
+            job = TilemapJob.from_settings(settings, index_path)
+    except (OSError, ValueError, TypeError) as exc:
+        write_event("error", message=str(exc))
+        return EXIT_INVALID
+
+    printer = EventPrinter()
+    control = JobControl()
+
+    def resolve_conflicts(groups, files):
+        write_event("conflicts", groups=groups, files=files, choice=args.on_conflict)
+        return args.on_conflict
+
+    def interrupt(signum, frame):
+        # First Ctrl+C finishes the files in progress and stops; a second one aborts.
+        write_event("status", message="Canceling...")
+        control.cancel()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    signal.signal(signal.SIGINT, interrupt)
+    for event in iter_events(job, resolve_conflicts, control):
+        printer(event)
+        if event[0] == "preview" and args.save_plan:
+            try:
+                save_plan(event[2], args.save_plan)
+            except OSError as exc:
+                printer(("error", f"Failed to save plan: {exc}"))
+
+    if printer.failed:
+        return EXIT_FAILED
+    if printer.canceled:
+        return EXIT_CANCELED
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
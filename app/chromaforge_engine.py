@@ -0,0 +1,2985 @@
+import os
+import re
+import io
+import csv
+import json
+import time
+import math
+import zlib
+import queue
+import shutil
+import tempfile
+import heapq
+import struct
+import hashlib
+import signal
+import threading
+import contextlib
+import functools
+import itertools
+import collections
+import concurrent.futures
+from dataclasses import dataclass, field, replace
+
+from chromaforge_index import MAX_SCAN_THREADS, SCAN_THREADS, InputIndex
+
+try:
+    from PIL import Image, PngImagePlugin
+except Exception as exc:
+    Image = None
+    PIL_IMPORT_ERROR = exc
+else:
+    PIL_IMPORT_ERROR = None
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+MAX_POOL_WORKERS = 61 if os.name == "nt" else 256
+PIPELINE_READERS = 4
+PIPELINE_WRITERS = 2
+PIPELINE_QUEUE_DEPTH = 2
+MANIFEST_NAME = "chromaforge_manifest.json"
+JOURNAL_NAME = "chromaforge_journal.jsonl"
+JOURNAL_BATCH = 256
+JOURNAL_INTERVAL = 2.0
+SKIP_ACTIONS = ("skip_existing_file", "unchanged", "duplicate", "journaled", "overwritten")
+JOURNAL_ACTIONS = ("process", "rename_only", "duplicate", "unchanged")
+KEY_CUBE_MIN_COLORS = 16
+MAX_TOLERANCE = 442
+OPERATION_LABELS = {"transparent": "key", "replace": "replace", "fill": "fill"}
+PLAN_VERSION = 1
+OUTPUT_STRATEGIES = ["copy", "hardlink", "reflink", "re-encode"]
+PNG_PROFILES = ["default", "fast", "release", "auto"]
+AUTO_PNG_LEVELS = (9, 6, 3, 1)
+AUTO_PNG_SAMPLE = 8
+AUTO_TARGET_MPS = 25.0
+FICLONE = 0x40049409
+STRIP_THRESHOLD_MP = 64.0
+STRIP_PIXELS = 1 << 19
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_READ_CHUNK = 1 << 20
+# PNG color type -> (Pillow mode, samples per pixel) for the 8-bit strip reader.
+PNG_STRIP_MODES = {0: ("L", 1), 2: ("RGB", 3), 3: ("P", 1), 4: ("LA", 2), 6: ("RGBA", 4)}
+CSV_COLUMNS = ["input", "output", "action", "converted"]
+CSV_STAGE_COLUMNS = ["decode_ms", "transform_ms", "write_ms", "in_bytes", "pixels"]
+# Added after CSV_COLUMNS when csv_timings is on, so the default log keeps its original header.
+CSV_TIMING_COLUMNS = ["encode_ms", "bytes", "per_operation", "duplicate_of"] + CSV_STAGE_COLUMNS
+METRIC_STAGES = ("decode", "transform", "encode", "write")
+SLOWEST_FILES = 5
+ETA_SMOOTHING = 0.3
+PLAN_TASK_FIELDS = ("rel_in", "rel_out", "folder_mode", "custom_colors", "action")
+PREFIX_SCAN_INTERVAL = 0.2
+
+
+def normalize_hex(hex_str):
+    value = hex_str.strip()
+    if value.startswith("#"):
+        value = value[1:]
+    if not re.fullmatch(r"[0-9A-Fa-f]{6}", value):
+        raise ValueError("Color must be a 6-digit hex value like #00FF00")
+    return "#" + value.upper()
+
+
+def hex_to_rgb(hex_str):
+    value = normalize_hex(hex_str)[1:]
+    r = int(value[0:2], 16)
+    g = int(value[2:4], 16)
+    b = int(value[4:6], 16)
+    return (r, g, b)
+
+
+def parse_hex_list(hex_list):
+    if not hex_list.strip():
+        return []
+    parts = re.split(r"[\s,]+", hex_list.strip())
+    colors = []
+    for part in parts:
+        if not part:
+            continue
+        colors.append(normalize_hex(part))
+    return colors
+
+
+def first_hex_from_list(hex_list):
+    colors = parse_hex_list(hex_list)
+    return colors[0] if colors else ""
+
+
+REPLACE_PAIR_RE = re.compile(r"(#?[0-9A-Fa-f]{6})\s*(?:->|>|=|:)\s*(#?[0-9A-Fa-f]{6})")
+
+
+def parse_replace_map(text):
+    """Parse "#SRC>#DST" pairs (also ->, = or :) separated by commas, spaces or lines.
+
+    Returns a list of (src_rgb, dst_rgb). Sources must be unique: every pixel is
+    looked up once against the original colors, so #A>#B, #B>#C swaps rather
+    than chains.
+    """
+    pairs = []
+    for part in re.split(r"[,;\n]+", text):
+        part = part.strip()
+        if not part:
+            continue
+        match = REPLACE_PAIR_RE.fullmatch(part)
+        if match is None:
+            raise ValueError(f"Replace map entries look like #FF0000>#00FF00, not: {part}")
+        pairs.append((hex_to_rgb(match.group(1)), hex_to_rgb(match.group(2))))
+    return check_replace_pairs(pairs)
+
+
+def check_replace_pairs(pairs):
+    seen = set()
+    for src, _ in pairs:
+        if src in seen:
+            raise ValueError(f"{rgb_to_hex(src)} is listed twice in the replace map.")
+        seen.add(src)
+    return pairs
+
+
+def format_replace_map(pairs):
+    return ", ".join(f"{rgb_to_hex(src)}>{rgb_to_hex(dst)}" for src, dst in pairs)
+
+
+def rgb_to_hex(rgb):
+    return "#{:02X}{:02X}{:02X}".format(*rgb[:3])
+
+
+def load_palette_file(path):
+    """Colors of a GIMP .gpl palette or a .hex file (one RRGGBB per line), in order."""
+    colors = []
+    with open(path, "r", encoding="utf-8", errors="replace") as handle:
+        lines = handle.read().splitlines()
+    if path.lower().endswith(".gpl"):
+        for line in lines:
+            fields = line.split()
+            if len(fields) >= 3 and all(field.isdigit() for field in fields[:3]):
+                colors.append(tuple(min(255, int(field)) for field in fields[:3]))
+        return colors
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith(";"):
+            colors.append(hex_to_rgb(line))
+    return colors
+
+
+def load_replace_map(path, to_path=None):
+    """Replace pairs from a CSV (source,destination columns), or two palette files matched by index."""
+    if path.lower().endswith(".csv"):
+        pairs = []
+        with open(path, "r", newline="", encoding="utf-8-sig") as handle:
+            for row in csv.reader(handle):
+                cells = [cell.strip() for cell in row if cell.strip()]
+                if len(cells) < 2:
+                    continue
+                try:
+                    pairs.append((hex_to_rgb(cells[0]), hex_to_rgb(cells[1])))
+                except ValueError:
+                    if pairs:
+                        raise
+                    # Header row.
+        return check_replace_pairs(pairs)
+    if to_path is None:
+        raise ValueError("A palette file needs a second palette with the destination colors.")
+    sources = load_palette_file(path)
+    targets = load_palette_file(to_path)
+    if len(sources) != len(targets):
+        raise ValueError(f"The palettes have different sizes ({len(sources)} and {len(targets)} colors).")
+    return check_replace_pairs(list(zip(sources, targets)))
+
+
+FileName = collections.namedtuple("FileName", "base ext prefix splits group direction frame number")
+FileName.__doc__ = """One PNG name parsed for routing and sprite grouping (see classify_filename)."""
+
+PREFIX_SPLIT_RE = re.compile(r"(?=_(\d+)_)")
+GROUP_SPLIT_RE = re.compile(r"[-_]")
+GROUP_FRAME_RE = re.compile(r"F\d+")
+GROUP_LETTER_RE = re.compile(r"[A-Z]")
+DIRECTION_RE = re.compile(r"(?:^|[-_])(N|E|S|W)(?:$|[-_])")
+FRAME_RE = re.compile(r"(?:^|[-_])F(\d+)(?:$|[-_])")
+NUMBER_RE = re.compile(r"(?:^|[-_])(\d+)(?:$)")
+DIRECTION_ORDER = {"N": 0, "E": 1, "S": 2, "W": 3}
+CLASSIFY_CACHE_SIZE = 1 << 16
+
+
+def group_prefix(base):
+    parts = GROUP_SPLIT_RE.split(base)
+    first = parts[0].strip()
+    if not first:
+        return base
+    if first.isdigit() and len(parts) > 1:
+        second = parts[1].strip()
+        if second:
+            second_upper = second.upper()
+            if GROUP_FRAME_RE.fullmatch(second_upper) or second_upper in DIRECTION_ORDER or second.isdigit():
+                return first
+            if GROUP_LETTER_RE.search(second_upper):
+                return second
+    return first
+
+
+@functools.lru_cache(maxsize=CLASSIFY_CACHE_SIZE)
+def classify_filename(name):
+    """Parse a file name once; cached, so preview, runs and sprite grouping share it.
+
+    splits lists every (token, end) where the name starts with token + "_<digits>_"
+    (end is just past that); prefix is the first such token when it has no "_"
+    (what Scan for prefixes reports).
+    """
+    base, ext = os.path.splitext(name)
+    splits = tuple((base[:match.start()], match.end(1) + 1) for match in PREFIX_SPLIT_RE.finditer(base))
+    prefix = None
+    if splits and splits[0][0] and "_" not in splits[0][0]:
+        prefix = splits[0][0]
+    base_upper = base.upper()
+    direction_match = DIRECTION_RE.search(base_upper)
+    frame_match = FRAME_RE.search(base_upper)
+    number_match = NUMBER_RE.search(base_upper)
+    return FileName(
+        base,
+        ext,
+        prefix,
+        splits,
+        group_prefix(base),
+        direction_match.group(1) if direction_match else "",
+        int(frame_match.group(1)) if frame_match else None,
+        int(number_match.group(1)) if number_match else None,
+    )
+
+
+class PrefixMatcher:
+    """The routing prefixes as a dict lookup on the tokens found by classify_filename.
+
+    Same result as the old ^(p1|p2|...)_\\d+_ alternation (earliest listed prefix
+    wins), without a regex that grows with the prefix list.
+    """
+
+    def __init__(self, prefixes):
+        self.rank = {}
+        for prefix in prefixes:
+            self.rank.setdefault(prefix, len(self.rank))
+
+    def match(self, name):
+        """Return (prefix, end) for the best routing prefix of name, or None."""
+        best = None
+        for token, end in classify_filename(name).splits:
+            rank = self.rank.get(token)
+            if rank is not None and (best is None or rank < best[0]):
+                best = (rank, token, end)
+        return best[1:] if best is not None else None
+
+
+def build_prefix_matcher(prefixes):
+    if not prefixes:
+        return None
+    return PrefixMatcher(prefixes)
+
+
+def pack_rgb(rgb):
+    return (rgb[0] << 16) | (rgb[1] << 8) | rgb[2]
+
+
+def key_lookup(colors, keys, tolerance=0):
+    """Map each of colors to the index of the first key within tolerance; misses are left out.
+
+    Tolerance is the Euclidean distance in RGB (0 = exact). Callers pass the
+    distinct colors of an image or palette, so each one is resolved once.
+    """
+    if not tolerance:
+        first = {}
+        for idx, key in enumerate(keys):
+            first.setdefault(key, idx)
+        return {color: first[color] for color in colors if color in first}
+    limit = tolerance * tolerance
+    lookup = {}
+    for color in colors:
+        r, g, b = color[:3]
+        for idx, key in enumerate(keys):
+            if (r - key[0]) ** 2 + (g - key[1]) ** 2 + (b - key[2]) ** 2 <= limit:
+                lookup[color] = idx
+                break
+    return lookup
+
+
+def step_keys(mode, target_rgbs, replace_pairs):
+    return list(target_rgbs) if mode == "transparent" else [src for src, _ in replace_pairs]
+
+
+def process_pixels_loop(img, mode, target_rgbs, replace_pairs, fill_color, fill_shadows, dry_run, hits=None, tolerance=0):
+    pixels = img.load()
+    width, height = img.size
+
+    converted = 0
+    if mode == "fill":
+        fr, fg, fb = fill_color
+        for y in range(height):
+            for x in range(width):
+                r, g, b, a = pixels[x, y]
+                if a == 0:
+                    converted += 1
+                    if not dry_run:
+                        pixels[x, y] = (fr, fg, fb, 255)
+                elif fill_shadows and a < 255:
+                    converted += 1
+                    if not dry_run:
+                        pixels[x, y] = (fr, fg, fb, 255)
+        return img, converted
+
+    rgb = img.convert("RGB")
+    present = [color for _, color in rgb.getcolors(width * height) or []]
+    lookup = key_lookup(present, step_keys(mode, target_rgbs, replace_pairs), tolerance)
+    found = collections.Counter()
+    for y in range(height):
+        for x in range(width):
+            r, g, b, a = pixels[x, y]
+            idx = lookup.get((r, g, b))
+            if idx is None:
+                continue
+            found[idx] += 1
+            if dry_run:
+                continue
+            if mode == "transparent":
+                pixels[x, y] = (r, g, b, 0)
+            else:
+                dst_rgb = replace_pairs[idx][1]
+                pixels[x, y] = (dst_rgb[0], dst_rgb[1], dst_rgb[2], a)
+    if mode == "replace":
+        add_hits(hits, replace_pairs, found)
+    return img, sum(found.values())
+
+
+def add_hits(hits, replace_pairs, found):
+    """Add per-pair match counts (found: pair index -> pixels) to hits, keyed by (src_rgb, dst_rgb)."""
+    if hits is None:
+        return
+    for idx, count in found.items():
+        if count:
+            pair = replace_pairs[idx]
+            hits[pair] = hits.get(pair, 0) + count
+
+
+@functools.lru_cache(maxsize=32)
+def replace_lookup(replace_pairs):
+    """Sorted packed source keys and the matching destination rows, for searchsorted."""
+    order = sorted(range(len(replace_pairs)), key=lambda idx: pack_rgb(replace_pairs[idx][0]))
+    keys = np.array([pack_rgb(replace_pairs[idx][0]) for idx in order], dtype=np.uint32)
+    dst = np.array([replace_pairs[idx][1] for idx in order], dtype=np.uint8)
+    return keys, dst, order
+
+
+@functools.lru_cache(maxsize=4)
+def key_cube(keys, tolerance):
+    """Full 256^3 table indexed by packed RGB: 1 + index of the first key within tolerance, 0 for no match.
+
+    Built once per key list (16 MB, or 32 MB past 255 keys), after which matching
+    is one lookup per pixel however many keys there are.
+    """
+    dtype = np.uint8 if len(keys) < 256 else np.uint16
+    cube = np.zeros((256, 256, 256), dtype=dtype)
+    limit = tolerance * tolerance
+    # Later keys first so the earliest listed key wins where ranges overlap.
+    for idx in reversed(range(len(keys))):
+        r, g, b = keys[idx]
+        g_low, g_high = max(0, g - tolerance), min(255, g + tolerance) + 1
+        b_low, b_high = max(0, b - tolerance), min(255, b + tolerance) + 1
+        plane = (np.arange(g_low, g_high) - g)[:, None] ** 2 + (np.arange(b_low, b_high) - b)[None, :] ** 2
+        # One red slice at a time keeps the temporaries at (2t+1)^2 even for wide tolerances.
+        for red in range(max(0, r - tolerance), min(255, r + tolerance) + 1):
+            within = plane <= limit - (red - r) ** 2
+            cube[red, g_low:g_high, b_low:b_high][within] = idx + 1
+    return cube.reshape(-1)
+
+
+def uses_key_cube(mode, keys, tolerance):
+    """True when matching goes through key_cube: any tolerance, or a long exact key list."""
+    return bool(tolerance) or (mode == "transparent" and len(set(keys)) > KEY_CUBE_MIN_COLORS)
+
+
+def cube_counts(rgb_array, keys, tolerance):
+    """{key index: matching pixels} of an (..., 3) uint8 array, via key_cube."""
+    packed = (rgb_array[..., 0].astype(np.uint32) << 16) | (rgb_array[..., 1].astype(np.uint32) << 8) | rgb_array[..., 2]
+    per_slot = np.bincount(key_cube(tuple(keys), tolerance)[packed].ravel(), minlength=len(keys) + 1)
+    return {idx: int(per_slot[idx + 1]) for idx in range(len(keys)) if per_slot[idx + 1]}
+
+
+def process_pixels_numpy(img, mode, target_rgbs, replace_pairs, fill_color, fill_shadows, dry_run, hits=None, tolerance=0):
+    arr = np.asarray(img) if dry_run else np.array(img)
+    if mode == "fill":
+        alpha = arr[..., 3]
+        mask = alpha < 255 if fill_shadows else alpha == 0
+        converted = int(np.count_nonzero(mask))
+        if not dry_run and converted:
+            arr[mask] = (fill_color[0], fill_color[1], fill_color[2], 255)
+    else:
+        packed = (arr[..., 0].astype(np.uint32) << 16) | (arr[..., 1].astype(np.uint32) << 8) | arr[..., 2]
+        slots = None
+        offset = 0
+        keys = step_keys(mode, target_rgbs, replace_pairs)
+        if uses_key_cube(mode, keys, tolerance):
+            slots = key_cube(tuple(keys), tolerance)[packed]
+            mask = slots != 0
+            # Cube slots are 1-based; row 0 of dst is never used.
+            offset = 1
+            order = range(len(keys))
+            dst = np.array([(0, 0, 0)] + [pair[1] for pair in replace_pairs], dtype=np.uint8)
+        elif mode == "transparent":
+            keys = np.fromiter((pack_rgb(rgb) for rgb in set(target_rgbs)), dtype=np.uint32)
+            mask = np.isin(packed, keys)
+        elif len(replace_pairs) > 1:
+            keys, dst, order = replace_lookup(tuple(replace_pairs))
+            slots = np.minimum(np.searchsorted(keys, packed), len(keys) - 1)
+            mask = keys[slots] == packed
+        else:
+            mask = packed == pack_rgb(replace_pairs[0][0])
+        converted = int(np.count_nonzero(mask))
+        if mode == "replace" and hits is not None and converted:
+            if slots is None:
+                found = {0: converted}
+            else:
+                per_slot = np.bincount(slots[mask], minlength=len(dst))
+                found = {idx: int(per_slot[slot + offset]) for slot, idx in enumerate(order)}
+            add_hits(hits, replace_pairs, found)
+        if not dry_run and converted:
+            if mode == "transparent":
+                arr[..., 3][mask] = 0
+            elif slots is None:
+                arr[mask, :3] = replace_pairs[0][1]
+            else:
+                arr[mask, :3] = dst[slots[mask]]
+    if dry_run or not converted:
+        return img, converted
+    return Image.fromarray(arr), converted
+
+
+def palette_alphas(img, count):
+    transparency = img.info.get("transparency")
+    alphas = [255] * count
+    if isinstance(transparency, int):
+        if transparency < count:
+            alphas[transparency] = 0
+    elif isinstance(transparency, bytes):
+        for idx, value in enumerate(transparency[:count]):
+            alphas[idx] = value
+    return alphas
+
+
+def match_palette(img, mode, target_rgbs, replace_pairs, hits=None, tolerance=0):
+    """Returns (palette, [(palette index, key index)], converted)."""
+    palette = img.getpalette("RGB") or []
+    count = len(palette) // 3
+    histogram = img.histogram()
+
+    colors = [tuple(palette[idx * 3:idx * 3 + 3]) for idx in range(count)]
+    lookup = key_lookup(set(colors), step_keys(mode, target_rgbs, replace_pairs), tolerance)
+    matched = [(idx, lookup[color]) for idx, color in enumerate(colors) if color in lookup]
+    converted = sum(histogram[idx] for idx, _ in matched)
+    if mode == "replace":
+        found = collections.Counter()
+        for idx, key_idx in matched:
+            found[key_idx] += histogram[idx]
+        add_hits(hits, replace_pairs, found)
+    return palette, matched, converted
+
+
+def transform_palette(img, mode, target_rgbs, replace_pairs, hits=None, tolerance=0):
+    palette, matched, converted = match_palette(img, mode, target_rgbs, replace_pairs, hits, tolerance)
+    alphas = palette_alphas(img, len(palette) // 3)
+    for idx, key_idx in matched:
+        if mode == "transparent":
+            alphas[idx] = 0
+        else:
+            palette[idx * 3:idx * 3 + 3] = replace_pairs[key_idx][1]
+    if mode == "replace":
+        img.putpalette(palette)
+
+    save_args = {}
+    img.info.pop("transparency", None)
+    while alphas and alphas[-1] == 255:
+        alphas.pop()
+    if alphas:
+        save_args["transparency"] = bytes(alphas)
+    return img, converted, save_args
+
+
+def count_matches(img, mode, target_rgbs, replace_pairs, fill_color, fill_shadows, hits=None, tolerance=0):
+    if mode == "fill":
+        if fill_color is None:
+            return 0
+        alpha = img.getchannel("A") if img.mode in ("RGBA", "LA") else img.convert("RGBA").getchannel("A")
+        histogram = alpha.histogram()
+        return sum(histogram[:255]) if fill_shadows else histogram[0]
+
+    if img.mode == "P":
+        return match_palette(img, mode, target_rgbs, replace_pairs, hits, tolerance)[2]
+
+    rgb = img if img.mode == "RGB" else img.convert("RGB")
+    keys = step_keys(mode, target_rgbs, replace_pairs)
+    if np is not None and uses_key_cube(mode, keys, tolerance):
+        # Testing every distinct color against every key is slow on noisy images;
+        # the lookup table process_pixels_numpy uses costs one read per pixel.
+        found = cube_counts(np.asarray(rgb), keys, tolerance)
+    else:
+        colors = rgb.getcolors(rgb.width * rgb.height) or []
+        lookup = key_lookup([color for _, color in colors], keys, tolerance)
+        found = collections.Counter()
+        for count, color in colors:
+            if color in lookup:
+                found[lookup[color]] += count
+    if mode == "replace":
+        add_hits(hits, replace_pairs, found)
+    return sum(found.values())
+
+
+def count_steps(img, steps, hits=None):
+    """Per-step match counts without writing; a chain has to be applied to count later steps."""
+    if len(steps) == 1:
+        step = steps[0]
+        return [count_matches(img, step.mode, step.target_rgbs, step.replace_pairs(), step.fill_rgb, step.fill_shadows, hits, step.tolerance)]
+    return transform_steps(img, steps, hits)[1]
+
+
+def count_image_steps(in_path, steps, output=None):
+    # The dry-run path of a Color Mode run, so images over the strip threshold are counted in strips.
+    return process_image(in_path, None, steps, True, output)[0]
+
+
+def transform_image(img, mode, target_rgbs, replace_pairs, fill_color, fill_shadows, hits=None, tolerance=0):
+    if img.mode == "P" and mode in ("transparent", "replace"):
+        return transform_palette(img, mode, target_rgbs, replace_pairs, hits, tolerance)
+    img = img.convert("RGBA")
+    if mode == "fill" and fill_color is None:
+        return None, 0, {}
+
+    engine = process_pixels_numpy if np is not None else process_pixels_loop
+    img, converted = engine(img, mode, target_rgbs, replace_pairs, fill_color, fill_shadows, False, hits, tolerance)
+    return img, converted, {}
+
+
+def transform_steps(img, steps, hits=None):
+    """Apply the color steps in order to one decoded image.
+
+    Returns (image or None, per-step converted counts, save_args). A single step
+    keeps the palette and fill shortcuts of transform_image; a chain works on
+    one RGBA copy so later steps see the result of earlier ones. Replace steps
+    add their per-color matches to hits.
+    """
+    if len(steps) == 1:
+        step = steps[0]
+        out_img, converted, save_args = transform_image(img, step.mode, step.target_rgbs, step.replace_pairs(), step.fill_rgb, step.fill_shadows, hits, step.tolerance)
+        return out_img, [converted], save_args
+    img = img.convert("RGBA")
+    engine = process_pixels_numpy if np is not None else process_pixels_loop
+    counts = []
+    for step in steps:
+        img, converted = engine(img, step.mode, step.target_rgbs, step.replace_pairs(), step.fill_rgb, step.fill_shadows, False, hits, step.tolerance)
+        counts.append(converted)
+    return img, counts, {}
+
+
+def format_replace_hits(steps, hits):
+    """One line with the matches of every replace pair in the run (unused pairs show 0)."""
+    pairs = [pair for step in steps if step.mode == "replace" for pair in step.replace_pairs()]
+    if len(pairs) < 2:
+        return None
+    entries = ", ".join(f"{rgb_to_hex(src)}>{rgb_to_hex(dst)} {hits.get((src, dst), 0)}" for src, dst in pairs)
+    unused = sum(1 for pair in pairs if not hits.get(pair))
+    suffix = f"; {unused} unused" if unused else ""
+    return f"Replace map hits ({len(pairs)} pair(s){suffix}): {entries}"
+
+
+def format_step_counts(steps, counts):
+    return ", ".join(f"{OPERATION_LABELS[step.mode]} {count}" for step, count in zip(steps, counts))
+
+
+def prepare_output(out_path):
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+
+
+def temp_output_path(out_path):
+    """Create an empty, uniquely named .part file next to out_path and return its path.
+
+    Unique per call, so tasks writing the same output (overwrite) never share one.
+    """
+    prepare_output(out_path)
+    directory, name = os.path.split(out_path)
+    fd, temp_path = tempfile.mkstemp(prefix=name + ".", suffix=".part", dir=directory)
+    os.close(fd)
+    return temp_path
+
+
+@contextlib.contextmanager
+def atomic_output(out_path):
+    """Yield a .part path next to out_path that replaces it only when the block completes.
+
+    A canceled or killed run leaves the previous output or the new one, never a
+    truncated file. The rename also detaches an existing hardlinked output
+    (which may share its data with the input) instead of writing through it.
+    """
+    temp_path = temp_output_path(out_path)
+    try:
+        yield temp_path
+        os.replace(temp_path, out_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def write_output(out_path, buffer):
+    with atomic_output(out_path) as temp_path:
+        with open(temp_path, "wb") as handle:
+            handle.write(buffer.getbuffer())
+
+
+def encode_png(img, save_args):
+    started = time.perf_counter()
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG", **save_args)
+    return buffer, time.perf_counter() - started
+
+
+def save_png(img, out_path, save_args):
+    """Encode then write img; returns (encode_seconds, bytes_written)."""
+    buffer, seconds = encode_png(img, save_args)
+    write_output(out_path, buffer)
+    return seconds, buffer.getbuffer().nbytes
+
+
+def calibrate_png_level(images, target_mps):
+    """Highest zlib level (of AUTO_PNG_LEVELS) that encodes images at target_mps megapixels/s."""
+    pixels = sum(img.width * img.height for img in images)
+    if not pixels:
+        return 6
+    for level in AUTO_PNG_LEVELS:
+        started = time.perf_counter()
+        for img in images:
+            img.save(io.BytesIO(), format="PNG", compress_level=level)
+        elapsed = time.perf_counter() - started
+        if elapsed <= 0 or pixels / elapsed / 1e6 >= target_mps:
+            return level
+    return AUTO_PNG_LEVELS[-1]
+
+
+def resolve_encoder(encoder, images):
+    """Fix the level of an "auto" encoder from sample images; other profiles are returned as is."""
+    if encoder.profile != "auto" or encoder.level is not None:
+        return encoder
+    return replace(encoder, level=calibrate_png_level(images, encoder.target_mps))
+
+
+def sample_images(paths, output):
+    # Images over the strip threshold are left out: decoding one whole is what strips avoid.
+    images = []
+    for path in paths[:AUTO_PNG_SAMPLE]:
+        try:
+            if over_strip_threshold(png_header(path), output):
+                continue
+            with Image.open(path) as img:
+                images.append(img.convert("RGBA"))
+        except OSError:
+            continue
+    return images
+
+
+def format_encode_stats(encoder, files, seconds, size):
+    per_file = seconds / files * 1000 if files else 0
+    written = f"{size / (1024 * 1024):.1f} MB" if size >= 1024 * 1024 else f"{size / 1024:.1f} KB"
+    return f"PNG encode ({encoder.describe()}): {files} file(s), {written} written, {seconds:.2f}s encoding ({per_file:.1f} ms/file)"
+
+
+def reflink_file(in_path, out_path):
+    if fcntl is None:
+        raise OSError("reflink is not supported on this platform")
+    with open(in_path, "rb") as src, open(out_path, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    shutil.copystat(in_path, out_path)
+
+
+def place_file(in_path, out_path, strategy, save_args=None):
+    """Write in_path to out_path unchanged using the output strategy.
+
+    hardlink and reflink fall back to a copy when the file system refuses
+    (different drive, no clone support). Returns (encode_seconds, bytes).
+    """
+    if strategy == "re-encode":
+        with Image.open(in_path) as img:
+            return save_png(img, out_path, save_args or {})
+    size = os.stat(in_path).st_size
+    if strategy == "hardlink" and os.path.exists(out_path) and os.path.samefile(in_path, out_path):
+        # Linked by an earlier run; renaming a new link onto it would be a no-op.
+        return 0.0, size
+    if strategy in ("hardlink", "reflink"):
+        try:
+            with atomic_output(out_path) as temp_path:
+                if strategy == "hardlink":
+                    os.remove(temp_path)
+                    os.link(in_path, temp_path)
+                else:
+                    reflink_file(in_path, temp_path)
+            return 0.0, size
+        except OSError:
+            pass
+    with atomic_output(out_path) as temp_path:
+        shutil.copy2(in_path, temp_path)
+    return 0.0, size
+
+
+def pass_through_strategy(output):
+    return output.strategy if output.strategy != "re-encode" else "copy"
+
+
+def png_filter_rows(raw, prev):
+    """PNG-filter rows of RGBA bytes, picking per row the filter with the smallest sum of |signed bytes|.
+
+    raw is (rows, width * 4) uint8 and prev the unfiltered row above the first one.
+    Returns the scanlines (filter byte + data) ready for zlib.
+    """
+    x = raw.astype(np.int16)
+    b = np.empty_like(x)
+    b[0] = prev
+    b[1:] = x[:-1]
+    a = np.zeros_like(x)
+    a[:, 4:] = x[:, :-4]
+    c = np.zeros_like(x)
+    c[:, 4:] = b[:, :-4]
+    p = a + b - c
+    pa, pb, pc = np.abs(p - a), np.abs(p - b), np.abs(p - c)
+    paeth = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+    del p, pa, pb, pc
+    lines = np.empty((len(raw), raw.shape[1] + 1), dtype=np.uint8)
+    best = None
+    for kind, predictor in enumerate((0, a, b, (a + b) >> 1, paeth)):
+        filtered = (x - predictor).astype(np.uint8)
+        score = np.minimum(filtered, 256 - filtered.astype(np.int16)).sum(axis=1, dtype=np.int64)
+        if best is None:
+            chosen = np.ones(len(raw), dtype=bool)
+            best = score
+        else:
+            chosen = score < best
+            best = np.where(chosen, score, best)
+        lines[chosen, 0] = kind
+        lines[chosen, 1:] = filtered[chosen]
+    return lines
+
+
+class PngStripWriter:
+    """Writes an 8-bit RGBA PNG a strip of rows at a time, so only one strip is held in memory."""
+
+    def __init__(self, handle, width, height, level):
+        self.handle = handle
+        self.prev = np.zeros(width * 4, dtype=np.int16)
+        self.compressor = zlib.compressobj(level)
+        self.seconds = 0.0
+        handle.write(PNG_SIGNATURE)
+        self.chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+
+    def chunk(self, kind, data):
+        self.handle.write(struct.pack(">I", len(data)) + kind)
+        self.handle.write(data)
+        self.handle.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind)) & 0xFFFFFFFF))
+
+    def write(self, rgba):
+        started = time.perf_counter()
+        raw = rgba.reshape(len(rgba), -1)
+        data = self.compressor.compress(png_filter_rows(raw, self.prev).tobytes())
+        self.prev = raw[-1].astype(np.int16)
+        self.seconds += time.perf_counter() - started
+        if data:
+            self.chunk(b"IDAT", data)
+
+    def close(self):
+        started = time.perf_counter()
+        data = self.compressor.flush()
+        self.seconds += time.perf_counter() - started
+        if data:
+            self.chunk(b"IDAT", data)
+        self.chunk(b"IEND", b"")
+
+
+def png_level(save_args):
+    return 9 if save_args.get("optimize") else save_args.get("compress_level", 6)
+
+
+def png_header(source):
+    """(width, height, bit depth, color type, interlace) from the IHDR of a PNG path or file, None for other files.
+
+    A file object is left at its start.
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as handle:
+            head = handle.read(33)
+    else:
+        head = source.read(33)
+        source.seek(0)
+    if len(head) < 33 or not head.startswith(PNG_SIGNATURE) or head[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">IIBB2xB", head[16:29])
+
+
+def over_strip_threshold(header, output):
+    if np is None or header is None or not output.strip_threshold_mp:
+        return False
+    return header[0] * header[1] > output.strip_threshold_mp * 1_000_000
+
+
+def use_strips(header, steps, output):
+    """True when the PNG described by header is over the strip threshold and would be converted to RGBA."""
+    if not over_strip_threshold(header, output):
+        return False
+    # The palette shortcut never expands indexed images, so it stays cheap at any size.
+    return not (header[3] == 3 and len(steps) == 1 and steps[0].mode in ("transparent", "replace"))
+
+
+def open_image(source, header, output):
+    """Image.open, except that PNGs over the strip threshold skip Pillow's decompression-bomb limit.
+
+    Those are the inputs the strip path is for; opening them through the PNG
+    plugin directly leaves Image.MAX_IMAGE_PIXELS alone for everything else.
+    """
+    if over_strip_threshold(header, output):
+        return PngImagePlugin.PngImageFile(source)
+    return Image.open(source)
+
+
+class PngStripReader:
+    """Decodes an 8-bit, non-interlaced PNG a strip of rows at a time.
+
+    IDAT data is read and inflated only as far as the next strip needs, and
+    each strip is unfiltered by Pillow's PNG decoder with the last row of the
+    previous strip in front of it (unfiltered) as the row above. Memory is the
+    read buffer plus one strip. open() returns None for PNGs it cannot read
+    this way (interlaced, 16-bit, fewer than 8 bits per sample).
+    """
+
+    def __init__(self, handle, header):
+        self.handle = handle
+        self.width, self.height, _, color_type, _ = header
+        self.mode, samples = PNG_STRIP_MODES[color_type]
+        self.stride = self.width * samples
+        self.inflater = zlib.decompressobj()
+        self.prev = None
+        self.palette = None
+        self.transparency = None
+        handle.seek(len(PNG_SIGNATURE))
+        while True:
+            head = handle.read(8)
+            if len(head) < 8:
+                raise ValueError("PNG has no image data.")
+            length, kind = struct.unpack(">I4s", head)
+            if kind == b"IDAT":
+                self.left = length
+                break
+            data = handle.read(length)
+            handle.read(4)
+            if kind == b"PLTE":
+                self.palette = data
+            elif kind == b"tRNS":
+                self.transparency = data
+            elif kind == b"IEND":
+                raise ValueError("PNG has no image data.")
+        if self.mode == "P":
+            # Index -> RGBA, with tRNS alphas; entries past the palette are opaque black.
+            table = np.zeros((256, 4), dtype=np.uint8)
+            table[:, 3] = 255
+            colors = np.frombuffer(self.palette or b"", dtype=np.uint8)[:768].reshape(-1, 3)
+            table[:len(colors), :3] = colors
+            alphas = np.frombuffer(self.transparency or b"", dtype=np.uint8)[:256]
+            table[:len(alphas), 3] = alphas
+            self.table = table
+
+    @classmethod
+    def open(cls, handle):
+        header = png_header(handle)
+        if header is None or header[2] != 8 or header[4] or header[3] not in PNG_STRIP_MODES:
+            return None
+        return cls(handle, header)
+
+    def compressed(self):
+        # Next piece of the IDAT stream, b"" once it ends.
+        while not self.left:
+            self.handle.read(4)
+            head = self.handle.read(8)
+            if len(head) < 8:
+                return b""
+            self.left, kind = struct.unpack(">I4s", head)
+            if kind != b"IDAT":
+                return b""
+        data = self.handle.read(min(self.left, PNG_READ_CHUNK))
+        self.left = self.left - len(data) if data else 0
+        return data
+
+    def inflate(self, size):
+        parts = []
+        have = 0
+        while have < size:
+            data = self.inflater.unconsumed_tail or self.compressed()
+            if not data:
+                raise ValueError("PNG image data is truncated.")
+            part = self.inflater.decompress(data, size - have)
+            parts.append(part)
+            have += len(part)
+        return b"".join(parts)
+
+    def read(self, rows):
+        """The next rows of the image as an RGBA array."""
+        data = self.inflate(rows * (self.stride + 1))
+        if self.prev is not None:
+            data = b"\0" + self.prev + data
+        count = rows + (self.prev is not None)
+        img = Image.frombytes(self.mode, (self.width, count), zlib.compress(data, 0), "zip", self.mode, 0)
+        arr = np.asarray(img)[count - rows:]
+        self.prev = arr[-1].tobytes()
+        return self.to_rgba(arr)
+
+    def to_rgba(self, arr):
+        if self.mode == "RGBA":
+            return arr
+        if self.mode == "P":
+            return self.table[arr]
+        rgba = np.empty(arr.shape[:2] + (4,), dtype=np.uint8)
+        if self.mode == "LA":
+            rgba[..., :3] = arr[..., :1]
+            rgba[..., 3] = arr[..., 1]
+            return rgba
+        rgba[..., :3] = arr[..., None] if self.mode == "L" else arr
+        rgba[..., 3] = 255
+        # A tRNS chunk on gray/RGB images names one fully transparent color.
+        if self.mode == "L" and self.transparency and len(self.transparency) >= 2:
+            rgba[..., 3][arr == struct.unpack(">H", self.transparency[:2])[0]] = 0
+        elif self.mode == "RGB" and self.transparency and len(self.transparency) >= 6:
+            key = np.array(struct.unpack(">HHH", self.transparency[:6]))
+            rgba[..., 3][(arr == key).all(axis=-1)] = 0
+        return rgba
+
+
+def iter_rgba_strips(source, rows):
+    """Yield RGBA strips of about rows rows from a PNG path or file.
+
+    8-bit non-interlaced PNGs are decoded strip by strip (PngStripReader);
+    others are decoded whole by Pillow once and converted a strip at a time.
+    """
+    handle = open(source, "rb") if isinstance(source, str) else source
+    try:
+        reader = PngStripReader.open(handle)
+        if reader is not None:
+            for top in range(0, reader.height, rows):
+                yield Image.fromarray(reader.read(min(rows, reader.height - top)))
+            return
+        with PngImagePlugin.PngImageFile(handle) as img:
+            width, height = img.size
+            for top in range(0, height, rows):
+                yield img.crop((0, top, width, min(height, top + rows))).convert("RGBA")
+    finally:
+        if handle is not source:
+            handle.close()
+
+
+def process_image_strips(source, header, in_path, out_path, steps, dry_run, output, hits):
+    """Run the steps on horizontal strips of the PNG in source and encode each strip as it is done.
+
+    Decoding (see iter_rgba_strips), the RGBA conversion, color work and PNG
+    encoding only ever hold one strip of about STRIP_PIXELS. The output goes to
+    a .part file that replaces out_path when complete.
+    Returns (per-step counts, encode_seconds, bytes_written).
+    """
+    width, height = header[:2]
+    rows = max(1, STRIP_PIXELS // width)
+    counts = [0] * len(steps)
+    temp_path = None
+    handle = None
+    writer = None
+    if not dry_run:
+        temp_path = temp_output_path(out_path)
+        handle = open(temp_path, "wb")
+        writer = PngStripWriter(handle, width, height, png_level(output.encoder.save_args()))
+    try:
+        for strip in iter_rgba_strips(source, rows):
+            for idx, step in enumerate(steps):
+                strip, converted = process_pixels_numpy(strip, step.mode, step.target_rgbs, step.replace_pairs(), step.fill_rgb, step.fill_shadows, False, hits, step.tolerance)
+                counts[idx] += converted
+            if writer is not None:
+                writer.write(np.asarray(strip))
+        if writer is None:
+            return counts, 0.0, 0
+        writer.close()
+        handle.close()
+        if not any(counts) and output.pass_through:
+            os.remove(temp_path)
+            seconds, size = place_file(in_path, out_path, pass_through_strategy(output))
+            return counts, seconds, size
+        os.replace(temp_path, out_path)
+        return counts, writer.seconds, os.path.getsize(out_path)
+    except BaseException:
+        if handle is not None:
+            handle.close()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        raise
+
+
+def process_image(in_path, out_path, steps, dry_run, output=None, metrics=None):
+    """Returns (per-step converted counts, encode_seconds, bytes_written, replace hits).
+
+    metrics, if given, is filled with the decode/transform/write seconds, the
+    input size ("in_bytes") and the pixel count.
+    """
+    hits = {}
+    metrics = {} if metrics is None else metrics
+    output = output or OutputConfig()
+    started = time.perf_counter()
+    header = png_header(in_path)
+    metrics["in_bytes"] = os.path.getsize(in_path)
+    if use_strips(header, steps, output):
+        metrics["pixels"] = header[0] * header[1]
+        # Decode, transform and encode interleave strip by strip; all but encode counts as transform.
+        counts, seconds, size = process_image_strips(in_path, header, in_path, out_path, steps, dry_run, output, hits)
+        metrics["transform"] = time.perf_counter() - started - seconds
+        return counts, seconds, size, hits
+    with open_image(in_path, header, output) as img:
+        metrics["pixels"] = img.width * img.height
+        img.load()
+        decoded = time.perf_counter()
+        metrics["decode"] = decoded - started
+        if dry_run:
+            counts = count_steps(img, steps, hits)
+            metrics["transform"] = time.perf_counter() - decoded
+            return counts, 0.0, 0, hits
+        out_img, counts, save_args = transform_steps(img, steps, hits)
+        transformed = time.perf_counter()
+        metrics["transform"] = transformed - decoded
+        if out_img is None:
+            return counts, 0.0, 0, hits
+        if not any(counts) and output.pass_through:
+            seconds, size = place_file(in_path, out_path, pass_through_strategy(output))
+        else:
+            seconds, size = save_png(out_img, out_path, {**output.encoder.save_args(), **save_args})
+        metrics["write"] = time.perf_counter() - transformed - seconds
+    return counts, seconds, size, hits
+
+
+def resolve_task_steps(task, steps):
+    """Use a folder's custom colors for the key (transparent) steps; None if they do not parse."""
+    if task["folder_mode"] != "Custom colors" or not task["custom_colors"]:
+        return steps
+    if not any(step.mode == "transparent" for step in steps):
+        return steps
+    try:
+        custom_list = parse_hex_list(task["custom_colors"])
+    except ValueError:
+        return None
+    custom_rgbs = [hex_to_rgb(c) for c in custom_list]
+    return [replace(step, target_rgbs=custom_rgbs) if step.mode == "transparent" else step for step in steps]
+
+
+def run_task(task, colors, dry_run, output):
+    """Returns (action, per-step counts, encode_seconds, bytes_written, replace hits, metrics)."""
+    action = task["action"]
+    counts = []
+    seconds, size = 0.0, 0
+    hits = {}
+    metrics = {}
+
+    if action in SKIP_ACTIONS:
+        pass
+    elif task["folder_mode"] == "Rename only":
+        if not dry_run:
+            started = time.perf_counter()
+            seconds, size = place_file(task["in_path"], task["out_path"], output.strategy, output.encoder.save_args())
+            metrics["write"] = time.perf_counter() - started - seconds
+            metrics["in_bytes"] = os.path.getsize(task["in_path"])
+        action = "rename_only"
+    else:
+        steps = resolve_task_steps(task, colors.steps())
+        if steps is None:
+            action = "invalid_custom_colors"
+        else:
+            counts, seconds, size, hits = process_image(task["in_path"], task["out_path"], steps, dry_run, output, metrics)
+
+    return action, counts, seconds, size, hits, metrics
+
+
+def iter_pipeline_results(tasks, workers, stats, colors, dry_run, output, control=None):
+    color_steps = colors.steps()
+    encoder_args = output.encoder.save_args()
+    read_q = queue.Queue(maxsize=workers * PIPELINE_QUEUE_DEPTH)
+    write_q = queue.Queue(maxsize=workers * PIPELINE_QUEUE_DEPTH)
+    done_q = queue.Queue()
+    stop = threading.Event()
+    lock = threading.Lock()
+    stats["threads"] = {"read": PIPELINE_READERS, "transform": workers, "write": PIPELINE_WRITERS}
+    stats["busy"] = {"read": 0.0, "decode": 0.0, "transform": 0.0, "encode": 0.0, "write": 0.0}
+    next_read = enumerate(tasks)
+    feed = {"count": 0, "finished": False}
+
+    def add_busy(stage, started):
+        with lock:
+            stats["busy"][stage] += time.perf_counter() - started
+
+    def read_stage():
+        while not stop.is_set():
+            # A paused job waits here, outside the lock; a canceled one ends the feed.
+            canceled = control is not None and control.checkpoint()
+            with lock:
+                if feed["finished"]:
+                    return
+                try:
+                    item = None if canceled else next(next_read, None)
+                except Exception as exc:
+                    item = exc
+                if item is None or isinstance(item, Exception):
+                    feed["finished"] = True
+                    done_q.put((None, None, item if item is not None else feed["count"]))
+                    return
+                feed["count"] += 1
+            idx, task = item
+            try:
+                if task["action"] in SKIP_ACTIONS:
+                    done_q.put((idx, task, (task["action"], [], 0.0, 0, {}, {})))
+                elif task["folder_mode"] == "Rename only":
+                    if dry_run:
+                        done_q.put((idx, task, ("rename_only", [], 0.0, 0, {}, {})))
+                    else:
+                        write_q.put((idx, task, output.strategy, [], {}, {"in_bytes": os.path.getsize(task["in_path"])}))
+                else:
+                    steps = resolve_task_steps(task, color_steps)
+                    if steps is None:
+                        done_q.put((idx, task, ("invalid_custom_colors", [], 0.0, 0, {}, {})))
+                        continue
+                    started = time.perf_counter()
+                    with open(task["in_path"], "rb") as handle:
+                        data = handle.read()
+                    # Per file, reading the input counts towards decode.
+                    metrics = {"in_bytes": len(data), "decode": time.perf_counter() - started}
+                    add_busy("read", started)
+                    read_q.put((idx, task, steps, data, metrics))
+            except Exception as exc:
+                done_q.put((idx, task, exc))
+
+    def transform_stage():
+        while True:
+            item = read_q.get()
+            if item is None:
+                return
+            idx, task, steps, data, metrics = item
+            if stop.is_set():
+                continue
+            if control is not None and control.checkpoint():
+                done_q.put((idx, task, CANCELED_RESULT))
+                continue
+            try:
+                hits = {}
+                source = io.BytesIO(data)
+                header = png_header(source)
+                if use_strips(header, steps, output):
+                    # Decode, transform and encode interleave strip by strip here.
+                    metrics["pixels"] = header[0] * header[1]
+                    started = time.perf_counter()
+                    counts, seconds, size = process_image_strips(source, header, task["in_path"], task["out_path"], steps, dry_run, output, hits)
+                    add_busy("transform", started)
+                    metrics["transform"] = time.perf_counter() - started - seconds
+                    done_q.put((idx, task, (task["action"], counts, seconds, size, hits, metrics)))
+                    continue
+                img = open_image(source, header, output)
+                metrics["pixels"] = img.width * img.height
+                started = time.perf_counter()
+                img.load()
+                add_busy("decode", started)
+                metrics["decode"] += time.perf_counter() - started
+                started = time.perf_counter()
+                if dry_run:
+                    counts = count_steps(img, steps, hits)
+                    out_img = None
+                else:
+                    out_img, counts, save_args = transform_steps(img, steps, hits)
+                add_busy("transform", started)
+                metrics["transform"] = time.perf_counter() - started
+                if out_img is None:
+                    done_q.put((idx, task, (task["action"], counts, 0.0, 0, hits, metrics)))
+                elif not any(counts) and output.pass_through:
+                    write_q.put((idx, task, pass_through_strategy(output), counts, hits, metrics))
+                else:
+                    write_q.put((idx, task, (out_img, {**encoder_args, **save_args}), counts, hits, metrics))
+            except Exception as exc:
+                done_q.put((idx, task, exc))
+
+    def write_stage():
+        while True:
+            item = write_q.get()
+            if item is None:
+                return
+            idx, task, payload, counts, hits, metrics = item
+            if stop.is_set():
+                continue
+            if control is not None and control.checkpoint():
+                done_q.put((idx, task, CANCELED_RESULT))
+                continue
+            try:
+                if isinstance(payload, str):
+                    # Original bytes placed by output strategy (Rename only, or pass-through).
+                    started = time.perf_counter()
+                    seconds, size = place_file(task["in_path"], task["out_path"], payload, encoder_args)
+                    add_busy("write", started)
+                    metrics["write"] = time.perf_counter() - started - seconds
+                    action = "rename_only" if task["folder_mode"] == "Rename only" else task["action"]
+                    done_q.put((idx, task, (action, counts, seconds, size, hits, metrics)))
+                    continue
+                out_img, save_args = payload
+                buffer, seconds = encode_png(out_img, save_args)
+                with lock:
+                    stats["busy"]["encode"] += seconds
+                started = time.perf_counter()
+                write_output(task["out_path"], buffer)
+                add_busy("write", started)
+                metrics["write"] = time.perf_counter() - started
+                done_q.put((idx, task, (task["action"], counts, seconds, buffer.getbuffer().nbytes, hits, metrics)))
+            except Exception as exc:
+                done_q.put((idx, task, exc))
+
+    def start_threads(target, count):
+        threads = [threading.Thread(target=target, daemon=True) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def supervise():
+        for thread in readers:
+            thread.join()
+        for _ in transformers:
+            read_q.put(None)
+        for thread in transformers:
+            thread.join()
+        for _ in writers:
+            write_q.put(None)
+
+    readers = start_threads(read_stage, PIPELINE_READERS)
+    transformers = start_threads(transform_stage, workers)
+    writers = start_threads(write_stage, PIPELINE_WRITERS)
+    threading.Thread(target=supervise, daemon=True).start()
+
+    pending = {}
+    next_idx = 0
+    total = None
+    try:
+        while total is None or next_idx < total:
+            idx, task, result = done_q.get()
+            if idx is None:
+                if isinstance(result, Exception):
+                    raise result
+                total = result
+                continue
+            pending[idx] = (task, result)
+            while next_idx in pending:
+                task, result = pending.pop(next_idx)
+                if isinstance(result, Exception):
+                    raise result
+                yield task, result
+                next_idx += 1
+    finally:
+        stop.set()
+
+
+class RunMetrics:
+    """Per-stage seconds, input bytes and pixels summed over a run, and its slowest files."""
+
+    def __init__(self):
+        self.seconds = dict.fromkeys(METRIC_STAGES, 0.0)
+        self.in_bytes = 0
+        self.pixels = 0
+        self.files = 0
+        self.slowest = []
+
+    def add(self, rel_in, metrics, encode_seconds):
+        if not metrics:
+            return
+        stages = {stage: metrics.get(stage, 0.0) for stage in METRIC_STAGES}
+        stages["encode"] = encode_seconds
+        for stage, seconds in stages.items():
+            self.seconds[stage] += seconds
+        self.in_bytes += metrics.get("in_bytes", 0)
+        self.pixels += metrics.get("pixels", 0)
+        self.files += 1
+        item = (sum(stages.values()), rel_in, stages)
+        if len(self.slowest) < SLOWEST_FILES:
+            heapq.heappush(self.slowest, item)
+        else:
+            heapq.heappushpop(self.slowest, item)
+
+
+def format_throughput(run_metrics, elapsed, written_bytes):
+    if elapsed <= 0:
+        return "Throughput: n/a"
+    mb = 1024 * 1024
+    rates = [f"{run_metrics.in_bytes / mb / elapsed:.1f} MB/s read"]
+    if written_bytes:
+        rates.append(f"{written_bytes / mb / elapsed:.1f} MB/s written")
+    rates.append(f"{run_metrics.pixels / 1e6 / elapsed:.1f} MP/s")
+    stages = ", ".join(f"{stage} {run_metrics.seconds[stage]:.1f}s" for stage in METRIC_STAGES)
+    return f"Throughput: {run_metrics.files} file(s) in {elapsed:.2f}s, {', '.join(rates)} (summed over workers: {stages})"
+
+
+def format_slowest(run_metrics):
+    parts = []
+    for seconds, rel_in, stages in sorted(run_metrics.slowest, reverse=True):
+        split = ", ".join(f"{stage} {stages[stage] * 1000:.0f}" for stage in METRIC_STAGES)
+        parts.append(f"{rel_in} {seconds * 1000:.0f} ms ({split})")
+    return "Slowest files: " + "; ".join(parts)
+
+
+def format_pipeline_stats(stats, elapsed):
+    if elapsed <= 0:
+        return "Pipeline utilization: n/a"
+    threads = stats["threads"]
+    busy = stats["busy"]
+    stage_threads = {"read": threads["read"], "decode": threads["transform"], "transform": threads["transform"], "encode": threads["write"], "write": threads["write"]}
+    parts = []
+    for stage in ("read", "decode", "transform", "encode", "write"):
+        utilization = busy[stage] / (elapsed * stage_threads[stage]) * 100
+        parts.append(f"{stage} {utilization:.0f}% ({busy[stage]:.1f}s on {stage_threads[stage]} thread(s))")
+    return "Pipeline utilization: " + ", ".join(parts)
+
+
+def output_filename(name, matcher, keep_prefixes):
+    if matcher is None or keep_prefixes:
+        return name
+    match = matcher.match(name)
+    if match is None:
+        return name
+    info = classify_filename(name)
+    return info.base[match[1]:] + info.ext
+
+
+def output_prefix_folder(name, matcher):
+    if matcher is None:
+        return "needs_sorting"
+    match = matcher.match(name)
+    if match is None:
+        return "needs_sorting"
+    return match[0].lower()
+
+
+def extract_group_prefix(name):
+    return classify_filename(name).group
+
+
+def sprite_sort_key(name):
+    info = classify_filename(name)
+    base_upper = info.base.upper()
+    if info.frame is not None:
+        return (0, DIRECTION_ORDER.get(info.direction, 99), info.frame, base_upper)
+    if info.number is not None:
+        return (1, info.number, base_upper)
+    return (2, base_upper)
+
+
+def read_csv_header(path):
+    """First row of an existing CSV log, [] when it is empty, None when it is missing."""
+    try:
+        with open(path, "r", newline="", encoding="utf-8") as handle:
+            return next(csv.reader(handle), [])
+    except FileNotFoundError:
+        return None
+    except (OSError, UnicodeDecodeError, csv.Error):
+        return ["?"]
+
+
+def ensure_csv_header(path, timings=False):
+    """Path of a CSV log whose header matches this run's columns, created if needed.
+
+    Rows are appended to an existing log only when its header has the same
+    columns (a run with/without timings, or an older version, wrote different
+    ones); otherwise the log goes to the first name-N.csv that is new or matches.
+    """
+    columns = CSV_COLUMNS + CSV_TIMING_COLUMNS if timings else CSV_COLUMNS
+    base, ext = os.path.splitext(path)
+    candidate = path
+    number = 1
+    while True:
+        header = read_csv_header(candidate)
+        if header == columns:
+            return candidate
+        if not header:
+            break
+        number += 1
+        candidate = f"{base}-{number}{ext}"
+    os.makedirs(os.path.dirname(os.path.abspath(candidate)), exist_ok=True)
+    with open(candidate, "w", newline="", encoding="utf-8") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(columns)
+    return candidate
+
+
+def csv_timing_values(metrics):
+    if not metrics:
+        return [""] * len(CSV_STAGE_COLUMNS)
+    ms = [f"{metrics.get(stage, 0.0) * 1000:.1f}" for stage in ("decode", "transform", "write")]
+    return ms + [metrics.get("in_bytes", ""), metrics.get("pixels", "")]
+
+
+def detect_conflicts(tasks):
+    path_map = {}
+    for task in tasks:
+        if task["action"] == "skip_existing_file":
+            continue
+        path_map.setdefault(task["out_path"], []).append(task)
+    return {path: items for path, items in path_map.items() if len(items) > 1}
+
+
+class OutputListing:
+    """Names in each output folder, listed once per run with os.scandir.
+
+    Stands in for os.path.exists/isdir on output paths; add() keeps it in step
+    with the files the run writes. mtimes keeps each folder's mtime_ns as of its
+    listing (None when missing) so a routing plan can tell if it went stale, and
+    initial the names as first listed, before the run wrote anything there.
+    """
+
+    def __init__(self):
+        self.dirs = {}
+        self.initial = {}
+        self.mtimes = {}
+        self.lock = threading.Lock()
+
+    def entries(self, directory):
+        # {normcased name: is_dir} or None when the folder does not exist. Caller holds the lock.
+        if directory not in self.dirs:
+            try:
+                self.mtimes[directory] = os.stat(directory).st_mtime_ns
+                with os.scandir(directory) as listing:
+                    self.dirs[directory] = {os.path.normcase(entry.name): entry.is_dir() for entry in listing}
+            except (FileNotFoundError, NotADirectoryError):
+                self.mtimes[directory] = None
+                self.dirs[directory] = None
+            self.initial[directory] = None if self.dirs[directory] is None else frozenset(self.dirs[directory])
+        return self.dirs[directory]
+
+    def exists(self, path):
+        directory, name = os.path.split(path)
+        with self.lock:
+            entries = self.entries(directory)
+            return entries is not None and os.path.normcase(name) in entries
+
+    def existed(self, path):
+        """Whether path was there when its folder was first listed, ignoring outputs of this run."""
+        directory, name = os.path.split(path)
+        with self.lock:
+            self.entries(directory)
+            names = self.initial[directory]
+            return names is not None and os.path.normcase(name) in names
+
+    def isdir(self, path):
+        directory, name = os.path.split(path)
+        with self.lock:
+            entries = self.entries(directory)
+            return entries is not None and entries.get(os.path.normcase(name), False)
+
+    def add(self, path, is_dir=False):
+        with self.lock:
+            self.record(path, is_dir)
+
+    def record(self, path, is_dir):
+        directory, name = os.path.split(path)
+        if directory not in self.dirs:
+            return
+        if self.dirs[directory] is None:
+            self.dirs[directory] = {}
+            self.record(directory, True)
+        self.dirs[directory][os.path.normcase(name)] = is_dir
+
+
+def copy_suffix_path(path, used_paths, listing, previous=None):
+    """Next free "_copyN" name for path.
+
+    previous is where an earlier run wrote this input: when it is a "_copyN"
+    name of the same path that no task of this run claims, it is reused, so
+    reruns do not add a new copy each time.
+    """
+    base_root, ext = os.path.splitext(path)
+    if previous is not None and previous not in used_paths:
+        suffix = previous[len(base_root):-len(ext)] if ext else previous[len(base_root):]
+        if previous.startswith(base_root) and previous.endswith(ext) and re.fullmatch(r"_copy[1-9]\d*", suffix):
+            return previous
+    copy_index = 1
+    while True:
+        candidate = f"{base_root}_copy{copy_index}{ext}"
+        if candidate not in used_paths and not listing.exists(candidate):
+            return candidate
+        copy_index += 1
+
+
+def apply_copy_suffixes(tasks, conflicts, output_root, listing, previous_outputs=None):
+    previous_outputs = previous_outputs or {}
+    used_paths = {task["out_path"] for task in tasks}
+    for path, group in conflicts.items():
+        for task in group[1:]:
+            candidate = copy_suffix_path(path, used_paths, listing, previous_outputs.get(task["rel_in"]))
+            used_paths.add(candidate)
+            task["out_path"] = candidate
+            task["rel_out"] = os.path.relpath(candidate, output_root)
+
+
+def apply_overwrites(conflicts):
+    # The last task of each group is the one whose output would survive a serial
+    # run; the others are skipped so parallel workers never write the same file.
+    for group in conflicts.values():
+        for task in group[:-1]:
+            task["action"] = "overwritten"
+
+
+def iter_resolved_tasks(tasks, output_root, resolve_conflicts, state, listing, previous_outputs=None):
+    # Streaming counterpart of detect_conflicts/apply_copy_suffixes: a task is
+    # only held back when its out_path was already claimed by an earlier task.
+    # With "overwrite" it goes to state["deferred"], run in order once the rest is done.
+    previous_outputs = previous_outputs or {}
+    used_paths = set()
+    for task in tasks:
+        state["found"] += 1
+        if task["action"] != "skip_existing_file":
+            out_path = task["out_path"]
+            if out_path in used_paths:
+                if state["choice"] is None:
+                    state["choice"] = resolve_conflicts(1, 2) or "cancel"
+                if state["choice"] == "cancel":
+                    state["canceled"] = True
+                    return
+                if state["choice"] == "overwrite":
+                    state["deferred"].append(task)
+                    continue
+                if state["choice"] == "copy":
+                    out_path = copy_suffix_path(out_path, used_paths, listing, previous_outputs.get(task["rel_in"]))
+                    task["out_path"] = out_path
+                    task["rel_out"] = os.path.relpath(out_path, output_root)
+            used_paths.add(out_path)
+        yield task
+
+
+class JobControl:
+    """Cancel and pause requests for a running job, checked between tasks and pipeline stages.
+
+    Work already started runs to completion (outputs land through atomic_output);
+    work not started yet is dropped on cancel and held back while paused.
+    """
+
+    def __init__(self):
+        self.cancel_event = threading.Event()
+        self.resume_event = threading.Event()
+        self.resume_event.set()
+
+    def cancel(self):
+        self.cancel_event.set()
+        self.resume_event.set()
+
+    def pause(self):
+        if not self.cancel_event.is_set():
+            self.resume_event.clear()
+
+    def resume(self):
+        self.resume_event.set()
+
+    def is_canceled(self):
+        return self.cancel_event.is_set()
+
+    def is_paused(self):
+        return not self.resume_event.is_set()
+
+    def checkpoint(self):
+        """Wait while paused; True once the job should stop."""
+        self.resume_event.wait()
+        return self.cancel_event.is_set()
+
+
+CANCELED_RESULT = ("canceled", [], 0.0, 0, {}, {})
+
+
+def iter_deferred_results(state, task_func, control):
+    # Read lazily: state["deferred"] is complete once the streaming walk has ended.
+    for task in state["deferred"]:
+        if control is not None and control.checkpoint():
+            return
+        yield task, task_func(task)
+
+
+def iter_until_canceled(tasks, control):
+    for task in tasks:
+        if control.checkpoint():
+            return
+        yield task
+
+
+def ignore_interrupts():
+    # Pool workers share the console: Ctrl+C is handled by the parent as a cancel.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def run_task_chunk(func, tasks):
+    return [func(task) for task in tasks]
+
+
+def iter_pool_results(executor, func, tasks, window, chunksize=1, control=None):
+    # Only `window` chunks are in flight, so a paused or canceled job stops
+    # handing out work; chunks still queued when it is canceled never start.
+    pending = collections.deque()
+    tasks = iter(tasks)
+    while True:
+        chunk = list(itertools.islice(tasks, chunksize))
+        if not chunk:
+            break
+        pending.append((chunk, executor.submit(run_task_chunk, func, chunk)))
+        if len(pending) >= window:
+            chunk, future = pending.popleft()
+            yield from zip(chunk, future.result())
+    while pending:
+        if control is not None and control.is_canceled():
+            for _, future in pending:
+                future.cancel()
+        chunk, future = pending.popleft()
+        if future.cancelled():
+            yield from ((task, CANCELED_RESULT) for task in chunk)
+        else:
+            yield from zip(chunk, future.result())
+
+
+def routed_top_dirs(index, routing):
+    tops = {}
+    for top in index.subdirs(routing.input_root):
+        if routing.allowed_dirs is not None and top not in routing.allowed_dirs:
+            continue
+        if top in routing.exclude_folders:
+            continue
+        rule = routing.rules.get(top, {})
+        if rule.get("mode", "Process") == "Skip":
+            continue
+        tops[os.path.join(routing.input_root, top)] = rule
+    return tops
+
+
+def iter_tasks(routing, listing, stats=None):
+    input_root = routing.input_root
+    output_root = routing.output_root
+    matcher = build_prefix_matcher(routing.prefixes)
+    # Decided once per prefix, before any of its files is written, so folders
+    # created by this run (streaming) are not mistaken for existing ones.
+    existing_prefix_dirs = {}
+    with InputIndex(routing.index_path, routing.scan_threads) as index:
+        tops = routed_top_dirs(index, routing)
+        for top, root, _, files in index.walk_many(list(tops)):
+            rule = tops[top]
+            folder_mode = rule.get("mode", "Process")
+            custom_colors = rule.get("colors", "").strip()
+            for file in files:
+                if not file.lower().endswith(".png"):
+                    continue
+                if stats is not None:
+                    stats["scanned"] += 1
+                in_path = os.path.join(root, file)
+                prefix_folder = output_prefix_folder(file, matcher)
+                out_dir = output_root if not prefix_folder else os.path.join(output_root, prefix_folder)
+                if routing.skip_existing and prefix_folder:
+                    exists = existing_prefix_dirs.get(prefix_folder)
+                    if exists is None:
+                        exists = listing.isdir(out_dir)
+                        existing_prefix_dirs[prefix_folder] = exists
+                    if exists:
+                        if stats is not None:
+                            stats["skipped_prefixes"].add(prefix_folder)
+                        continue
+                out_name = output_filename(file, matcher, routing.keep_prefixes)
+                out_path = os.path.join(out_dir, out_name)
+                action = "process"
+                # Only files from before the run count: while streaming, an output
+                # written moments ago is a naming conflict, not an existing file.
+                if routing.skip_existing_files and listing.existed(out_path):
+                    action = "skip_existing_file"
+                yield {
+                    "in_path": in_path,
+                    "out_path": out_path,
+                    "rel_in": os.path.relpath(in_path, input_root),
+                    "rel_out": os.path.relpath(out_path, output_root),
+                    "folder_mode": folder_mode,
+                    "custom_colors": custom_colors,
+                    "action": action,
+                }
+        if stats is not None:
+            stats["folders"] = dict(index.mtimes)
+
+
+def discover_tasks(routing, listing, stats=None):
+    return list(iter_tasks(routing, listing, stats))
+
+
+def routing_key(routing):
+    key = [
+        os.path.abspath(routing.input_root),
+        os.path.abspath(routing.output_root),
+        list(routing.prefixes),
+        routing.keep_prefixes,
+        routing.rules,
+        sorted(routing.allowed_dirs) if routing.allowed_dirs is not None else None,
+        routing.skip_existing,
+        routing.skip_existing_files,
+        sorted(routing.exclude_folders),
+    ]
+    return hashlib.blake2b(json.dumps(key, sort_keys=True).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def plan_relpath(path, root):
+    return os.path.relpath(path, root).replace(os.sep, "/")
+
+
+def plan_mtimes(mtimes, root):
+    root = os.path.normpath(os.path.abspath(root))
+    return {plan_relpath(os.path.abspath(path), root): mtime for path, mtime in mtimes.items()}
+
+
+def build_plan(routing, stats):
+    """Route the input tree once; returns (RoutingPlan, tasks).
+
+    The plan records the mtime of every input folder walked and every output
+    folder checked, which is enough to tell later whether routing would change.
+    """
+    listing = OutputListing()
+    tasks = discover_tasks(routing, listing, stats)
+    entries = [
+        {
+            "rel_in": task["rel_in"].replace(os.sep, "/"),
+            "rel_out": task["rel_out"].replace(os.sep, "/"),
+            "folder_mode": task["folder_mode"],
+            "custom_colors": task["custom_colors"],
+            "action": task["action"],
+        }
+        for task in tasks
+    ]
+    plan = RoutingPlan(
+        routing_key(routing),
+        entries,
+        plan_mtimes(stats["folders"], routing.input_root),
+        plan_mtimes(listing.mtimes, routing.output_root),
+        time.time(),
+    )
+    return plan, tasks
+
+
+def plan_is_current(plan, routing):
+    if plan.key != routing_key(routing):
+        return False
+    for roots, mtimes in ((routing.input_root, plan.folders), (routing.output_root, plan.outputs)):
+        for rel, mtime in mtimes.items():
+            try:
+                current = os.stat(os.path.join(roots, rel.replace("/", os.sep))).st_mtime_ns
+            except FileNotFoundError:
+                current = None
+            except OSError:
+                return False
+            if current != mtime:
+                return False
+    return True
+
+
+def plan_path_is_inside(rel_path):
+    """True when a plan's relative path stays below its root: not absolute, no drive, no ".." escape."""
+    if not isinstance(rel_path, str) or not rel_path.strip():
+        return False
+    rel_path = rel_path.replace("/", os.sep)
+    if os.path.isabs(rel_path) or os.path.splitdrive(rel_path)[0]:
+        return False
+    norm = os.path.normpath(rel_path)
+    return norm not in (os.curdir, os.pardir) and not norm.startswith(os.pardir + os.sep)
+
+
+def plan_tasks(plan, routing):
+    tasks = []
+    for entry in plan.tasks:
+        rel_in = entry["rel_in"].replace("/", os.sep)
+        rel_out = entry["rel_out"].replace("/", os.sep)
+        tasks.append({
+            "in_path": os.path.join(routing.input_root, rel_in),
+            "out_path": os.path.join(routing.output_root, rel_out),
+            "rel_in": rel_in,
+            "rel_out": rel_out,
+            "folder_mode": entry["folder_mode"],
+            "custom_colors": entry["custom_colors"],
+            "action": entry["action"],
+        })
+    return tasks
+
+
+def tasks_from_plan(plan, routing, emit):
+    """Tasks for a run from job.plan, or None when the tree has to be scanned again.
+
+    A plan from Preview is only reused while its settings and folders are
+    unchanged. A plan loaded from a file was reviewed, so it runs as saved
+    against the current input/output folders; inputs that are gone are skipped,
+    and so are entries whose paths would leave those folders.
+    """
+    if plan.source:
+        valid = []
+        invalid = []
+        for entry in plan.tasks:
+            inside = plan_path_is_inside(entry["rel_in"]) and plan_path_is_inside(entry["rel_out"])
+            (valid if inside else invalid).append(entry)
+        if invalid:
+            plan = replace(plan, tasks=valid)
+            emit(("log", f"Invalid plan entries outside the input/output folder (skipped): {len(invalid)}"))
+            for entry in invalid[:5]:
+                emit(("log", f"  invalid: {entry['rel_in']!r} -> {entry['rel_out']!r}"))
+        tasks = plan_tasks(plan, routing)
+        present = [task for task in tasks if os.path.isfile(task["in_path"])]
+        emit(("log", f"Running saved plan {os.path.basename(plan.source)}: {len(present)} file(s)."))
+        if len(present) < len(tasks):
+            emit(("log", f"Missing inputs (skipped): {len(tasks) - len(present)}"))
+        return present
+    if not plan_is_current(plan, routing):
+        emit(("log", "Settings or folders changed since Preview Routing; scanning again."))
+        return None
+    emit(("log", f"Using the routing from Preview Routing: {len(plan.tasks)} file(s)."))
+    return plan_tasks(plan, routing)
+
+
+def save_plan(plan, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    data = {
+        "version": PLAN_VERSION,
+        "key": plan.key,
+        "created": plan.created,
+        "folders": plan.folders,
+        "outputs": plan.outputs,
+        "tasks": plan.tasks,
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        json.dump(data, handle, indent=1)
+    os.replace(tmp_path, path)
+
+
+def load_plan(path):
+    with open(path, "r", encoding="utf-8") as handle:
+        data = json.load(handle)
+    if not isinstance(data, dict) or data.get("version") != PLAN_VERSION or not isinstance(data.get("tasks"), list):
+        raise ValueError("Not a ChromaForge routing plan.")
+    for entry in data["tasks"]:
+        if not isinstance(entry, dict) or any(name not in entry for name in PLAN_TASK_FIELDS):
+            raise ValueError("Routing plan has an invalid task entry.")
+    return RoutingPlan(
+        data.get("key", ""),
+        data["tasks"],
+        data.get("folders", {}),
+        data.get("outputs", {}),
+        data.get("created", 0.0),
+        path,
+    )
+
+
+def load_manifest(output_root):
+    try:
+        with open(os.path.join(output_root, MANIFEST_NAME), "r", encoding="utf-8") as handle:
+            data = json.load(handle)
+    except (OSError, ValueError):
+        return {}
+    entries = data.get("files") if isinstance(data, dict) else None
+    return entries if isinstance(entries, dict) else {}
+
+
+def save_manifest(output_root, entries):
+    os.makedirs(output_root, exist_ok=True)
+    path = os.path.join(output_root, MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        json.dump({"version": 1, "files": entries}, handle, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def load_journal(output_root):
+    """Tasks finished by earlier runs into output_root: {rel_in: (rel_out, settings hash, manifest entry)}."""
+    done = {}
+    try:
+        with open(os.path.join(output_root, JOURNAL_NAME), "r", encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # The tail of a batch cut off by a crash.
+                    continue
+                if isinstance(entry, list) and len(entry) == 4:
+                    done[entry[0]] = tuple(entry[1:])
+    except OSError:
+        pass
+    return done
+
+
+def fsync_path(path):
+    """Flush a file's data, or (POSIX) a folder's entries, to disk; missing paths are ignored.
+
+    Windows cannot open folders this way and only flushes files opened for writing.
+    """
+    try:
+        fd = os.open(path, os.O_RDWR if os.name == "nt" else os.O_RDONLY)
+    except (FileNotFoundError, PermissionError, IsADirectoryError):
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class RunJournal:
+    """Append-only record of finished tasks, written and fsynced in batches.
+
+    A task is added only after its output has been renamed into place, and the
+    outputs written for a batch (and their folders) are fsynced before its
+    records are, so after a crash every journaled output is complete on disk;
+    at most the last unflushed batch is done again. A resumed run appends to
+    the same file.
+    """
+
+    def __init__(self, output_root, resume):
+        os.makedirs(output_root, exist_ok=True)
+        self.output_root = output_root
+        self.handle = open(os.path.join(output_root, JOURNAL_NAME), "a" if resume else "w", encoding="utf-8")
+        self.pending = [json.dumps({"started": time.time(), "resume": resume})]
+        self.written = []
+        self.last_flush = time.monotonic()
+
+    def add(self, rel_in, rel_out, settings_hash, manifest_entry=None, written=False):
+        """written: the output was written by this run (not an earlier one), so it is fsynced first."""
+        self.pending.append(json.dumps([rel_in, rel_out, settings_hash, manifest_entry]))
+        if written:
+            self.written.append(os.path.join(self.output_root, rel_out))
+        if len(self.pending) >= JOURNAL_BATCH or time.monotonic() - self.last_flush >= JOURNAL_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if self.written:
+            for path in self.written:
+                fsync_path(path)
+            # The output root too: it holds the entries of prefix folders this run created.
+            for directory in sorted({os.path.dirname(path) for path in self.written} | {self.output_root}):
+                fsync_path(directory)
+            self.written = []
+        if self.pending:
+            self.handle.write("\n".join(self.pending) + "\n")
+            self.pending = []
+            self.handle.flush()
+            os.fsync(self.handle.fileno())
+        self.last_flush = time.monotonic()
+
+    def close(self, finished):
+        if finished:
+            self.pending.append(json.dumps({"finished": time.time()}))
+        self.flush()
+        self.handle.close()
+
+
+def mark_journaled(task, journal, colors, manifest):
+    """Skip a task the journal lists with the same output and settings, without looking at its output."""
+    if task["action"] != "process":
+        return task
+    entry = journal.get(task["rel_in"])
+    if entry is None or entry[0] != task["rel_out"]:
+        return task
+    task["settings_hash"] = task_settings_hash(task, colors)
+    if entry[1] != task["settings_hash"]:
+        return task
+    task["action"] = "journaled"
+    if manifest is not None and entry[2] is not None:
+        manifest[task["rel_in"]] = entry[2]
+    return task
+
+
+def file_hash(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def task_color_key(task, colors):
+    """The settings that decide a task's output pixels: everything but where it is written."""
+    if task["folder_mode"] == "Rename only":
+        return ["Rename only"]
+    base_steps = colors.steps()
+    steps = resolve_task_steps(task, base_steps)
+    if len(base_steps) == 1:
+        step = base_steps[0]
+        active_colors = steps[0].target_rgbs if steps is not None else None
+        key = [task["folder_mode"], step.mode, active_colors, step.replace_pair, step.fill_rgb, step.fill_shadows]
+        if step.replace_map:
+            key.append(step.replace_map)
+        if step.tolerance:
+            key.append(["tolerance", step.tolerance])
+        return key
+    chain = None if steps is None else [[step.mode, step.target_rgbs, list(step.replace_pairs()), step.fill_rgb, step.fill_shadows, step.tolerance] for step in steps]
+    return [task["folder_mode"], "operations", chain]
+
+
+def task_settings_hash(task, colors):
+    # Where the output goes is checked against the recorded "out" instead, so a
+    # "_copyN" name picked for a conflict does not count as a settings change.
+    key = task_color_key(task, colors)
+    return hashlib.blake2b(json.dumps(key).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def mark_duplicates(tasks, colors, sizes=None):
+    """Tag process tasks whose input bytes and color settings match an earlier task.
+
+    The first task of each group keeps action "process" and a "dedupe_key"; later
+    ones become "duplicate" with the same key and "duplicate_of" (the first
+    output). Only inputs whose size occurs more than once in sizes are hashed;
+    without sizes (streaming) every input is.
+    """
+    seen = {}
+    for task in tasks:
+        if task["action"] == "process" and task["folder_mode"] != "Rename only":
+            if sizes is None or sizes[os.path.getsize(task["in_path"])] > 1:
+                task["content_hash"] = file_hash(task["in_path"])
+                key = task["content_hash"] + json.dumps(task_color_key(task, colors))
+                task["dedupe_key"] = key
+                first = seen.setdefault(key, task["rel_out"])
+                if first != task["rel_out"]:
+                    task["action"] = "duplicate"
+                    task["duplicate_of"] = first
+        yield task
+
+
+def input_sizes(tasks):
+    return collections.Counter(
+        os.path.getsize(task["in_path"]) for task in tasks if task["action"] == "process" and task["folder_mode"] != "Rename only"
+    )
+
+
+def place_duplicate(task, primaries, dry_run, output):
+    """Result for a duplicate task: the first copy's result, written by copy or link of its output.
+
+    A duplicate of a canceled first copy is reported as canceled too.
+    """
+    action, counts, hits, out_path = primaries[task["dedupe_key"]]
+    if action != "process":
+        return action, counts, 0.0, 0, {}, {}
+    if dry_run:
+        return "duplicate", counts, 0.0, 0, hits, {}
+    started = time.perf_counter()
+    seconds, size = place_file(out_path, task["out_path"], pass_through_strategy(output))
+    return "duplicate", counts, seconds, size, hits, {"write": time.perf_counter() - started}
+
+
+def mark_unchanged(task, entries, colors, listing):
+    if task["action"] != "process":
+        return task
+    task["settings_hash"] = task_settings_hash(task, colors)
+    entry = entries.get(task["rel_in"])
+    if entry is None or entry.get("settings") != task["settings_hash"] or entry.get("out") != task["rel_out"]:
+        return task
+    if not listing.exists(task["out_path"]):
+        return task
+    stat = os.stat(task["in_path"])
+    if entry.get("size") != stat.st_size:
+        return task
+    if entry.get("mtime") != stat.st_mtime_ns:
+        # Touched but possibly identical: fall back to the content hash.
+        if entry.get("hash") != file_hash(task["in_path"]):
+            return task
+        entry["mtime"] = stat.st_mtime_ns
+    task["action"] = "unchanged"
+    return task
+
+
+def manifest_entry(task):
+    stat = os.stat(task["in_path"])
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "hash": task.get("content_hash") or file_hash(task["in_path"]),
+        "settings": task["settings_hash"],
+        "out": task["rel_out"],
+    }
+
+
+def run_batch(job, emit, resolve_conflicts, control=None):
+    routing = job.routing
+    state = {"found": 0, "choice": None, "canceled": False, "deferred": []}
+    listing = OutputListing()
+    manifest = load_manifest(routing.output_root) if job.incremental else None
+    journaled = load_journal(routing.output_root) if job.resume else {}
+    # Where earlier runs wrote each input, so a conflict gets the same "_copyN" name again.
+    previous_outputs = {rel_in: os.path.join(routing.output_root, entry[0]) for rel_in, entry in journaled.items()}
+    if manifest:
+        previous_outputs.update(
+            (rel_in, os.path.join(routing.output_root, entry["out"]))
+            for rel_in, entry in manifest.items()
+            if isinstance(entry, dict) and entry.get("out")
+        )
+    tasks = tasks_from_plan(job.plan, routing, emit) if job.plan is not None else None
+    # A usable plan is already complete, so there is nothing to stream.
+    streaming = job.streaming and tasks is None
+    if streaming:
+        tasks = iter_resolved_tasks(
+            iter_tasks(routing, listing), routing.output_root, resolve_conflicts, state, listing, previous_outputs
+        )
+    else:
+        if tasks is None:
+            tasks = discover_tasks(routing, listing)
+        state["found"] = len(tasks)
+        if not tasks:
+            emit(("log", "No files to process."))
+            emit(("status", "Done"))
+            emit(("done", 0, 0, 0))
+            return
+
+        conflicts = detect_conflicts(tasks)
+        if conflicts:
+            conflict_files = sum(len(items) for items in conflicts.values())
+            choice = resolve_conflicts(len(conflicts), conflict_files)
+            if choice == "cancel" or choice is None:
+                emit(("log", "Canceled due to naming conflicts."))
+                emit(("status", "Canceled"))
+                emit(("done", 0, 0, 0))
+                return
+            if choice == "copy":
+                apply_copy_suffixes(tasks, conflicts, routing.output_root, listing, previous_outputs)
+            else:
+                apply_overwrites(conflicts)
+
+    if job.resume:
+        if not journaled:
+            emit(("log", "No earlier run to resume in the output folder; processing everything."))
+        elif streaming:
+            tasks = (mark_journaled(task, journaled, job.colors, manifest) for task in tasks)
+        else:
+            tasks = [mark_journaled(task, journaled, job.colors, manifest) for task in tasks]
+
+    if manifest is not None:
+        if streaming:
+            tasks = (mark_unchanged(task, manifest, job.colors, listing) for task in tasks)
+        else:
+            tasks = [mark_unchanged(task, manifest, job.colors, listing) for task in tasks]
+
+    if job.dedupe:
+        if streaming:
+            tasks = mark_duplicates(tasks, job.colors)
+        else:
+            tasks = list(mark_duplicates(tasks, job.colors, input_sizes(tasks)))
+
+    color_steps = job.colors.steps()
+    chained = len(color_steps) > 1
+    output = job.output
+    if output.encoder.profile == "auto" and output.encoder.level is None and not job.dry_run:
+        if streaming:
+            head = list(itertools.islice(tasks, AUTO_PNG_SAMPLE))
+            tasks = itertools.chain(head, tasks)
+        else:
+            head = tasks
+        sample = sample_images([task["in_path"] for task in head if task["action"] == "process"], output)
+        output = replace(output, encoder=resolve_encoder(output.encoder, sample))
+        emit(("log", f"PNG profile auto: zlib level {output.encoder.level} (calibrated on {len(sample)} file(s))."))
+
+    journal = RunJournal(routing.output_root, job.resume) if not job.dry_run else None
+    finished = False
+
+    if job.csv_enabled:
+        csv_path = ensure_csv_header(job.csv_path, job.csv_timings)
+        if csv_path != job.csv_path:
+            emit(("log", f"CSV log {job.csv_path} has different columns; writing to {csv_path} instead."))
+        csv_handle = open(csv_path, "a", newline="", encoding="utf-8")
+        csv_writer = csv.writer(csv_handle)
+    else:
+        csv_handle = None
+        csv_writer = None
+
+    start = time.time()
+    processed = 0
+    total_converted = 0
+    logged_files = 0
+    unchanged = 0
+    encoded_files = 0
+    encode_seconds = 0.0
+    written_bytes = 0
+    replace_hits = {}
+    primaries = {}
+    duplicates = 0
+    resumed = 0
+    overwritten = 0
+    run_metrics = RunMetrics()
+    last_progress = (start, 0)
+    file_seconds = None
+
+    if streaming:
+        pool_size = min(max(1, job.workers), MAX_POOL_WORKERS)
+    else:
+        pool_size = min(max(1, job.workers), state["found"], MAX_POOL_WORKERS)
+    task_func = functools.partial(run_task, colors=job.colors, dry_run=job.dry_run, output=output)
+    executor = None
+    pipeline_stats = None
+    if job.pipeline:
+        pipeline_stats = {}
+        results = iter_pipeline_results(tasks, pool_size, pipeline_stats, job.colors, job.dry_run, output, control)
+    else:
+        if control is not None:
+            tasks = iter_until_canceled(tasks, control)
+        if pool_size > 1:
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=pool_size, initializer=ignore_interrupts)
+            # Executor.map would submit every task up front (and drain a streaming
+            # discovery) before yielding anything, leaving nothing to pause or cancel.
+            # Small chunks keep what is still in flight after a cancel short.
+            chunksize = 1 if streaming else max(1, min(32, state["found"] // (pool_size * 16)))
+            results = iter_pool_results(executor, task_func, tasks, pool_size * 4, chunksize, control)
+        else:
+            results = ((task, task_func(task)) for task in tasks)
+    if streaming:
+        # Later writers of an overwritten name, after every earlier task has finished.
+        results = itertools.chain(results, iter_deferred_results(state, task_func, control))
+
+    try:
+        for task, (action, counts, seconds, size, hits, metrics) in results:
+            if task["action"] != "duplicate":
+                if "dedupe_key" in task:
+                    # Recorded even when canceled: its duplicates skip the transform
+                    # stage and can still arrive after it was dropped.
+                    primaries[task["dedupe_key"]] = (action, counts, hits, task["out_path"])
+            elif action == "duplicate":
+                # Results arrive in task order, so the first copy is already written.
+                action, counts, seconds, size, hits, metrics = place_duplicate(task, primaries, job.dry_run, output)
+                if action != "canceled":
+                    duplicates += 1
+            if action == "canceled":
+                # Dropped before it started (or its first copy was): nothing was written for it.
+                continue
+            converted = sum(counts)
+            for pair, count in hits.items():
+                replace_hits[pair] = replace_hits.get(pair, 0) + count
+            per_operation = format_step_counts(color_steps, counts) if chained and counts else ""
+            if converted > 0:
+                logged_files += 1
+                detail = f" ({per_operation})" if per_operation else ""
+                if action == "duplicate":
+                    detail += f" | duplicate of {task['duplicate_of']}"
+                emit(("log", f"{task['rel_in']} -> {task['rel_out']} | converted: {converted}{detail}"))
+
+            run_metrics.add(task["rel_in"], metrics, seconds)
+            if csv_writer is not None:
+                row = [task["rel_in"], task["rel_out"], action, converted]
+                if job.csv_timings:
+                    duplicate_of = task["duplicate_of"] if action == "duplicate" else ""
+                    row += [f"{seconds * 1000:.1f}", size, per_operation, duplicate_of] + csv_timing_values(metrics)
+                csv_writer.writerow(row)
+
+            if action == "unchanged":
+                unchanged += 1
+            elif action == "journaled":
+                resumed += 1
+            elif action == "overwritten":
+                overwritten += 1
+            elif not job.dry_run and action in ("process", "rename_only", "duplicate"):
+                listing.add(task["out_path"])
+                if seconds > 0 and action != "duplicate":
+                    encoded_files += 1
+                    encode_seconds += seconds
+                written_bytes += size
+                if manifest is not None:
+                    manifest[task["rel_in"]] = manifest_entry(task)
+            if journal is not None and action in JOURNAL_ACTIONS:
+                settings_hash = task.get("settings_hash") or task_settings_hash(task, job.colors)
+                journal.add(
+                    task["rel_in"], task["rel_out"], settings_hash,
+                    manifest.get(task["rel_in"]) if manifest is not None else None,
+                    action in ("process", "rename_only", "duplicate"),
+                )
+
+            total_converted += converted
+            processed += 1
+
+            # While streaming, the total grows until the walk ends, so the ETA is a lower bound.
+            total = state["found"]
+            if processed % 10 == 0 or (processed == total and not streaming):
+                # Smoothed seconds per file: follows the current pace (skipped files, a
+                # slow folder, a pause) instead of the average since the start.
+                now = time.time()
+                recent = (now - last_progress[0]) / (processed - last_progress[1])
+                file_seconds = recent if file_seconds is None else ETA_SMOOTHING * recent + (1 - ETA_SMOOTHING) * file_seconds
+                last_progress = (now, processed)
+                emit(("progress", processed, total, file_seconds * (total - processed)))
+        finished = not state["canceled"] and not (control is not None and control.is_canceled())
+    finally:
+        if journal is not None:
+            journal.close(finished)
+        if executor is not None:
+            executor.shutdown()
+        if csv_handle is not None:
+            csv_handle.close()
+        if manifest is not None and not job.dry_run:
+            save_manifest(routing.output_root, manifest)
+
+    if state["canceled"]:
+        emit(("log", f"Canceled due to naming conflicts after {processed} file(s)."))
+        emit(("status", "Canceled"))
+        emit(("done", processed, logged_files, total_converted))
+        return
+    if control is not None and control.is_canceled():
+        if job.dry_run:
+            emit(("log", f"Canceled after {processed} file(s)."))
+        else:
+            emit(("log", f"Canceled after {processed} file(s); their outputs are complete and journaled, so Resume Last Run continues from here."))
+        emit(("status", "Canceled"))
+        emit(("done", processed, logged_files, total_converted))
+        return
+    if processed == 0:
+        emit(("log", "No files to process."))
+        emit(("status", "Done"))
+        emit(("done", 0, 0, 0))
+        return
+    if streaming and processed % 10:
+        emit(("progress", processed, processed, 0))
+    if unchanged:
+        emit(("log", f"Unchanged since last run (skipped): {unchanged}"))
+    if resumed:
+        emit(("log", f"Already done by the interrupted run (skipped): {resumed}"))
+    if overwritten:
+        emit(("log", f"Overwritten by a later input with the same output name (skipped): {overwritten}"))
+    if duplicates:
+        how = "counted once" if job.dry_run else f"processed once, other outputs by {pass_through_strategy(output)}"
+        emit(("log", f"Duplicate inputs ({how}): {duplicates}"))
+    hits_line = format_replace_hits(color_steps, replace_hits)
+    if hits_line:
+        emit(("log", hits_line))
+    if written_bytes:
+        emit(("log", format_encode_stats(output.encoder, encoded_files, encode_seconds, written_bytes)))
+    if run_metrics.files:
+        emit(("log", format_throughput(run_metrics, time.time() - start, written_bytes)))
+        emit(("log", format_slowest(run_metrics)))
+    if pipeline_stats is not None:
+        emit(("log", format_pipeline_stats(pipeline_stats, time.time() - start)))
+    emit(("status", "Done"))
+    emit(("done", processed, logged_files, total_converted))
+
+
+def run_prefix_scan(job, emit, cancel=None):
+    try:
+        counts = {}
+        scanned = 0
+        last_emit = 0.0
+        with InputIndex(job.index_path, job.scan_threads) as index:
+            tops = [
+                os.path.join(job.input_root, top) for top in index.subdirs(job.input_root)
+                if (job.allowed_dirs is None or top in job.allowed_dirs) and top not in job.exclude_folders
+            ]
+            done = 0
+            current_top = None
+            for top, root, _, files in index.walk_many(tops):
+                if cancel is not None and cancel.is_set():
+                    emit(("prefix_done", counts, scanned, True))
+                    return
+                if top != current_top:
+                    done += current_top is not None
+                    current_top = top
+                for file in files:
+                    if not file.lower().endswith(".png"):
+                        continue
+                    scanned += 1
+                    name = classify_filename(file).prefix
+                    if name is not None:
+                        counts[name] = counts.get(name, 0) + 1
+                now = time.monotonic()
+                if now - last_emit >= PREFIX_SCAN_INTERVAL:
+                    last_emit = now
+                    emit(("prefix_progress", dict(counts), scanned, done, len(tops)))
+        emit(("prefix_done", counts, scanned, False))
+    except Exception as exc:
+        emit(("prefix_error", str(exc)))
+
+
+def run_preview(job, emit):
+    routing = job.routing
+    try:
+        counts = {}
+        pixel_counts = {}
+        skipped_existing_files = 0
+        stats = {"scanned": 0, "skipped_prefixes": set()}
+        plan, tasks = build_plan(routing, stats)
+        total_scanned = stats["scanned"]
+        skipped_prefixes = stats["skipped_prefixes"]
+
+        for task in tasks:
+            if task["action"] == "skip_existing_file":
+                skipped_existing_files += 1
+                continue
+            prefix_folder = os.path.dirname(task["rel_out"])
+            counts[prefix_folder] = counts.get(prefix_folder, 0) + 1
+            if job.colors is not None and task["folder_mode"] != "Rename only":
+                steps = resolve_task_steps(task, job.colors.steps())
+                if steps is None:
+                    continue
+                pixels = sum(count_image_steps(task["in_path"], steps, job.output))
+                pixel_counts[prefix_folder] = pixel_counts.get(prefix_folder, 0) + pixels
+
+        lines = [f"Total PNGs scanned: {total_scanned}"]
+        if counts:
+            lines.append("")
+            lines.append("Routed by prefix:")
+            sorted_items = sorted(counts.items(), key=lambda item: (item[0] != "needs_sorting", item[0]))
+            for name, count in sorted_items:
+                if job.colors is not None:
+                    lines.append(f"- {name}: {count} (pixels that would change: {pixel_counts.get(name, 0)})")
+                else:
+                    lines.append(f"- {name}: {count}")
+        else:
+            lines.append("No files matched the current filters.")
+
+        if skipped_prefixes:
+            lines.append("")
+            skipped_list = ", ".join(sorted(skipped_prefixes))
+            lines.append(f"Skipped (existing prefix folders): {skipped_list}")
+        if skipped_existing_files:
+            lines.append(f"Skipped (existing files): {skipped_existing_files}")
+
+        emit(("preview", "\n".join(lines), plan))
+    except Exception as exc:
+        emit(("preview_error", str(exc)))
+
+
+def run_sprite_sheets(job, emit, control=None):
+    try:
+        sheet_count = 0
+        folder_count = 0
+        canceled = False
+        encoder = job.encoder
+        encode_seconds = 0.0
+        written_bytes = 0
+        with InputIndex(job.index_path, job.scan_threads) as index:
+            for root, dirs, files in index.walk(job.input_root):
+                if control is not None and control.checkpoint():
+                    canceled = True
+                    break
+                dirs[:] = [d for d in dirs if d not in ("sprite_sheets", "tilemaps")]
+                folder_name = os.path.basename(root)
+                if folder_name in job.exclude_folders:
+                    dirs[:] = []
+                    continue
+
+                png_files = [f for f in files if f.lower().endswith(".png")]
+                if not png_files:
+                    continue
+                folder_count += 1
+                groups = {}
+                for file in png_files:
+                    prefix = extract_group_prefix(file)
+                    groups.setdefault(prefix, []).append(file)
+
+                for prefix, group_files in groups.items():
+                    if control is not None and control.checkpoint():
+                        canceled = True
+                        break
+                    group_files.sort(key=sprite_sort_key)
+                    images = []
+                    try:
+                        for file in group_files:
+                            img = Image.open(os.path.join(root, file)).convert("RGBA")
+                            images.append(img)
+                        if not images:
+                            continue
+                        cell_w = max(img.width for img in images)
+                        cell_h = max(img.height for img in images)
+                        if job.padding_mode == "Frame width":
+                            pad = cell_w
+                        elif job.padding_mode == "Frame height":
+                            pad = cell_h
+                        else:
+                            pad = job.padding_value
+
+                        if job.layout_mode == "Horizontal":
+                            cols = len(images)
+                            rows = 1
+                        elif job.layout_mode == "Vertical":
+                            cols = 1
+                            rows = len(images)
+                        else:
+                            cols = max(1, job.columns)
+                            rows = int(math.ceil(len(images) / cols))
+
+                        sheet_w = (cols * cell_w) + (pad * max(0, cols - 1))
+                        sheet_h = (rows * cell_h) + (pad * max(0, rows - 1))
+                        sheet = Image.new("RGBA", (sheet_w, sheet_h), (0, 0, 0, 0))
+                        for idx, img in enumerate(images):
+                            row = idx // cols
+                            col = idx % cols
+                            x = col * (cell_w + pad)
+                            y = row * (cell_h + pad)
+                            sheet.paste(img, (x, y))
+
+                        out_dir = os.path.join(root, "sprite_sheets")
+                        os.makedirs(out_dir, exist_ok=True)
+                        out_name = f"{prefix}_Spritesheet.png"
+                        out_path = os.path.join(out_dir, out_name)
+                        if encoder.level is None and encoder.profile == "auto":
+                            encoder = resolve_encoder(encoder, [sheet])
+                            emit(("sheet_log", f"PNG profile auto: zlib level {encoder.level}"))
+                        seconds, size = save_png(sheet, out_path, encoder.save_args())
+                        sheet_count += 1
+                        encode_seconds += seconds
+                        written_bytes += size
+
+                        rel_root = os.path.relpath(root, job.input_root)
+                        rel_root = "." if rel_root == "." else rel_root
+                        emit(("sheet_log", f"{rel_root} -> {out_name} ({len(images)} frames, {size / 1024:.1f} KB, encode {seconds * 1000:.0f} ms)"))
+                    finally:
+                        for img in images:
+                            img.close()
+
+        if sheet_count:
+            emit(("sheet_log", format_encode_stats(encoder, sheet_count, encode_seconds, written_bytes)))
+        if canceled:
+            emit(("sheet_log", f"Canceled after {sheet_count} sheet(s); written sheets are complete."))
+        emit(("sheet_done", sheet_count, folder_count, canceled))
+    except Exception as exc:
+        emit(("sheet_error", str(exc)))
+
+
+def run_tilemaps(job, emit, control=None):
+    try:
+        tilemap_count = 0
+        folder_count = 0
+        canceled = False
+        encoder = job.encoder
+        encode_seconds = 0.0
+        written_bytes = 0
+        with InputIndex(job.index_path, job.scan_threads) as index:
+            for root, dirs, files in index.walk(job.input_root):
+                if control is not None and control.checkpoint():
+                    canceled = True
+                    break
+                dirs[:] = [d for d in dirs if d not in ("sprite_sheets", "tilemaps")]
+                folder_name = os.path.basename(root)
+                if folder_name in job.exclude_folders:
+                    dirs[:] = []
+                    continue
+
+                png_files = sorted([f for f in files if f.lower().endswith(".png")], key=lambda s: s.lower())
+                if not png_files:
+                    continue
+                folder_count += 1
+                images = []
+                try:
+                    for file in png_files:
+                        img = Image.open(os.path.join(root, file)).convert("RGBA")
+                        images.append((file, img))
+
+                    if not images:
+                        continue
+
+                    max_w = max(img.width for _, img in images)
+                    max_h = max(img.height for _, img in images)
+                    cell_w = max(job.tile_size, max_w)
+                    cell_h = max(job.tile_size, max_h)
+
+                    if job.layout_mode == "Horizontal":
+                        cols = len(images)
+                        rows = 1
+                    elif job.layout_mode == "Vertical":
+                        cols = 1
+                        rows = len(images)
+                    else:
+                        cols = max(1, job.columns)
+                        rows = int(math.ceil(len(images) / cols))
+
+                    tilemap = Image.new("RGBA", (cols * cell_w, rows * cell_h), (0, 0, 0, 0))
+                    metadata = []
+                    for idx, (file, img) in enumerate(images):
+                        row = idx // cols
+                        col = idx % cols
+                        x = col * cell_w
+                        y = row * cell_h
+                        tilemap.paste(img, (x, y))
+                        metadata.append((file, x, y, img.width, img.height))
+
+                    out_dir = os.path.join(root, "tilemaps")
+                    os.makedirs(out_dir, exist_ok=True)
+                    out_name = f"{folder_name}_tilemap.png"
+                    out_path = os.path.join(out_dir, out_name)
+                    if encoder.level is None and encoder.profile == "auto":
+                        encoder = resolve_encoder(encoder, [tilemap])
+                        emit(("tile_log", f"PNG profile auto: zlib level {encoder.level}"))
+                    seconds, size = save_png(tilemap, out_path, encoder.save_args())
+                    encode_seconds += seconds
+                    written_bytes += size
+
+                    if job.export_meta:
+                        meta_path = os.path.join(out_dir, f"{folder_name}_tilemap.csv")
+                        with atomic_output(meta_path) as temp_path, open(temp_path, "w", newline="", encoding="utf-8") as handle:
+                            writer = csv.writer(handle)
+                            writer.writerow(["tilemap", "tile", "x", "y", "width", "height"])
+                            for file, x, y, w, h in metadata:
+                                writer.writerow([out_name, file, x, y, w, h])
+
+                    tilemap_count += 1
+                    rel_root = os.path.relpath(root, job.input_root)
+                    rel_root = "." if rel_root == "." else rel_root
+                    emit(("tile_log", f"{rel_root} -> {out_name} ({len(images)} tiles, {size / 1024:.1f} KB, encode {seconds * 1000:.0f} ms)"))
+                finally:
+                    for _, img in images:
+                        img.close()
+
+        if tilemap_count:
+            emit(("tile_log", format_encode_stats(encoder, tilemap_count, encode_seconds, written_bytes)))
+        if canceled:
+            emit(("tile_log", f"Canceled after {tilemap_count} tilemap(s); written tilemaps are complete."))
+        emit(("tile_done", tilemap_count, folder_count, canceled))
+    except Exception as exc:
+        emit(("tile_error", str(exc)))
+
+
+def parse_exclude_folders(text):
+    return {name.strip() for name in text.split(",") if name.strip()}
+
+
+def parse_color_settings(mode, color_list, fill_color, replace_from, replace_to):
+    if mode in ("transparent", "fill"):
+        colors = parse_hex_list(color_list)
+        if not colors:
+            raise ValueError("Provide at least one hex color.")
+        target_rgbs = [hex_to_rgb(c) for c in colors]
+        fill_rgb = hex_to_rgb(fill_color) if mode == "fill" else None
+        return target_rgbs, None, fill_rgb
+    replace_pair = (hex_to_rgb(replace_from), hex_to_rgb(replace_to))
+    return [], replace_pair, None
+
+
+def parse_operation(op):
+    """One entry of the "operations" setting: {"mode": ..., plus that mode's color keys}."""
+    mode = op.get("mode", "transparent")
+    if mode == "fill":
+        return ColorConfig("fill", [], None, hex_to_rgb(op.get("fill_color", "")), bool(op.get("fill_shadows", False)))
+    if mode not in ("transparent", "replace"):
+        raise ValueError(f"Unknown color operation: {mode}")
+    tolerance = tolerance_from_settings(op)
+    if mode == "replace" and op.get("replace_map", "").strip():
+        return ColorConfig(mode, replace_map=parse_replace_map(op["replace_map"]), tolerance=tolerance)
+    target_rgbs, replace_pair, _ = parse_color_settings(mode, op.get("color_list", ""), "", op.get("replace_from", ""), op.get("replace_to", ""))
+    return ColorConfig(mode, target_rgbs, replace_pair, tolerance=tolerance)
+
+
+def describe_operation(op):
+    mode = op.get("mode", "transparent")
+    if mode == "fill":
+        shadows = " + shadows" if op.get("fill_shadows") else ""
+        return f"fill {op.get('fill_color', '')}{shadows}"
+    tolerance = f" (tolerance {op['tolerance']})" if op.get("tolerance") else ""
+    if mode == "replace":
+        if op.get("replace_map", "").strip():
+            return f"replace map ({len(REPLACE_PAIR_RE.findall(op['replace_map']))} pairs){tolerance}"
+        return f"replace {op.get('replace_from', '')} -> {op.get('replace_to', '')}{tolerance}"
+    return f"key {op.get('color_list', '')}{tolerance}"
+
+
+def tolerance_from_settings(settings):
+    return max(0, min(int(settings.get("tolerance") or 0), MAX_TOLERANCE))
+
+
+def scan_threads_from_settings(settings):
+    return max(1, min(int(settings.get("scan_threads", SCAN_THREADS)), MAX_SCAN_THREADS))
+
+
+def input_root_from_settings(settings):
+    input_root = settings.get("input", "").strip()
+    if not os.path.isdir(input_root):
+        raise ValueError("Input folder does not exist.")
+    return input_root
+
+
+@dataclass
+class ColorConfig:
+    """One color operation, or (mode "operations") a chain of them in operations."""
+
+    mode: str = "transparent"
+    target_rgbs: list = field(default_factory=list)
+    replace_pair: tuple = None
+    fill_rgb: tuple = None
+    fill_shadows: bool = False
+    replace_map: list = field(default_factory=list)
+    tolerance: int = 0
+    operations: list = field(default_factory=list)
+
+    def steps(self):
+        """Operations to apply in order within one decode/encode pass."""
+        return self.operations or [self]
+
+    def replace_pairs(self):
+        """(src_rgb, dst_rgb) pairs of a replace step: the replace map, or the single pair."""
+        if self.replace_map:
+            return tuple(self.replace_map)
+        return (self.replace_pair,) if self.replace_pair else ()
+
+    @classmethod
+    def from_operations(cls, operations):
+        steps = [parse_operation(op) for op in operations]
+        if not steps:
+            raise ValueError("Add at least one color operation.")
+        return steps[0] if len(steps) == 1 else cls("operations", operations=steps)
+
+    @classmethod
+    def from_settings(cls, settings):
+        if settings.get("operations"):
+            return cls.from_operations(settings["operations"])
+        mode = settings.get("mode", "transparent")
+        tolerance = tolerance_from_settings(settings) if mode != "fill" else 0
+        if mode == "replace" and settings.get("replace_map", "").strip():
+            return cls(mode, replace_map=parse_replace_map(settings["replace_map"]), tolerance=tolerance)
+        target_rgbs, replace_pair, fill_rgb = parse_color_settings(
+            mode,
+            settings.get("color_list", ""),
+            settings.get("fill_color", ""),
+            settings.get("replace_from", ""),
+            settings.get("replace_to", ""),
+        )
+        return cls(mode, target_rgbs, replace_pair, fill_rgb, bool(settings.get("fill_shadows", False)), tolerance=tolerance)
+
+
+@dataclass
+class RoutingConfig:
+    input_root: str
+    output_root: str
+    prefixes: list = field(default_factory=list)
+    keep_prefixes: bool = False
+    rules: dict = field(default_factory=dict)
+    allowed_dirs: set = None
+    skip_existing: bool = True
+    skip_existing_files: bool = False
+    exclude_folders: set = field(default_factory=set)
+    index_path: str = None
+    scan_threads: int = SCAN_THREADS
+
+    @classmethod
+    def from_settings(cls, settings, index_path=None):
+        input_root = input_root_from_settings(settings)
+        output_root = settings.get("output", "").strip()
+        if not output_root:
+            raise ValueError("Output folder is empty.")
+        prefixes = [name for name, enabled in settings.get("prefixes", {}).items() if enabled]
+        prefixes.extend(p.strip() for p in settings.get("extra_prefixes", "").split(",") if p.strip())
+        rules = settings.get("folder_rules", {})
+        if settings.get("process_all", True):
+            allowed_dirs = None
+        else:
+            allowed_dirs = {name for name, rule in rules.items() if rule.get("include")}
+        return cls(
+            input_root,
+            output_root,
+            prefixes,
+            bool(settings.get("keep_prefixes", False)),
+            rules,
+            allowed_dirs,
+            bool(settings.get("skip_existing_folders", True)),
+            bool(settings.get("skip_existing_files", False)),
+            parse_exclude_folders(settings.get("exclude_folders", "")),
+            index_path,
+            scan_threads_from_settings(settings),
+        )
+
+
+@dataclass
+class EncoderConfig:
+    profile: str = "default"
+    target_mps: float = AUTO_TARGET_MPS
+    level: int = None
+
+    @classmethod
+    def from_settings(cls, settings):
+        profile = settings.get("png_profile", "default")
+        if profile not in PNG_PROFILES:
+            raise ValueError(f"PNG profile must be one of: {', '.join(PNG_PROFILES)}.")
+        return cls(profile, max(0.1, float(settings.get("png_target_mps", AUTO_TARGET_MPS))))
+
+    def save_args(self):
+        if self.profile == "fast":
+            return {"compress_level": 1}
+        if self.profile == "release":
+            return {"optimize": True, "compress_level": 9}
+        if self.profile == "auto":
+            return {"compress_level": self.level if self.level is not None else 6}
+        return {}
+
+    def describe(self):
+        if self.profile == "auto":
+            return f"auto, zlib level {self.level if self.level is not None else 6}"
+        return self.profile
+
+
+@dataclass
+class OutputConfig:
+    strategy: str = "copy"
+    pass_through: bool = False
+    encoder: EncoderConfig = field(default_factory=EncoderConfig)
+    strip_threshold_mp: float = STRIP_THRESHOLD_MP
+
+    @classmethod
+    def from_settings(cls, settings):
+        strategy = settings.get("output_strategy", "copy")
+        if strategy not in OUTPUT_STRATEGIES:
+            raise ValueError(f"Output strategy must be one of: {', '.join(OUTPUT_STRATEGIES)}.")
+        strip_threshold = max(0.0, float(settings.get("strip_threshold_mp", STRIP_THRESHOLD_MP)))
+        return cls(strategy, bool(settings.get("pass_through_unchanged", False)), EncoderConfig.from_settings(settings), strip_threshold)
+
+
+@dataclass
+class RoutingPlan:
+    """Routed tasks (relative paths) from Preview Routing, or loaded from a saved plan."""
+
+    key: str
+    tasks: list
+    folders: dict = field(default_factory=dict)
+    outputs: dict = field(default_factory=dict)
+    created: float = 0.0
+    source: str = ""
+
+
+@dataclass
+class BatchJob:
+    routing: RoutingConfig
+    colors: ColorConfig
+    dry_run: bool = False
+    csv_enabled: bool = False
+    csv_path: str = ""
+    workers: int = 1
+    pipeline: bool = False
+    streaming: bool = False
+    incremental: bool = False
+    output: OutputConfig = field(default_factory=OutputConfig)
+    plan: RoutingPlan = None
+    dedupe: bool = False
+    resume: bool = False
+    csv_timings: bool = False
+
+    @classmethod
+    def from_settings(cls, settings, csv_dir, index_path=None):
+        csv_enabled = bool(settings.get("csv_log", False))
+        csv_path = settings.get("csv_path", "").strip()
+        if csv_enabled and not csv_path:
+            timestamp = time.strftime("%Y%m%d-%H%M%S")
+            csv_path = os.path.join(csv_dir, f"log-{timestamp}.csv")
+        return cls(
+            RoutingConfig.from_settings(settings, index_path),
+            ColorConfig.from_settings(settings),
+            bool(settings.get("dry_run", False)),
+            csv_enabled,
+            csv_path,
+            max(1, min(int(settings.get("workers", DEFAULT_WORKERS)), MAX_POOL_WORKERS)),
+            bool(settings.get("pipeline", False)),
+            bool(settings.get("streaming", False)),
+            bool(settings.get("incremental", False)),
+            OutputConfig.from_settings(settings),
+            dedupe=bool(settings.get("dedupe_inputs", False)),
+            csv_timings=bool(settings.get("csv_timings", False)),
+        )
+
+
+@dataclass
+class PreviewJob:
+    routing: RoutingConfig
+    colors: ColorConfig = None
+    output: OutputConfig = field(default_factory=OutputConfig)
+
+    @classmethod
+    def from_settings(cls, settings, index_path=None):
+        colors = ColorConfig.from_settings(settings) if settings.get("preview_count_pixels", False) else None
+        return cls(RoutingConfig.from_settings(settings, index_path), colors, OutputConfig.from_settings(settings))
+
+
+@dataclass
+class PrefixScanJob:
+    input_root: str
+    allowed_dirs: set = None
+    exclude_folders: set = field(default_factory=set)
+    index_path: str = None
+    scan_threads: int = SCAN_THREADS
+
+
+@dataclass
+class SpriteSheetJob:
+    input_root: str
+    layout_mode: str = "Grid"
+    columns: int = 4
+    padding_mode: str = "Fixed"
+    padding_value: int = 1
+    exclude_folders: set = field(default_factory=set)
+    index_path: str = None
+    scan_threads: int = SCAN_THREADS
+    encoder: EncoderConfig = field(default_factory=EncoderConfig)
+
+    @classmethod
+    def from_settings(cls, settings, index_path=None):
+        return cls(
+            input_root_from_settings(settings),
+            settings.get("sprite_layout", "Grid"),
+            max(1, int(settings.get("sprite_columns", 4))),
+            settings.get("sprite_padding_mode", "Fixed"),
+            max(0, int(settings.get("sprite_padding", 1))),
+            parse_exclude_folders(settings.get("exclude_folders", "")),
+            index_path,
+            scan_threads_from_settings(settings),
+            EncoderConfig.from_settings(settings),
+        )
+
+
+@dataclass
+class TilemapJob:
+    input_root: str
+    layout_mode: str = "Grid"
+    columns: int = 15
+    tile_size: int = 32
+    export_meta: bool = True
+    exclude_folders: set = field(default_factory=set)
+    index_path: str = None
+    scan_threads: int = SCAN_THREADS
+    encoder: EncoderConfig = field(default_factory=EncoderConfig)
+
+    @classmethod
+    def from_settings(cls, settings, index_path=None):
+        return cls(
+            input_root_from_settings(settings),
+            settings.get("tile_layout", "Grid"),
+            int(settings.get("tile_columns", 15)),
+            int(settings.get("tile_size", 32)),
+            bool(settings.get("tile_export_meta", True)),
+            parse_exclude_folders(settings.get("exclude_folders", "")),
+            index_path,
+            scan_threads_from_settings(settings),
+            EncoderConfig.from_settings(settings),
+        )
+
+
+def run_job(job, emit, resolve_conflicts=None, control=None):
+    if isinstance(job, BatchJob):
+        run_batch(job, emit, resolve_conflicts, control)
+    elif isinstance(job, PreviewJob):
+        run_preview(job, emit)
+    elif isinstance(job, PrefixScanJob):
+        run_prefix_scan(job, emit, control.cancel_event if control is not None else None)
+    elif isinstance(job, SpriteSheetJob):
+        run_sprite_sheets(job, emit, control)
+    elif isinstance(job, TilemapJob):
+        run_tilemaps(job, emit, control)
+    else:
+        raise TypeError(f"Unknown job type: {type(job).__name__}")
+
+
+def iter_events(job, resolve_conflicts=None, control=None):
+    events = queue.Queue()
+    finished = object()
+
+    def target():
+        try:
+            run_job(job, events.put, resolve_conflicts, control)
+        except Exception as exc:
+            events.put(("error", str(exc)))
+        finally:
+            events.put(finished)
+
+    threading.Thread(target=target, daemon=True).start()
+    while True:
+        event = events.get()
+        if event is finished:
+            return
+        yield event
@@ -0,0 +1,245 @@
+import os
+import json
+import sqlite3
+import concurrent.futures
+
+INDEX_NAME = "input_index.sqlite"
+INDEX_EXTENSIONS = (".png", ".json")
+# Seconds to wait for another instance's write before listing uncached.
+LOCK_TIMEOUT = 30
+SCAN_THREADS = 8
+MAX_SCAN_THREADS = 64
+# Bumped when cached listings from older versions must not be reused.
+INDEX_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    subdirs TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    PRIMARY KEY (dir, name)
+);
+"""
+
+
+def norm_dir(path):
+    return os.path.normpath(os.path.abspath(path))
+
+
+def probe_directory(path, known_mtime):
+    """stat + scandir one folder; safe to run on any thread (no database access).
+
+    Returns (mtime_ns, None, None) when the folder still has known_mtime.
+    Symlinked folders are not listed as subfolders (like os.walk's default
+    followlinks=False), so a link back up the tree cannot make the walk loop.
+    """
+    mtime_ns = os.stat(path).st_mtime_ns
+    if mtime_ns == known_mtime:
+        return mtime_ns, None, None
+    subdirs = []
+    files = {}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif entry.name.lower().endswith(INDEX_EXTENSIONS) and entry.is_file():
+                    stat = entry.stat()
+                    files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                continue
+    subdirs.sort(key=str.lower)
+    return mtime_ns, subdirs, files
+
+
+class InputIndex:
+    """Directory listings of the input tree, cached in SQLite.
+
+    A directory is only listed again when its own mtime changed (a file or
+    subfolder was added, removed or renamed); otherwise its subfolders and
+    PNG/JSON files come from the database. File sizes and mtimes are as of the
+    last listing of their folder. With db_path=None nothing is cached and every
+    call lists the directory, which matches the old os.walk behaviour.
+
+    With threads > 1, walk()/walk_many() probe folders on a thread pool ahead of
+    the (still ordered, top-down) walk, which hides per-call latency on network
+    shares.
+
+    mtimes maps every folder listed (or reused) through this instance to the
+    mtime_ns its listing reflects.
+
+    Each stored listing is committed at once, so no write lock is held while a
+    walk is suspended at a yield. When another instance keeps the database
+    locked past LOCK_TIMEOUT, the listing is returned without being cached.
+    """
+
+    def __init__(self, db_path=None, threads=1):
+        self.conn = None
+        self.threads = max(1, min(int(threads), MAX_SCAN_THREADS))
+        self.listed = 0
+        self.reused = 0
+        self.mtimes = {}
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self.conn = sqlite3.connect(db_path, timeout=LOCK_TIMEOUT, check_same_thread=False)
+            try:
+                self.conn.execute("PRAGMA journal_mode=WAL")
+                self.conn.execute("PRAGMA synchronous=NORMAL")
+                if self.conn.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+                    # Older indexes could list symlinked folders as subfolders.
+                    self.conn.executescript("DROP TABLE IF EXISTS dirs; DROP TABLE IF EXISTS files;")
+                    self.conn.execute("PRAGMA user_version = %d" % INDEX_VERSION)
+                self.conn.executescript(SCHEMA)
+            except sqlite3.OperationalError:
+                # Locked by another instance: walk without the cache.
+                self.conn.close()
+                self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def listdir(self, path):
+        """Return (subdir_names, {file_name: (size, mtime_ns)}) for one folder."""
+        path = norm_dir(path)
+        return self.resolve(path, probe_directory(path, self.cached_mtime(path)))
+
+    def cached_mtime(self, path):
+        if self.conn is None:
+            return None
+        try:
+            row = self.conn.execute("SELECT mtime_ns FROM dirs WHERE path = ?", (path,)).fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return row[0] if row is not None else None
+
+    def known_mtimes(self, paths):
+        known = {}
+        if self.conn is None:
+            return known
+        try:
+            for path in paths:
+                low = path + os.sep
+                high = path + chr(ord(os.sep) + 1)
+                known.update(self.conn.execute(
+                    "SELECT path, mtime_ns FROM dirs WHERE path = ? OR (path >= ? AND path < ?)", (path, low, high)
+                ))
+        except sqlite3.OperationalError:
+            pass
+        return known
+
+    def resolve(self, path, probed):
+        mtime_ns, subdirs, files = probed
+        self.mtimes[path] = mtime_ns
+        if subdirs is None:
+            try:
+                row = self.conn.execute("SELECT subdirs FROM dirs WHERE path = ?", (path,)).fetchone()
+            except sqlite3.OperationalError:
+                row = None
+            if row is None:
+                return self.resolve(path, probe_directory(path, None))
+            self.reused += 1
+            files = {
+                name: (size, file_mtime)
+                for name, size, file_mtime in self.conn.execute(
+                    "SELECT name, size, mtime_ns FROM files WHERE dir = ?", (path,)
+                )
+            }
+            return json.loads(row[0]), files
+        self.listed += 1
+        if self.conn is not None:
+            self.store(path, mtime_ns, subdirs, files)
+        return subdirs, files
+
+    def store(self, path, mtime_ns, subdirs, files):
+        try:
+            row = self.conn.execute("SELECT subdirs FROM dirs WHERE path = ?", (path,)).fetchone()
+            if row is not None:
+                for name in set(json.loads(row[0])) - set(subdirs):
+                    self.forget(os.path.join(path, name))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO dirs (path, mtime_ns, subdirs) VALUES (?, ?, ?)",
+                (path, mtime_ns, json.dumps(subdirs)),
+            )
+            self.conn.execute("DELETE FROM files WHERE dir = ?", (path,))
+            self.conn.executemany(
+                "INSERT INTO files (dir, name, size, mtime_ns) VALUES (?, ?, ?, ?)",
+                [(path, name, size, file_mtime) for name, (size, file_mtime) in files.items()],
+            )
+            self.conn.commit()
+        except sqlite3.OperationalError:
+            # Still locked after LOCK_TIMEOUT: this folder is listed again next time.
+            self.conn.rollback()
+
+    def forget(self, path):
+        # Drop a removed folder and everything below it.
+        low = path + os.sep
+        high = path + chr(ord(os.sep) + 1)
+        self.conn.execute("DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)", (path, low, high))
+        self.conn.execute("DELETE FROM files WHERE dir = ? OR (dir >= ? AND dir < ?)", (path, low, high))
+
+    def subdirs(self, path):
+        return self.listdir(path)[0]
+
+    def walk(self, top):
+        """os.walk replacement (top-down; prune by editing the dirs list)."""
+        for _top, root, dirs, files in self.walk_many([top]):
+            yield root, dirs, files
+
+    def walk_many(self, tops):
+        """Walk several folders in order, yielding (top, root, dirs, files)."""
+        if self.threads <= 1:
+            for top in tops:
+                stack = [top]
+                while stack:
+                    root = stack.pop()
+                    try:
+                        subdirs, files = self.listdir(root)
+                    except OSError:
+                        continue
+                    subdirs = list(subdirs)
+                    yield top, root, subdirs, sorted(files, key=str.lower)
+                    stack.extend(os.path.join(root, name) for name in reversed(subdirs))
+            return
+
+        known = self.known_mtimes([norm_dir(top) for top in tops])
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.threads)
+        pending = {}
+
+        def submit(path):
+            norm = norm_dir(path)
+            pending[path] = executor.submit(probe_directory, norm, known.get(norm))
+
+        try:
+            for top in tops:
+                submit(top)
+            for top in tops:
+                stack = [top]
+                while stack:
+                    root = stack.pop()
+                    try:
+                        subdirs, files = self.resolve(norm_dir(root), pending.pop(root).result())
+                    except OSError:
+                        continue
+                    subdirs = list(subdirs)
+                    yield top, root, subdirs, sorted(files, key=str.lower)
+                    # Submitted after the yield so folders pruned by the caller are never listed.
+                    children = [os.path.join(root, name) for name in subdirs]
+                    for child in children:
+                        submit(child)
+                    stack.extend(reversed(children))
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
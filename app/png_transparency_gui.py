@@ -1,14 +1,12 @@
 import os
-import re
 import json
 import csv
 import time
 import threading
 import queue
-import shutil
 import traceback
 import sys
-import math
+import multiprocessing
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog
 try:
@@ -26,6 +24,49 @@ except Exception as exc:
 else:
     PIL_IMPORT_ERROR = None
 
+from chromaforge_engine import (
+    DEFAULT_WORKERS,
+    JOURNAL_NAME,
+    MANIFEST_NAME,
+    AUTO_TARGET_MPS,
+    MAX_POOL_WORKERS,
+    MAX_TOLERANCE,
+    OUTPUT_STRATEGIES,
+    PNG_PROFILES,
+    STRIP_THRESHOLD_MP,
+    BatchJob,
+    ColorConfig,
+    EncoderConfig,
+    JobControl,
+    OutputConfig,
+    PrefixScanJob,
+    PreviewJob,
+    RoutingConfig,
+    SpriteSheetJob,
+    TilemapJob,
+    describe_operation,
+    extract_group_prefix,
+    first_hex_from_list,
+    format_replace_map,
+    hex_to_rgb,
+    load_plan,
+    load_replace_map,
+    normalize_hex,
+    parse_exclude_folders,
+    parse_hex_list,
+    parse_operation,
+    parse_replace_map,
+    run_batch,
+    run_prefix_scan,
+    run_preview,
+    run_sprite_sheets,
+    resolve_encoder,
+    run_tilemaps,
+    save_plan,
+    save_png,
+)
+from chromaforge_index import INDEX_NAME, MAX_SCAN_THREADS, SCAN_THREADS, InputIndex
+
 APP_DIR = os.path.dirname(os.path.abspath(__file__))
 APP_NAME = "ChromaForge"
 APP_VERSION = "Beta 3.1.1"
@@ -41,6 +82,7 @@ APP_HOME = get_app_home()
 SETTINGS_DIR = os.path.join(APP_HOME, "settings")
 LAST_SETTINGS_PATH = os.path.join(SETTINGS_DIR, "last_settings.json")
 ERROR_LOG_PATH = os.path.join(SETTINGS_DIR, "startup_error.log")
+INDEX_PATH = os.path.join(SETTINGS_DIR, INDEX_NAME)
 LOGO_PNG = "ChromaForge_logo.png"
 ICON_ICO = "ChromaForge_logo.ico"
 
@@ -58,159 +100,6 @@ DEFAULT_PREFIXES = ["Characters", "Inventory", "FX", "Chars", "MapGFX"]
 FOLDER_MODES = ["Process", "Skip", "Rename only"]
 
 
-def normalize_hex(hex_str):
-    value = hex_str.strip()
-    if value.startswith("#"):
-        value = value[1:]
-    if not re.fullmatch(r"[0-9A-Fa-f]{6}", value):
-        raise ValueError("Color must be a 6-digit hex value like #00FF00")
-    return "#" + value.upper()
-
-
-def hex_to_rgb(hex_str):
-    value = normalize_hex(hex_str)[1:]
-    r = int(value[0:2], 16)
-    g = int(value[2:4], 16)
-    b = int(value[4:6], 16)
-    return (r, g, b)
-
-
-def parse_hex_list(hex_list):
-    if not hex_list.strip():
-        return []
-    parts = re.split(r"[\s,]+", hex_list.strip())
-    colors = []
-    for part in parts:
-        if not part:
-            continue
-        colors.append(normalize_hex(part))
-    return colors
-
-
-def first_hex_from_list(hex_list):
-    colors = parse_hex_list(hex_list)
-    return colors[0] if colors else ""
-
-
-def build_prefix_regex(prefixes):
-    if not prefixes:
-        return None
-    escaped = [re.escape(p) for p in prefixes]
-    return re.compile(r"^(?P<prefix>" + "|".join(escaped) + r")_\d+_")
-
-
-def process_image(in_path, out_path, mode, target_rgbs, replace_pair, fill_color, fill_shadows, dry_run):
-    with Image.open(in_path) as img:
-        img = img.convert("RGBA")
-        pixels = img.load()
-        width, height = img.size
-
-        converted = 0
-        if mode == "transparent":
-            target_set = set(target_rgbs)
-            for y in range(height):
-                for x in range(width):
-                    r, g, b, a = pixels[x, y]
-                    if (r, g, b) in target_set:
-                        converted += 1
-                        if not dry_run:
-                            pixels[x, y] = (r, g, b, 0)
-        elif mode == "fill":
-            if fill_color is None:
-                return 0
-            fr, fg, fb = fill_color
-            for y in range(height):
-                for x in range(width):
-                    r, g, b, a = pixels[x, y]
-                    if a == 0:
-                        converted += 1
-                        if not dry_run:
-                            pixels[x, y] = (fr, fg, fb, 255)
-                    elif fill_shadows and a < 255:
-                        converted += 1
-                        if not dry_run:
-                            pixels[x, y] = (fr, fg, fb, 255)
-        else:
-            src_rgb, dst_rgb = replace_pair
-            for y in range(height):
-                for x in range(width):
-                    r, g, b, a = pixels[x, y]
-                    if (r, g, b) == src_rgb:
-                        converted += 1
-                        if not dry_run:
-                            pixels[x, y] = (dst_rgb[0], dst_rgb[1], dst_rgb[2], a)
-
-        if not dry_run:
-            os.makedirs(os.path.dirname(out_path), exist_ok=True)
-            img.save(out_path, format="PNG")
-
-    return converted
-
-
-def output_filename(name, prefix_re, keep_prefixes):
-    base, ext = os.path.splitext(name)
-    if prefix_re is not None and not keep_prefixes:
-        base = prefix_re.sub("", base)
-    return base + ext
-
-
-def output_prefix_folder(name, prefix_re):
-    if prefix_re is None:
-        return "needs_sorting"
-    base = os.path.splitext(name)[0]
-    match = prefix_re.match(base)
-    if not match:
-        return "needs_sorting"
-    return match.group("prefix").lower()
-
-
-def extract_group_prefix(name):
-    base = os.path.splitext(name)[0]
-    parts = re.split(r"[-_]", base)
-    if not parts:
-        return base
-    first = parts[0].strip()
-    if not first:
-        return base
-    if first.isdigit() and len(parts) > 1:
-        second = parts[1].strip()
-        if second:
-            second_upper = second.upper()
-            if re.fullmatch(r"F\d+", second_upper) or second_upper in {"N", "E", "S", "W"} or second.isdigit():
-                return first
-            if re.search(r"[A-Z]", second_upper):
-                return second
-    return first
-
-
-def sprite_sort_key(name):
-    base = os.path.splitext(name)[0]
-    base_upper = base.upper()
-    direction_match = re.search(r"(?:^|[-_])(N|E|S|W)(?:$|[-_])", base_upper)
-    direction = direction_match.group(1) if direction_match else ""
-    direction_order = {"N": 0, "E": 1, "S": 2, "W": 3}
-    direction_index = direction_order.get(direction, 99)
-
-    frame_match = re.search(r"(?:^|[-_])F(\d+)(?:$|[-_])", base_upper)
-    if frame_match:
-        return (0, direction_index, int(frame_match.group(1)), base_upper)
-
-    number_match = re.search(r"(?:^|[-_])(\d+)(?:$)", base_upper)
-    if number_match:
-        return (1, int(number_match.group(1)), base_upper)
-
-    return (2, base_upper)
-
-
-def ensure_csv_header(path):
-    if os.path.exists(path):
-        return
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", newline="", encoding="utf-8") as handle:
-        writer = csv.writer(handle)
-        writer.writerow(["input", "output", "action", "converted"])
-
-
 class Tooltip:
     def __init__(self, widget, text_func, enabled_var):
         self.widget = widget
@@ -265,7 +154,10 @@ class App:
         self.root.title(APP_TITLE)
         self.queue = queue.Queue()
         self.running = False
+        self.run_control = None
         self.previewing = False
+        self.routing_plan = None
+        self.color_operations = []
         self.window_size = None
         self._resize_save_after_id = None
         icon_path = resource_path(ICON_ICO)
@@ -280,13 +172,28 @@ class App:
         self.fill_shadows_var = tk.BooleanVar(value=False)
         self.replace_from_var = tk.StringVar(value="")
         self.replace_to_var = tk.StringVar(value="")
+        self.replace_map_var = tk.StringVar(value="")
+        self.tolerance_var = tk.IntVar(value=0)
         self.extra_prefix_var = tk.StringVar(value="")
         self.keep_prefixes_var = tk.BooleanVar(value=False)
         self.process_all_var = tk.BooleanVar(value=True)
         self.skip_existing_var = tk.BooleanVar(value=True)
         self.skip_existing_files_var = tk.BooleanVar(value=False)
         self.dry_run_var = tk.BooleanVar(value=False)
+        self.preview_count_pixels_var = tk.BooleanVar(value=False)
+        self.workers_var = tk.IntVar(value=DEFAULT_WORKERS)
+        self.scan_threads_var = tk.IntVar(value=SCAN_THREADS)
+        self.pipeline_var = tk.BooleanVar(value=False)
+        self.streaming_var = tk.BooleanVar(value=False)
+        self.incremental_var = tk.BooleanVar(value=False)
+        self.dedupe_var = tk.BooleanVar(value=False)
+        self.output_strategy_var = tk.StringVar(value="copy")
+        self.pass_through_var = tk.BooleanVar(value=False)
+        self.strip_threshold_var = tk.DoubleVar(value=STRIP_THRESHOLD_MP)
+        self.png_profile_var = tk.StringVar(value="default")
+        self.png_target_mps_var = tk.DoubleVar(value=AUTO_TARGET_MPS)
         self.csv_log_var = tk.BooleanVar(value=False)
+        self.csv_timings_var = tk.BooleanVar(value=False)
         self.csv_path_var = tk.StringVar(value="")
         self.exclude_folders_var = tk.StringVar(value="")
         self.recent_preset_var = tk.StringVar(value="")
@@ -299,11 +206,13 @@ class App:
         self.sprite_padding_mode_var = tk.StringVar(value="Fixed")
         self.sprite_padding_var = tk.IntVar(value=1)
         self.sheet_running = False
+        self.sheet_control = None
         self.tile_layout_var = tk.StringVar(value="Grid")
         self.tile_columns_var = tk.IntVar(value=15)
         self.tile_size_var = tk.IntVar(value=32)
         self.tile_export_meta_var = tk.BooleanVar(value=True)
         self.tile_running = False
+        self.tile_control = None
         self.layout_type_var = tk.StringVar(value="Spritesheet")
         self.layout_folder_var = tk.StringVar(value="")
         self.layout_output_var = tk.StringVar(value="")
@@ -377,6 +286,10 @@ class App:
         self.split_undo_stack = []
 
         self.prefix_vars = {}
+        self.prefix_counts = {}
+        self.prefix_scanning = False
+        self.prefix_scan_cancel = threading.Event()
+        self.prefix_scan_states = {}
         self.conflict_event = threading.Event()
         self.conflict_choice = None
 
@@ -464,6 +377,11 @@ class App:
         self.color_list_entry.grid(row=0, column=2, sticky="ew", padx=6)
         self.color_list_swatch = tk.Label(color_frame, width=3, relief="sunken")
         self.color_list_swatch.grid(row=0, column=3, padx=4)
+        tolerance_frame = ttk.Frame(color_frame)
+        tolerance_frame.grid(row=0, column=4, columnspan=3, sticky="w", padx=6)
+        ttk.Label(tolerance_frame, text="Tolerance").grid(row=0, column=0, sticky="w")
+        self.tolerance_spin = ttk.Spinbox(tolerance_frame, from_=0, to=MAX_TOLERANCE, textvariable=self.tolerance_var, width=6)
+        self.tolerance_spin.grid(row=0, column=1, sticky="w", padx=(6, 0))
 
         fill_radio = ttk.Radiobutton(color_frame, text="Fill with color", variable=self.mode_var, value="fill", command=self.update_color_mode)
         fill_radio.grid(row=1, column=0, sticky="w", padx=6, pady=2)
@@ -487,6 +405,26 @@ class App:
         self.replace_to_entry.grid(row=2, column=5, sticky="w", padx=6)
         self.replace_to_swatch = tk.Label(color_frame, width=3, relief="sunken")
         self.replace_to_swatch.grid(row=2, column=6, padx=4)
+        ttk.Label(color_frame, text="Map").grid(row=3, column=1, sticky="e")
+        self.replace_map_entry = ttk.Entry(color_frame, textvariable=self.replace_map_var)
+        self.replace_map_entry.grid(row=3, column=2, sticky="ew", padx=6)
+        self.replace_map_button = ttk.Button(color_frame, text="Load...", command=self.load_replace_map_file)
+        self.replace_map_button.grid(row=3, column=3, columnspan=2, sticky="w", padx=4)
+
+        operations_frame = ttk.Frame(color_frame)
+        operations_frame.grid(row=4, column=0, columnspan=7, sticky="ew", padx=6, pady=(4, 2))
+        operations_frame.columnconfigure(1, weight=1)
+        ttk.Label(operations_frame, text="Operation chain").grid(row=0, column=0, sticky="nw")
+        self.operations_listbox = tk.Listbox(operations_frame, height=3, exportselection=False)
+        self.operations_listbox.grid(row=0, column=1, sticky="ew", padx=6)
+        operations_buttons = ttk.Frame(operations_frame)
+        operations_buttons.grid(row=0, column=2, sticky="n")
+        self.add_operation_button = ttk.Button(operations_buttons, text="Add current", command=self.add_color_operation)
+        self.add_operation_button.grid(row=0, column=0, sticky="ew")
+        ttk.Button(operations_buttons, text="Remove", command=self.remove_color_operation).grid(row=0, column=1, sticky="ew", padx=(4, 0))
+        ttk.Button(operations_buttons, text="Up", command=lambda: self.move_color_operation(-1)).grid(row=1, column=0, sticky="ew", pady=(2, 0))
+        ttk.Button(operations_buttons, text="Down", command=lambda: self.move_color_operation(1)).grid(row=1, column=1, sticky="ew", padx=(4, 0), pady=(2, 0))
+        ttk.Button(operations_buttons, text="Clear", command=self.clear_color_operations).grid(row=2, column=0, columnspan=2, sticky="ew", pady=(2, 0))
 
         prefix_frame = ttk.LabelFrame(main, text="Prefixes")
         prefix_frame.grid(row=4, column=0, columnspan=3, sticky="ew", pady=6)
@@ -496,6 +434,8 @@ class App:
         self.scan_prefixes_button.grid(row=0, column=0, sticky="w")
         self.keep_prefixes_check = ttk.Checkbutton(prefix_controls, text="Keep prefixes", variable=self.keep_prefixes_var)
         self.keep_prefixes_check.grid(row=0, column=1, sticky="w", padx=(10, 0))
+        self.prefix_scan_label = ttk.Label(prefix_controls, text="")
+        self.prefix_scan_label.grid(row=0, column=2, sticky="w", padx=(10, 0))
         prefix_controls.columnconfigure(2, weight=1)
 
         self.prefix_list_frame = ttk.Frame(prefix_frame)
@@ -555,6 +495,44 @@ class App:
         ttk.Entry(options_frame, textvariable=self.exclude_folders_var).grid(row=4, column=0, sticky="ew", pady=(0, 4))
         tooltips_btn = ttk.Checkbutton(options_frame, text="Enable tooltips", variable=self.tooltips_enabled_var)
         tooltips_btn.grid(row=5, column=0, sticky="w", pady=(2, 0))
+        self.preview_count_check = ttk.Checkbutton(options_frame, text="Count pixels that would change in Preview Routing", variable=self.preview_count_pixels_var)
+        self.preview_count_check.grid(row=6, column=0, sticky="w")
+        workers_frame = ttk.Frame(options_frame)
+        workers_frame.grid(row=7, column=0, sticky="w", pady=2)
+        ttk.Label(workers_frame, text="Parallel workers").grid(row=0, column=0, sticky="w")
+        self.workers_spin = ttk.Spinbox(workers_frame, from_=1, to=MAX_POOL_WORKERS, textvariable=self.workers_var, width=6)
+        self.workers_spin.grid(row=0, column=1, sticky="w", padx=6)
+        self.pipeline_check = ttk.Checkbutton(workers_frame, text="Staged pipeline (overlap reading, processing and writing)", variable=self.pipeline_var)
+        self.pipeline_check.grid(row=0, column=2, sticky="w", padx=(10, 0))
+        ttk.Label(workers_frame, text="Scan threads").grid(row=1, column=0, sticky="w")
+        self.scan_threads_spin = ttk.Spinbox(workers_frame, from_=1, to=MAX_SCAN_THREADS, textvariable=self.scan_threads_var, width=6)
+        self.scan_threads_spin.grid(row=1, column=1, sticky="w", padx=6)
+        self.streaming_check = ttk.Checkbutton(options_frame, text="Stream discovery (start processing while scanning)", variable=self.streaming_var)
+        self.streaming_check.grid(row=8, column=0, sticky="w")
+        self.incremental_check = ttk.Checkbutton(options_frame, text="Incremental rebuild (skip inputs unchanged since the last run)", variable=self.incremental_var)
+        self.incremental_check.grid(row=9, column=0, sticky="w")
+        output_frame = ttk.Frame(options_frame)
+        output_frame.grid(row=10, column=0, sticky="w", pady=2)
+        ttk.Label(output_frame, text="Output strategy").grid(row=0, column=0, sticky="w")
+        self.output_strategy_combo = ttk.Combobox(output_frame, textvariable=self.output_strategy_var, values=OUTPUT_STRATEGIES, state="readonly", width=10)
+        self.output_strategy_combo.grid(row=0, column=1, sticky="w", padx=6)
+        self.pass_through_check = ttk.Checkbutton(output_frame, text="Pass through files with nothing to convert", variable=self.pass_through_var)
+        self.pass_through_check.grid(row=0, column=2, sticky="w", padx=(10, 0))
+        ttk.Label(output_frame, text="PNG profile").grid(row=1, column=0, sticky="w")
+        self.png_profile_combo = ttk.Combobox(output_frame, textvariable=self.png_profile_var, values=PNG_PROFILES, state="readonly", width=10)
+        self.png_profile_combo.grid(row=1, column=1, sticky="w", padx=6)
+        target_frame = ttk.Frame(output_frame)
+        target_frame.grid(row=1, column=2, sticky="w", padx=(10, 0))
+        ttk.Label(target_frame, text="Auto target (MP/s)").grid(row=0, column=0, sticky="w")
+        self.png_target_spin = ttk.Spinbox(target_frame, from_=1, to=1000, increment=5, textvariable=self.png_target_mps_var, width=6)
+        self.png_target_spin.grid(row=0, column=1, sticky="w", padx=6)
+        self.dedupe_check = ttk.Checkbutton(options_frame, text="Process identical inputs once (copy or link the other outputs)", variable=self.dedupe_var)
+        self.dedupe_check.grid(row=11, column=0, sticky="w")
+        strip_frame = ttk.Frame(output_frame)
+        strip_frame.grid(row=2, column=0, columnspan=3, sticky="w")
+        ttk.Label(strip_frame, text="Process in strips above (MP, 0 = off)").grid(row=0, column=0, sticky="w")
+        self.strip_threshold_spin = ttk.Spinbox(strip_frame, from_=0, to=10000, increment=16, textvariable=self.strip_threshold_var, width=6)
+        self.strip_threshold_spin.grid(row=0, column=1, sticky="w", padx=6)
         options_frame.columnconfigure(0, weight=1)
 
         csv_frame = ttk.Frame(options_frame)
@@ -562,19 +540,31 @@ class App:
         ttk.Checkbutton(csv_frame, text="Export CSV log", variable=self.csv_log_var).grid(row=0, column=0, sticky="w")
         ttk.Entry(csv_frame, textvariable=self.csv_path_var, width=50).grid(row=0, column=1, padx=6, sticky="ew")
         ttk.Button(csv_frame, text="Browse", command=self.pick_csv).grid(row=0, column=2)
+        self.csv_timings_check = ttk.Checkbutton(csv_frame, text="Stage timings", variable=self.csv_timings_var)
+        self.csv_timings_check.grid(row=0, column=3, sticky="w", padx=(6, 0))
         csv_frame.columnconfigure(1, weight=1)
 
         run_frame = ttk.Frame(main)
         run_frame.grid(row=7, column=0, columnspan=3, sticky="ew", pady=6)
         self.run_button = ttk.Button(run_frame, text="Run", command=self.run)
         self.run_button.grid(row=0, column=0, sticky="w")
+        self.resume_button = ttk.Button(run_frame, text="Resume Last Run", command=lambda: self.run(resume=True))
+        self.resume_button.grid(row=0, column=1, sticky="w", padx=(4, 0))
+        self.pause_button = ttk.Button(run_frame, text="Pause", state="disabled", command=lambda: self.toggle_pause(self.run_control, self.pause_button, self.status_label))
+        self.pause_button.grid(row=0, column=2, sticky="w", padx=(4, 0))
+        self.cancel_button = ttk.Button(run_frame, text="Cancel", state="disabled", command=lambda: self.cancel_job(self.run_control, self.pause_button, self.cancel_button, self.status_label))
+        self.cancel_button.grid(row=0, column=3, sticky="w", padx=(4, 0))
         self.preview_button = ttk.Button(run_frame, text="Preview Routing", command=self.preview_routing)
-        self.preview_button.grid(row=0, column=1, sticky="w", padx=(8, 0))
+        self.preview_button.grid(row=0, column=4, sticky="w", padx=(8, 0))
+        self.save_plan_button = ttk.Button(run_frame, text="Save Plan", command=self.save_routing_plan)
+        self.save_plan_button.grid(row=0, column=5, sticky="w", padx=(8, 0))
+        self.load_plan_button = ttk.Button(run_frame, text="Load Plan", command=self.load_routing_plan)
+        self.load_plan_button.grid(row=0, column=6, sticky="w", padx=(4, 0))
         self.progress = ttk.Progressbar(run_frame, length=240)
-        self.progress.grid(row=0, column=2, padx=10)
+        self.progress.grid(row=0, column=7, padx=10)
         self.status_label = ttk.Label(run_frame, text="")
-        self.status_label.grid(row=0, column=3, sticky="w")
-        run_frame.columnconfigure(2, weight=1)
+        self.status_label.grid(row=0, column=8, sticky="w")
+        run_frame.columnconfigure(7, weight=1)
 
         log_frame = ttk.LabelFrame(main, text="Log")
         log_frame.grid(row=8, column=0, columnspan=3, sticky="nsew", pady=6)
@@ -632,11 +622,15 @@ class App:
         sheet_run_frame.grid(row=4, column=0, columnspan=3, sticky="ew", pady=6)
         self.sheet_run_button = ttk.Button(sheet_run_frame, text="Generate Sprite Sheets", command=self.run_sprite_sheets)
         self.sheet_run_button.grid(row=0, column=0, sticky="w")
+        self.sheet_pause_button = ttk.Button(sheet_run_frame, text="Pause", state="disabled", command=lambda: self.toggle_pause(self.sheet_control, self.sheet_pause_button, self.sheet_status_label))
+        self.sheet_pause_button.grid(row=0, column=1, sticky="w", padx=(4, 0))
+        self.sheet_cancel_button = ttk.Button(sheet_run_frame, text="Cancel", state="disabled", command=lambda: self.cancel_job(self.sheet_control, self.sheet_pause_button, self.sheet_cancel_button, self.sheet_status_label))
+        self.sheet_cancel_button.grid(row=0, column=2, sticky="w", padx=(4, 0))
         self.sheet_progress = ttk.Progressbar(sheet_run_frame, length=240, mode="indeterminate")
-        self.sheet_progress.grid(row=0, column=1, padx=10)
+        self.sheet_progress.grid(row=0, column=3, padx=10)
         self.sheet_status_label = ttk.Label(sheet_run_frame, text="")
-        self.sheet_status_label.grid(row=0, column=2, sticky="w")
-        sheet_run_frame.columnconfigure(1, weight=1)
+        self.sheet_status_label.grid(row=0, column=4, sticky="w")
+        sheet_run_frame.columnconfigure(3, weight=1)
 
         sheet_log_frame = ttk.LabelFrame(sheet_main, text="Log")
         sheet_log_frame.grid(row=5, column=0, columnspan=3, sticky="nsew", pady=6)
@@ -698,11 +692,15 @@ class App:
         tile_run_frame.grid(row=5, column=0, columnspan=3, sticky="ew", pady=6)
         self.tile_run_button = ttk.Button(tile_run_frame, text="Generate Tilemaps", command=self.run_tilemaps)
         self.tile_run_button.grid(row=0, column=0, sticky="w")
+        self.tile_pause_button = ttk.Button(tile_run_frame, text="Pause", state="disabled", command=lambda: self.toggle_pause(self.tile_control, self.tile_pause_button, self.tile_status_label))
+        self.tile_pause_button.grid(row=0, column=1, sticky="w", padx=(4, 0))
+        self.tile_cancel_button = ttk.Button(tile_run_frame, text="Cancel", state="disabled", command=lambda: self.cancel_job(self.tile_control, self.tile_pause_button, self.tile_cancel_button, self.tile_status_label))
+        self.tile_cancel_button.grid(row=0, column=2, sticky="w", padx=(4, 0))
         self.tile_progress = ttk.Progressbar(tile_run_frame, length=240, mode="indeterminate")
-        self.tile_progress.grid(row=0, column=1, padx=10)
+        self.tile_progress.grid(row=0, column=3, padx=10)
         self.tile_status_label = ttk.Label(tile_run_frame, text="")
-        self.tile_status_label.grid(row=0, column=2, sticky="w")
-        tile_run_frame.columnconfigure(1, weight=1)
+        self.tile_status_label.grid(row=0, column=4, sticky="w")
+        tile_run_frame.columnconfigure(3, weight=1)
 
         tile_log_frame = ttk.LabelFrame(tile_main, text="Log")
         tile_log_frame.grid(row=6, column=0, columnspan=3, sticky="nsew", pady=6)
@@ -1292,20 +1290,106 @@ class App:
             self.fill_shadows_check.configure(state="disabled")
             self.replace_from_entry.configure(state="disabled")
             self.replace_to_entry.configure(state="disabled")
+            self.replace_map_entry.configure(state="disabled")
+            self.replace_map_button.configure(state="disabled")
+            self.tolerance_spin.configure(state="normal")
         elif mode == "fill":
             self.color_list_entry.configure(state="normal")
             self.fill_color_entry.configure(state="normal")
             self.fill_shadows_check.configure(state="normal")
             self.replace_from_entry.configure(state="disabled")
             self.replace_to_entry.configure(state="disabled")
+            self.replace_map_entry.configure(state="disabled")
+            self.replace_map_button.configure(state="disabled")
+            self.tolerance_spin.configure(state="disabled")
         else:
             self.color_list_entry.configure(state="disabled")
             self.fill_color_entry.configure(state="disabled")
             self.fill_shadows_check.configure(state="disabled")
             self.replace_from_entry.configure(state="normal")
             self.replace_to_entry.configure(state="normal")
+            self.replace_map_entry.configure(state="normal")
+            self.replace_map_button.configure(state="normal")
+            self.tolerance_spin.configure(state="normal")
         self.update_swatches()
 
+    def current_color_operation(self):
+        mode = self.mode_var.get()
+        if mode == "fill":
+            return {"mode": mode, "fill_color": self.fill_color_var.get().strip(), "fill_shadows": self.fill_shadows_var.get()}
+        if mode == "replace":
+            return {
+                "mode": mode,
+                "replace_from": self.replace_from_var.get().strip(),
+                "replace_to": self.replace_to_var.get().strip(),
+                "replace_map": self.replace_map_var.get().strip(),
+                "tolerance": self.get_tolerance(),
+            }
+        return {"mode": mode, "color_list": self.color_list_var.get().strip(), "tolerance": self.get_tolerance()}
+
+    def load_replace_map_file(self):
+        path = filedialog.askopenfilename(
+            title="Replace map (CSV) or source palette",
+            filetypes=[("Replace maps and palettes", "*.csv *.gpl *.hex"), ("All files", "*.*")],
+            initialdir=APP_DIR,
+        )
+        if not path:
+            return
+        to_path = None
+        if not path.lower().endswith(".csv"):
+            to_path = filedialog.askopenfilename(
+                title="Destination palette (same order as the source palette)",
+                filetypes=[("Palettes", "*.gpl *.hex"), ("All files", "*.*")],
+                initialdir=os.path.dirname(path),
+            )
+            if not to_path:
+                return
+        try:
+            pairs = load_replace_map(path, to_path)
+        except (OSError, ValueError) as exc:
+            messagebox.showerror("Replace map error", f"Failed to load replace map:\n{exc}")
+            return
+        self.replace_map_var.set(format_replace_map(pairs))
+
+    def refresh_color_operations(self):
+        self.operations_listbox.delete(0, tk.END)
+        for idx, op in enumerate(self.color_operations, start=1):
+            self.operations_listbox.insert(tk.END, f"{idx}. {describe_operation(op)}")
+
+    def add_color_operation(self):
+        op = self.current_color_operation()
+        try:
+            parse_operation(op)
+        except ValueError as exc:
+            messagebox.showerror("Invalid operation", str(exc))
+            return
+        self.color_operations.append(op)
+        self.refresh_color_operations()
+
+    def remove_color_operation(self):
+        selection = self.operations_listbox.curselection()
+        if not selection:
+            return
+        del self.color_operations[selection[0]]
+        self.refresh_color_operations()
+
+    def move_color_operation(self, delta):
+        selection = self.operations_listbox.curselection()
+        if not selection:
+            return
+        idx = selection[0]
+        target = idx + delta
+        if target < 0 or target >= len(self.color_operations):
+            return
+        ops = self.color_operations
+        ops[idx], ops[target] = ops[target], ops[idx]
+        self.refresh_color_operations()
+        self.operations_listbox.selection_set(target)
+
+    def clear_color_operations(self):
+        self.color_operations = []
+        self.refresh_color_operations()
+
     def update_sprite_layout_controls(self):
         mode = self.sprite_layout_var.get()
         if mode == "Grid":
@@ -1385,18 +1469,20 @@ class App:
             return
         target_dir = "sprite_sheets" if self.layout_type_var.get() == "Spritesheet" else "tilemaps"
         entries = []
-        for root, _dirs, files in os.walk(input_root):
-            if os.path.basename(root).lower() != target_dir:
-                continue
-            for file in files:
-                if not file.lower().endswith(".json"):
+        with InputIndex(INDEX_PATH, self.get_scan_threads()) as index:
+            for root, _dirs, files in index.walk(input_root):
+                if os.path.basename(root).lower() != target_dir:
                     continue
-                path = os.path.join(root, file)
-                try:
-                    mtime = os.path.getmtime(path)
-                except OSError:
-                    mtime = 0
-                entries.append((mtime, path))
+                for file in files:
+                    if not file.lower().endswith(".json"):
+                        continue
+                    path = os.path.join(root, file)
+                    # Exports overwrite these in place, which does not bump the folder mtime.
+                    try:
+                        mtime = os.path.getmtime(path)
+                    except OSError:
+                        mtime = 0
+                    entries.append((mtime, path))
         entries.sort(key=lambda item: item[0], reverse=True)
         entries = entries[:30]
         labels = []
@@ -1424,11 +1510,12 @@ class App:
             self.layout_listbox.delete(0, tk.END)
             return
         folders = []
-        for root, dirs, files in os.walk(input_root):
-            dirs[:] = [d for d in dirs if d not in ("sprite_sheets", "tilemaps")]
-            if any(file.lower().endswith(".png") for file in files):
-                rel = os.path.relpath(root, input_root)
-                folders.append("." if rel == "." else rel)
+        with InputIndex(INDEX_PATH, self.get_scan_threads()) as index:
+            for root, dirs, files in index.walk(input_root):
+                dirs[:] = [d for d in dirs if d not in ("sprite_sheets", "tilemaps")]
+                if any(file.lower().endswith(".png") for file in files):
+                    rel = os.path.relpath(root, input_root)
+                    folders.append("." if rel == "." else rel)
         folders.sort(key=str.lower)
         self.layout_folder_combo["values"] = folders
         if self.layout_folder_var.get() not in folders:
@@ -1441,7 +1528,8 @@ class App:
         self.layout_listbox.delete(0, tk.END)
         if not folder_path or not os.path.isdir(folder_path):
             return
-        files = [f for f in os.listdir(folder_path) if f.lower().endswith(".png")]
+        with InputIndex(INDEX_PATH, self.get_scan_threads()) as index:
+            files = [f for f in index.listdir(folder_path)[1] if f.lower().endswith(".png")]
         files.sort(key=str.lower)
         for file in files:
             self.layout_listbox.insert(tk.END, file)
@@ -2854,7 +2942,8 @@ class App:
                     metadata.append((item["file"], int(item["x"]), int(item["y"]), img.width, img.height))
             except Exception:
                 continue
-        canvas.save(out_path, format="PNG")
+        encoder = resolve_encoder(self.get_encoder_config(), [canvas])
+        seconds, size = save_png(canvas, out_path, encoder.save_args())
 
         if self.layout_type_var.get() == "Tilemap" and self.tile_export_meta_var.get():
             meta_path = os.path.join(out_dir, f"{output_name}.csv")
@@ -2866,7 +2955,7 @@ class App:
 
         self.layout_save()
         self.layout_status_label.configure(text="Exported")
-        messagebox.showinfo("Exported", f"Saved to:\n{out_path}")
+        messagebox.showinfo("Exported", f"Saved to:\n{out_path}\n\n{size / 1024:.1f} KB, encoded in {seconds * 1000:.0f} ms ({encoder.describe()})")
 
     def layout_build_json(self):
         return {
@@ -3603,6 +3692,9 @@ class App:
         exported = 0
         skipped = 0
         exported_cells = []
+        encoder = self.get_encoder_config()
+        encode_seconds = 0.0
+        written_bytes = 0
         for row, col in sorted(cells):
             if row < 0 or col < 0 or row >= grid["rows"] or col >= grid["cols"]:
                 continue
@@ -3616,14 +3708,18 @@ class App:
                     continue
             out_name = f"{base_name}_r{row + 1}_c{col + 1}.png"
             out_path = os.path.join(output_dir, out_name)
-            crop.save(out_path, format="PNG")
+            encoder = resolve_encoder(encoder, [crop])
+            seconds, size = save_png(crop, out_path, encoder.save_args())
+            encode_seconds += seconds
+            written_bytes += size
             exported += 1
-            exported_cells.append({"row": row, "col": col, "file": out_name})
+            exported_cells.append({"row": row, "col": col, "file": out_name, "bytes": size, "encode_ms": round(seconds * 1000, 1)})
         self.split_write_export_json(output_dir, base_name, grid, exported_cells, skipped, len(cells))
+        encode_note = f"{written_bytes / 1024:.1f} KB, {encode_seconds * 1000:.0f} ms encoding"
         if skip_blank:
-            self.split_status_label.configure(text=f"Exported {exported} frame(s), skipped {skipped} empty")
+            self.split_status_label.configure(text=f"Exported {exported} frame(s), skipped {skipped} empty ({encode_note})")
         else:
-            self.split_status_label.configure(text=f"Exported {exported} frame(s)")
+            self.split_status_label.configure(text=f"Exported {exported} frame(s) ({encode_note})")
 
     def split_write_export_json(self, output_dir, base_name, grid, exported_cells, skipped, requested):
         payload = {
@@ -3710,13 +3806,36 @@ class App:
         Tooltip(self.fill_shadows_check, lambda: "Experimental: fills semi-transparent pixels with a solid color.", self.tooltips_enabled_var)
         Tooltip(self.replace_from_entry, lambda: "Exact source color to replace.", self.tooltips_enabled_var)
         Tooltip(self.replace_to_entry, lambda: "Exact destination color.", self.tooltips_enabled_var)
+        Tooltip(self.tolerance_spin, lambda: "Also match colors within this RGB distance of a key or replace color (0 = exact). Catches near-color fringes without listing every shade.", self.tooltips_enabled_var)
+        Tooltip(self.replace_map_entry, lambda: "Several replacements in one pass, like #FF0000>#00FF00, #0000FF>#FFFF00. When set it is used instead of From/To.", self.tooltips_enabled_var)
+        Tooltip(self.replace_map_button, lambda: "Load a CSV (source,destination) or two .gpl/.hex palettes matched color by color.", self.tooltips_enabled_var)
+        Tooltip(self.add_operation_button, lambda: "Append the selected mode's colors to the chain. A non-empty chain replaces the single mode above and runs in order in one pass per file.", self.tooltips_enabled_var)
         Tooltip(self.extra_prefix_entry, lambda: "Extra prefixes to detect (comma-separated).", self.tooltips_enabled_var)
         Tooltip(skip_existing_btn, lambda: "Skip prefix-named folders already in the output.", self.tooltips_enabled_var)
         Tooltip(skip_files_btn, lambda: "Skip files that already exist in the output.", self.tooltips_enabled_var)
         Tooltip(dry_run_btn, lambda: "Scan and log only. No files are written.", self.tooltips_enabled_var)
         Tooltip(tooltips_btn, lambda: "Toggle tooltip hints on or off.", self.tooltips_enabled_var)
         Tooltip(preview_btn, lambda: "Preview how files will be grouped by prefix.", self.tooltips_enabled_var)
-        Tooltip(scan_prefixes_btn, lambda: "Scan input folders and list detected prefixes.", self.tooltips_enabled_var)
+        Tooltip(self.save_plan_button, lambda: "Save the routing from the last Preview so it can be run later or on another machine.", self.tooltips_enabled_var)
+        Tooltip(self.load_plan_button, lambda: "Load a saved routing plan; Run then processes exactly those files without scanning.", self.tooltips_enabled_var)
+        Tooltip(self.resume_button, lambda: f"Continue a canceled or crashed run: files listed in {JOURNAL_NAME} in the output folder with the same settings are skipped without checking their outputs.", self.tooltips_enabled_var)
+        for pause_button, cancel_button in ((self.pause_button, self.cancel_button), (self.sheet_pause_button, self.sheet_cancel_button), (self.tile_pause_button, self.tile_cancel_button)):
+            Tooltip(pause_button, lambda: "Hold the run after the files already in progress; click again to resume.", self.tooltips_enabled_var)
+            Tooltip(cancel_button, lambda: "Stop after the files already in progress. Every output is written to a .part file and renamed when complete, so nothing is left half-written.", self.tooltips_enabled_var)
+        Tooltip(self.csv_timings_check, lambda: "Add encode_ms, bytes, per_operation, duplicate_of, decode_ms, transform_ms, write_ms, in_bytes and pixels columns to the CSV log (decode includes reading the file). A log with the other set of columns is not appended to; the run writes to name-2.csv instead.", self.tooltips_enabled_var)
+        Tooltip(self.workers_spin, lambda: "Number of processes used for pixel work (1 = run in a single thread).", self.tooltips_enabled_var)
+        Tooltip(self.pipeline_check, lambda: "Read, transform and encode/write on separate thread stages; the log reports how busy each stage was.", self.tooltips_enabled_var)
+        Tooltip(self.scan_threads_spin, lambda: "Folders listed in parallel while scanning the input (higher helps on network shares; 1 lists one folder at a time).", self.tooltips_enabled_var)
+        Tooltip(self.streaming_check, lambda: "Process files as the input walk finds them. Naming conflicts are asked about when the first one is found; the progress total grows until the walk ends.", self.tooltips_enabled_var)
+        Tooltip(self.dedupe_check, lambda: "Hashes inputs that share a file size; byte-identical files with the same color settings are converted once and the other outputs are copied (or linked, per Output strategy). The log and CSV name the output each duplicate came from.", self.tooltips_enabled_var)
+        Tooltip(self.incremental_check, lambda: f"Keeps {MANIFEST_NAME} in the output folder (size, modified time, content hash and color settings per input) and only redoes inputs whose entry changed.", self.tooltips_enabled_var)
+        Tooltip(self.output_strategy_combo, lambda: "How Rename only folders (and passed-through files) are written: copy, hardlink or reflink (fall back to copy when the drive can't), or re-encode the PNG. Hardlinked outputs share data with the originals, so editing one in place changes both.", self.tooltips_enabled_var)
+        Tooltip(self.png_profile_combo, lambda: "PNG encoder for Color Mode, spritesheet, tilemap and Layout Editor outputs: default (Pillow defaults), fast (zlib level 1), release (optimize, level 9, smallest files) or auto (benchmarks sample images and picks the strongest level that still meets the target speed).", self.tooltips_enabled_var)
+        Tooltip(self.strip_threshold_spin, lambda: "Images larger than this many megapixels are converted and encoded a strip of rows at a time, so memory use stays bounded. Set 0 to always process whole images.", self.tooltips_enabled_var)
+        Tooltip(self.png_target_spin, lambda: "Encode speed the auto profile must reach, in megapixels per second per thread.", self.tooltips_enabled_var)
+        Tooltip(self.pass_through_check, lambda: "When no pixels match, write the original file (copy or link) instead of re-encoding it.", self.tooltips_enabled_var)
+        Tooltip(self.preview_count_check, lambda: "Preview also reads each routed file and counts pixels that would change per prefix.", self.tooltips_enabled_var)
+        Tooltip(scan_prefixes_btn, lambda: "Scan input folders in the background and list detected prefixes with the number of files each would route. Click again to cancel.", self.tooltips_enabled_var)
         Tooltip(keep_prefixes_check, lambda: "Keep full filenames instead of stripping prefixes.", self.tooltips_enabled_var)
 
     def get_selected_prefixes(self):
@@ -3729,21 +3848,28 @@ class App:
         for child in self.prefix_list_frame.winfo_children():
             child.destroy()
         if not self.prefix_vars:
-            ttk.Label(self.prefix_list_frame, text="No prefixes detected. Click Scan for prefixes.").grid(row=0, column=0, sticky="w")
+            text = "Scanning for prefixes..." if self.prefix_scanning else "No prefixes detected. Click Scan for prefixes."
+            ttk.Label(self.prefix_list_frame, text=text).grid(row=0, column=0, sticky="w")
             return
         col_count = 4
         for idx, name in enumerate(sorted(self.prefix_vars, key=str.lower)):
             row = idx // col_count
             col = idx % col_count
-            ttk.Checkbutton(self.prefix_list_frame, text=name, variable=self.prefix_vars[name]).grid(row=row, column=col, padx=4, sticky="w")
+            text = f"{name} ({self.prefix_counts[name]})" if name in self.prefix_counts else name
+            ttk.Checkbutton(self.prefix_list_frame, text=text, variable=self.prefix_vars[name]).grid(row=row, column=col, padx=4, sticky="w")
 
     def set_prefixes(self, prefix_states):
         self.prefix_vars = {}
+        self.prefix_counts = {}
         for name in sorted(prefix_states, key=str.lower):
             self.prefix_vars[name] = tk.BooleanVar(value=bool(prefix_states[name]))
         self.render_prefix_checkboxes()
 
     def scan_prefixes(self):
+        if self.prefix_scanning:
+            self.prefix_scan_cancel.set()
+            self.prefix_scan_label.configure(text="Canceling...")
+            return
         input_root = self.input_var.get().strip()
         if not os.path.isdir(input_root):
             messagebox.showerror("Invalid input", "Input folder does not exist.")
@@ -3754,59 +3880,51 @@ class App:
             allowed_dirs = None
         else:
             allowed_dirs = {name for name, rule in rules.items() if rule.get("include")}
-        exclude_folders = {name.strip() for name in self.exclude_folders_var.get().split(",") if name.strip()}
-
-        prefix_re = re.compile(r"^(?P<prefix>[^_]+)_\d+_")
-        found = set()
-        top_dirs = [d for d in os.listdir(input_root) if os.path.isdir(os.path.join(input_root, d))]
-        top_dirs.sort(key=lambda s: s.lower())
-        for top in top_dirs:
-            if allowed_dirs is not None and top not in allowed_dirs:
-                continue
-            if top in exclude_folders:
-                continue
-            for root, _, files in os.walk(os.path.join(input_root, top)):
-                for file in files:
-                    if not file.lower().endswith(".png"):
-                        continue
-                    base = os.path.splitext(file)[0]
-                    match = prefix_re.match(base)
-                    if match:
-                        found.add(match.group("prefix"))
+        job = PrefixScanJob(input_root, allowed_dirs, parse_exclude_folders(self.exclude_folders_var.get()), INDEX_PATH, self.get_scan_threads())
+
+        self.prefix_scan_states = {name: var.get() for name, var in self.prefix_vars.items()}
+        self.prefix_vars = {}
+        self.prefix_counts = {}
+        self.prefix_scanning = True
+        self.prefix_scan_cancel.clear()
+        self.render_prefix_checkboxes()
+        self.scan_prefixes_button.configure(text="Cancel scan")
+        self.prefix_scan_label.configure(text="Scanning...")
 
-        if not found:
-            self.prefix_vars = {}
+        thread = threading.Thread(target=run_prefix_scan, args=(job, self.queue.put, self.prefix_scan_cancel), daemon=True)
+        thread.start()
+
+    def update_prefix_counts(self, counts):
+        for name in counts:
+            if name not in self.prefix_vars:
+                self.prefix_vars[name] = tk.BooleanVar(value=self.prefix_scan_states.get(name, True))
+        self.prefix_counts = counts
+        self.render_prefix_checkboxes()
+
+    def finish_prefix_scan(self, counts, canceled):
+        self.prefix_scanning = False
+        self.scan_prefixes_button.configure(text="Scan for prefixes")
+        self.update_prefix_counts(counts)
+        if canceled:
+            # Keep prefixes from the previous scan that were not reached yet.
+            for name, state in self.prefix_scan_states.items():
+                if name not in self.prefix_vars:
+                    self.prefix_vars[name] = tk.BooleanVar(value=state)
             self.render_prefix_checkboxes()
+            self.prefix_scan_label.configure(text="Scan canceled.")
+            return
+        self.prefix_scan_label.configure(text="")
+        if not counts:
             messagebox.showinfo("Scan complete", "No prefixes were detected.")
             return
+        messagebox.showinfo("Scan complete", f"Detected {len(counts)} prefixes.")
 
-        existing_states = {name: var.get() for name, var in self.prefix_vars.items()}
-        prefix_states = {name: existing_states.get(name, True) for name in found}
-        self.set_prefixes(prefix_states)
-        messagebox.showinfo("Scan complete", f"Detected {len(prefix_states)} prefixes.")
-
-    def detect_conflicts(self, tasks):
-        path_map = {}
-        for task in tasks:
-            if task["action"] == "skip_existing_file":
-                continue
-            path_map.setdefault(task["out_path"], []).append(task)
-        return {path: items for path, items in path_map.items() if len(items) > 1}
-
-    def apply_copy_suffixes(self, tasks, conflicts, output_root):
-        used_paths = {task["out_path"] for task in tasks}
-        for path, group in conflicts.items():
-            base_root, ext = os.path.splitext(path)
-            for task in group[1:]:
-                copy_index = 1
-                while True:
-                    candidate = f"{base_root}_copy{copy_index}{ext}"
-                    if candidate not in used_paths and not os.path.exists(candidate):
-                        break
-                    copy_index += 1
-                used_paths.add(candidate)
-                task["out_path"] = candidate
-                task["rel_out"] = os.path.relpath(candidate, output_root)
+    def ask_conflict_choice(self, groups, files):
+        self.conflict_choice = None
+        self.conflict_event.clear()
+        self.queue.put(("conflicts", groups, files))
+        self.conflict_event.wait()
+        return self.conflict_choice
 
     def pick_input(self):
         path = filedialog.askdirectory(initialdir=self.input_var.get() or os.getcwd())
@@ -3839,8 +3957,8 @@ class App:
         if not os.path.isdir(root_path):
             return
 
-        dirs = [d for d in os.listdir(root_path) if os.path.isdir(os.path.join(root_path, d))]
-        dirs.sort(key=lambda s: s.lower())
+        with InputIndex(INDEX_PATH, self.get_scan_threads()) as index:
+            dirs = index.subdirs(root_path)
         header = ttk.Frame(self.folders_container)
         header.grid(row=0, column=0, sticky="ew", padx=2)
         ttk.Label(header, text="Include", width=8).grid(row=0, column=0, sticky="w")
@@ -3901,6 +4019,9 @@ class App:
             "fill_shadows": self.fill_shadows_var.get(),
             "replace_from": self.replace_from_var.get(),
             "replace_to": self.replace_to_var.get(),
+            "replace_map": self.replace_map_var.get(),
+            "tolerance": self.get_tolerance(),
+            "operations": list(self.color_operations),
             "extra_prefixes": self.extra_prefix_var.get(),
             "keep_prefixes": self.keep_prefixes_var.get(),
             "prefixes": {name: var.get() for name, var in self.prefix_vars.items()},
@@ -3908,8 +4029,21 @@ class App:
             "skip_existing_folders": self.skip_existing_var.get(),
             "skip_existing_files": self.skip_existing_files_var.get(),
             "dry_run": self.dry_run_var.get(),
+            "preview_count_pixels": self.preview_count_pixels_var.get(),
+            "workers": self.get_worker_count(),
+            "scan_threads": self.get_scan_threads(),
+            "pipeline": self.pipeline_var.get(),
+            "streaming": self.streaming_var.get(),
+            "incremental": self.incremental_var.get(),
+            "dedupe_inputs": self.dedupe_var.get(),
+            "output_strategy": self.output_strategy_var.get(),
+            "pass_through_unchanged": self.pass_through_var.get(),
+            "strip_threshold_mp": self.get_output_config().strip_threshold_mp,
+            "png_profile": self.png_profile_var.get(),
+            "png_target_mps": self.get_encoder_config().target_mps,
             "csv_log": self.csv_log_var.get(),
             "csv_path": self.csv_path_var.get(),
+            "csv_timings": self.csv_timings_var.get(),
             "exclude_folders": self.exclude_folders_var.get(),
             "sprite_layout": self.sprite_layout_var.get(),
             "sprite_columns": self.sprite_columns_var.get(),
@@ -3957,14 +4091,33 @@ class App:
         self.fill_shadows_var.set(bool(data.get("fill_shadows", False)))
         self.replace_from_var.set(data.get("replace_from", ""))
         self.replace_to_var.set(data.get("replace_to", ""))
+        self.replace_map_var.set(data.get("replace_map", ""))
+        self.tolerance_var.set(int(data.get("tolerance") or 0))
+        self.color_operations = [dict(op) for op in data.get("operations") or [] if isinstance(op, dict)]
+        self.refresh_color_operations()
         self.extra_prefix_var.set(data.get("extra_prefixes", ""))
         self.keep_prefixes_var.set(bool(data.get("keep_prefixes", False)))
         self.process_all_var.set(bool(data.get("process_all", True)))
         self.skip_existing_var.set(bool(data.get("skip_existing_folders", True)))
         self.skip_existing_files_var.set(bool(data.get("skip_existing_files", False)))
         self.dry_run_var.set(bool(data.get("dry_run", False)))
+        self.preview_count_pixels_var.set(bool(data.get("preview_count_pixels", False)))
+        self.workers_var.set(int(data.get("workers", DEFAULT_WORKERS)))
+        self.scan_threads_var.set(int(data.get("scan_threads", SCAN_THREADS)))
+        self.pipeline_var.set(bool(data.get("pipeline", False)))
+        self.streaming_var.set(bool(data.get("streaming", False)))
+        self.incremental_var.set(bool(data.get("incremental", False)))
+        self.dedupe_var.set(bool(data.get("dedupe_inputs", False)))
+        output_strategy = data.get("output_strategy", "copy")
+        self.output_strategy_var.set(output_strategy if output_strategy in OUTPUT_STRATEGIES else "copy")
+        self.pass_through_var.set(bool(data.get("pass_through_unchanged", False)))
+        self.strip_threshold_var.set(float(data.get("strip_threshold_mp", STRIP_THRESHOLD_MP)))
+        png_profile = data.get("png_profile", "default")
+        self.png_profile_var.set(png_profile if png_profile in PNG_PROFILES else "default")
+        self.png_target_mps_var.set(float(data.get("png_target_mps", AUTO_TARGET_MPS)))
         self.csv_log_var.set(bool(data.get("csv_log", False)))
         self.csv_path_var.set(data.get("csv_path", ""))
+        self.csv_timings_var.set(bool(data.get("csv_timings", False)))
         self.exclude_folders_var.set(data.get("exclude_folders", ""))
         self.sprite_layout_var.set(data.get("sprite_layout", "Grid"))
         self.sprite_columns_var.set(int(data.get("sprite_columns", 4)))
@@ -4066,6 +4219,44 @@ class App:
         self.apply_settings(data)
         self.record_recent_preset(path)
 
+    def save_routing_plan(self):
+        if self.routing_plan is None:
+            messagebox.showinfo("No plan", "Run Preview Routing first, then save its plan.")
+            return
+        path = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("JSON files", "*.json")],
+            initialdir=APP_DIR,
+            initialfile="routing_plan.json",
+        )
+        if not path:
+            return
+        try:
+            save_plan(self.routing_plan, path)
+        except OSError as exc:
+            messagebox.showerror("Plan error", f"Failed to save plan:\n{exc}")
+            return
+        messagebox.showinfo("Plan saved", f"Saved routing plan ({len(self.routing_plan.tasks)} files) to:\n{path}")
+
+    def load_routing_plan(self):
+        if self.running or self.previewing:
+            return
+        path = filedialog.askopenfilename(
+            filetypes=[("JSON files", "*.json")],
+            initialdir=APP_DIR,
+        )
+        if not path:
+            return
+        try:
+            plan = load_plan(path)
+        except Exception as exc:
+            messagebox.showerror("Plan error", f"Failed to load plan:\n{exc}")
+            return
+        self.routing_plan = plan
+        self.status_label.configure(text=f"Plan loaded: {len(plan.tasks)} files")
+        self.log.insert(tk.END, f"Loaded routing plan {path} ({len(plan.tasks)} files). Run will use it instead of scanning; Preview Routing replaces it.\n")
+        self.log.see(tk.END)
+
     def load_recent_preset(self):
         path = self.recent_preset_var.get().strip()
         if not path:
@@ -4123,33 +4314,58 @@ class App:
         self.save_last_settings()
         self.root.destroy()
 
-    def run(self):
-        if self.running or self.sheet_running or self.tile_running:
-            return
-        if Image is None:
-            messagebox.showerror("Pillow not installed", f"Install Pillow first.\n\n{PIL_IMPORT_ERROR}")
-            return
+    def get_worker_count(self):
+        try:
+            workers = int(self.workers_var.get())
+        except (tk.TclError, ValueError):
+            workers = DEFAULT_WORKERS
+        return max(1, min(workers, MAX_POOL_WORKERS))
 
-        input_root = self.input_var.get().strip()
-        output_root = self.output_var.get().strip()
-        mode = self.mode_var.get()
+    def get_scan_threads(self):
+        try:
+            threads = int(self.scan_threads_var.get())
+        except (tk.TclError, ValueError):
+            threads = SCAN_THREADS
+        return max(1, min(threads, MAX_SCAN_THREADS))
 
-        if not os.path.isdir(input_root):
-            messagebox.showerror("Invalid input", "Input folder does not exist.")
-            return
-        if not output_root:
-            messagebox.showerror("Invalid output", "Output folder is empty.")
-            return
+    def get_tolerance(self):
+        try:
+            tolerance = int(self.tolerance_var.get())
+        except (tk.TclError, ValueError):
+            tolerance = 0
+        return max(0, min(tolerance, MAX_TOLERANCE))
 
+    def get_encoder_config(self):
+        try:
+            target = float(self.png_target_mps_var.get())
+        except (tk.TclError, ValueError):
+            target = AUTO_TARGET_MPS
+        return EncoderConfig(self.png_profile_var.get(), max(0.1, target))
+
+    def get_output_config(self):
+        try:
+            strip_threshold = float(self.strip_threshold_var.get())
+        except (tk.TclError, ValueError):
+            strip_threshold = STRIP_THRESHOLD_MP
+        return OutputConfig(self.output_strategy_var.get(), self.pass_through_var.get(), self.get_encoder_config(), max(0.0, strip_threshold))
+
+    def get_color_config(self):
+        if self.color_operations:
+            try:
+                return ColorConfig.from_operations(self.color_operations)
+            except ValueError as exc:
+                messagebox.showerror("Invalid operation chain", str(exc))
+                return None
+        mode = self.mode_var.get()
         if mode in ("transparent", "fill"):
             try:
                 color_list = parse_hex_list(self.color_list_var.get())
             except ValueError as exc:
                 messagebox.showerror("Invalid color list", str(exc))
-                return
+                return None
             if not color_list:
                 messagebox.showerror("Invalid color list", "Provide at least one hex color.")
-                return
+                return None
             target_rgbs = [hex_to_rgb(c) for c in color_list]
             replace_pair = None
             if mode == "fill":
@@ -4157,46 +4373,107 @@ class App:
                     fill_color = normalize_hex(self.fill_color_var.get())
                 except ValueError as exc:
                     messagebox.showerror("Invalid fill color", str(exc))
-                    return
+                    return None
                 fill_rgb = hex_to_rgb(fill_color)
             else:
                 fill_rgb = None
+        elif self.replace_map_var.get().strip():
+            try:
+                replace_map = parse_replace_map(self.replace_map_var.get())
+            except ValueError as exc:
+                messagebox.showerror("Invalid replace map", str(exc))
+                return None
+            return ColorConfig(mode, replace_map=replace_map, tolerance=self.get_tolerance())
         else:
             try:
                 src = normalize_hex(self.replace_from_var.get())
                 dst = normalize_hex(self.replace_to_var.get())
             except ValueError as exc:
                 messagebox.showerror("Invalid replace colors", str(exc))
-                return
+                return None
             target_rgbs = []
             replace_pair = (hex_to_rgb(src), hex_to_rgb(dst))
             fill_rgb = None
+        tolerance = self.get_tolerance() if mode != "fill" else 0
+        return ColorConfig(mode, target_rgbs, replace_pair, fill_rgb, self.fill_shadows_var.get(), tolerance=tolerance)
 
-        prefixes = self.get_selected_prefixes()
-        prefix_re = build_prefix_regex(prefixes)
-        keep_prefixes = self.keep_prefixes_var.get()
+    def get_routing_config(self):
+        input_root = self.input_var.get().strip()
+        output_root = self.output_var.get().strip()
 
-        rules = self.get_folder_rules()
+        if not os.path.isdir(input_root):
+            messagebox.showerror("Invalid input", "Input folder does not exist.")
+            return None
+        if not output_root:
+            messagebox.showerror("Invalid output", "Output folder is empty.")
+            return None
 
+        rules = self.get_folder_rules()
         if self.process_all_var.get():
             allowed_dirs = None
         else:
             allowed_dirs = {name for name, rule in rules.items() if rule.get("include")}
 
-        skip_existing = self.skip_existing_var.get()
-        skip_existing_files = self.skip_existing_files_var.get()
-        dry_run = self.dry_run_var.get()
+        return RoutingConfig(
+            input_root,
+            output_root,
+            self.get_selected_prefixes(),
+            self.keep_prefixes_var.get(),
+            rules,
+            allowed_dirs,
+            self.skip_existing_var.get(),
+            self.skip_existing_files_var.get(),
+            parse_exclude_folders(self.exclude_folders_var.get()),
+            INDEX_PATH,
+            self.get_scan_threads(),
+        )
+
+    def run(self, resume=False):
+        if self.running or self.sheet_running or self.tile_running:
+            return
+        if Image is None:
+            messagebox.showerror("Pillow not installed", f"Install Pillow first.\n\n{PIL_IMPORT_ERROR}")
+            return
+
+        routing = self.get_routing_config()
+        if routing is None:
+            return
+        colors = self.get_color_config()
+        if colors is None:
+            return
+        if resume and not os.path.exists(os.path.join(routing.output_root, JOURNAL_NAME)):
+            messagebox.showinfo("Resume last run", "No earlier run to resume in this output folder.")
+            return
+
         csv_enabled = self.csv_log_var.get()
         csv_path = self.csv_path_var.get().strip()
-        exclude_folders = {name.strip() for name in self.exclude_folders_var.get().split(",") if name.strip()}
         if csv_enabled and not csv_path:
             timestamp = time.strftime("%Y%m%d-%H%M%S")
             csv_path = os.path.join(APP_DIR, f"log-{timestamp}.csv")
             self.csv_path_var.set(csv_path)
+        job = BatchJob(
+            routing,
+            colors,
+            self.dry_run_var.get(),
+            csv_enabled,
+            csv_path,
+            self.get_worker_count(),
+            self.pipeline_var.get(),
+            self.streaming_var.get(),
+            self.incremental_var.get(),
+            self.get_output_config(),
+            self.routing_plan,
+            self.dedupe_var.get(),
+            resume,
+            self.csv_timings_var.get(),
+        )
 
         self.log.delete("1.0", tk.END)
         self.running = True
+        self.run_control = JobControl()
+        self.set_job_buttons(self.pause_button, self.cancel_button, True)
         self.run_button.configure(state="disabled")
+        self.resume_button.configure(state="disabled")
         if hasattr(self, "preview_button"):
             self.preview_button.configure(state="disabled")
         if hasattr(self, "sheet_run_button"):
@@ -4209,142 +4486,60 @@ class App:
         self.save_last_settings()
 
         thread = threading.Thread(
-            target=self.worker,
-            args=(
-                input_root,
-                output_root,
-                mode,
-                target_rgbs,
-                replace_pair,
-                fill_rgb,
-                self.fill_shadows_var.get(),
-                prefix_re,
-                keep_prefixes,
-                rules,
-                allowed_dirs,
-                skip_existing,
-                skip_existing_files,
-                exclude_folders,
-                dry_run,
-                csv_enabled,
-                csv_path,
-            ),
+            target=self.run_batch_worker,
+            args=(job, self.run_control),
             daemon=True,
         )
         thread.start()
 
+    def run_batch_worker(self, job, control):
+        # An exception would otherwise end the thread silently and leave the Run controls disabled.
+        try:
+            run_batch(job, self.queue.put, self.ask_conflict_choice, control)
+        except Exception as exc:
+            self.queue.put(("error", str(exc)))
+
+    def finish_run(self):
+        self.running = False
+        self.run_control = None
+        self.set_job_buttons(self.pause_button, self.cancel_button, False)
+        self.run_button.configure(state="normal")
+        self.resume_button.configure(state="normal")
+        if hasattr(self, "preview_button") and not self.previewing:
+            self.preview_button.configure(state="normal")
+        if hasattr(self, "sheet_run_button") and not self.sheet_running:
+            self.sheet_run_button.configure(state="normal")
+        if hasattr(self, "tile_run_button") and not self.tile_running:
+            self.tile_run_button.configure(state="normal")
+
     def preview_routing(self):
         if self.running or self.previewing or self.sheet_running or self.tile_running:
             return
 
-        input_root = self.input_var.get().strip()
-        output_root = self.output_var.get().strip()
-
-        if not os.path.isdir(input_root):
-            messagebox.showerror("Invalid input", "Input folder does not exist.")
+        routing = self.get_routing_config()
+        if routing is None:
             return
-        if not output_root:
-            messagebox.showerror("Invalid output", "Output folder is empty.")
-            return
-
-        prefixes = self.get_selected_prefixes()
-        prefix_re = build_prefix_regex(prefixes)
-        keep_prefixes = self.keep_prefixes_var.get()
-        rules = self.get_folder_rules()
-        if self.process_all_var.get():
-            allowed_dirs = None
-        else:
-            allowed_dirs = {name for name, rule in rules.items() if rule.get("include")}
 
-        skip_existing = self.skip_existing_var.get()
-        skip_existing_files = self.skip_existing_files_var.get()
-        exclude_folders = {name.strip() for name in self.exclude_folders_var.get().split(",") if name.strip()}
+        colors = None
+        if self.preview_count_pixels_var.get():
+            if Image is None:
+                messagebox.showerror("Pillow not installed", f"Install Pillow first.\n\n{PIL_IMPORT_ERROR}")
+                return
+            colors = self.get_color_config()
+            if colors is None:
+                return
+        job = PreviewJob(routing, colors, self.get_output_config())
 
         self.previewing = True
         self.run_button.configure(state="disabled")
+        self.resume_button.configure(state="disabled")
         if hasattr(self, "preview_button"):
             self.preview_button.configure(state="disabled")
         self.status_label.configure(text="Previewing...")
 
-        thread = threading.Thread(
-            target=self.preview_worker,
-            args=(
-                input_root,
-                output_root,
-                prefix_re,
-                keep_prefixes,
-                rules,
-                allowed_dirs,
-                skip_existing,
-                skip_existing_files,
-                exclude_folders,
-            ),
-            daemon=True,
-        )
+        thread = threading.Thread(target=run_preview, args=(job, self.queue.put), daemon=True)
         thread.start()
 
-    def preview_worker(self, input_root, output_root, prefix_re, keep_prefixes, rules, allowed_dirs, skip_existing, skip_existing_files, exclude_folders):
-        try:
-            counts = {}
-            total_scanned = 0
-            skipped_existing_files = 0
-            skipped_prefixes = set()
-            existing_prefix_dirs = {}
-
-            top_dirs = [d for d in os.listdir(input_root) if os.path.isdir(os.path.join(input_root, d))]
-            top_dirs.sort(key=lambda s: s.lower())
-            for top in top_dirs:
-                if allowed_dirs is not None and top not in allowed_dirs:
-                    continue
-                if top in exclude_folders:
-                    continue
-                rule = rules.get(top, {})
-                folder_mode = rule.get("mode", "Process")
-                if folder_mode == "Skip":
-                    continue
-                for root, _, files in os.walk(os.path.join(input_root, top)):
-                    for file in files:
-                        if not file.lower().endswith(".png"):
-                            continue
-                        total_scanned += 1
-                        prefix_folder = output_prefix_folder(file, prefix_re)
-                        out_dir = output_root if not prefix_folder else os.path.join(output_root, prefix_folder)
-                        if skip_existing and prefix_folder:
-                            exists = existing_prefix_dirs.get(prefix_folder)
-                            if exists is None:
-                                exists = os.path.isdir(out_dir)
-                                existing_prefix_dirs[prefix_folder] = exists
-                            if exists:
-                                skipped_prefixes.add(prefix_folder)
-                                continue
-                        out_name = output_filename(file, prefix_re, keep_prefixes)
-                        out_path = os.path.join(out_dir, out_name)
-                        if skip_existing_files and os.path.exists(out_path):
-                            skipped_existing_files += 1
-                            continue
-                        counts[prefix_folder] = counts.get(prefix_folder, 0) + 1
-
-            lines = [f"Total PNGs scanned: {total_scanned}"]
-            if counts:
-                lines.append("")
-                lines.append("Routed by prefix:")
-                sorted_items = sorted(counts.items(), key=lambda item: (item[0] != "needs_sorting", item[0]))
-                for name, count in sorted_items:
-                    lines.append(f"- {name}: {count}")
-            else:
-                lines.append("No files matched the current filters.")
-
-            if skipped_prefixes:
-                lines.append("")
-                skipped_list = ", ".join(sorted(skipped_prefixes))
-                lines.append(f"Skipped (existing prefix folders): {skipped_list}")
-            if skipped_existing_files:
-                lines.append(f"Skipped (existing files): {skipped_existing_files}")
-
-            self.queue.put(("preview", "\n".join(lines)))
-        except Exception as exc:
-            self.queue.put(("preview_error", str(exc)))
-
     def run_sprite_sheets(self):
         if self.running or self.previewing or self.sheet_running or self.tile_running:
             return
@@ -4365,101 +4560,38 @@ class App:
         except ValueError:
             messagebox.showerror("Invalid columns", "Columns must be a number.")
             return
-        exclude_folders = {name.strip() for name in self.exclude_folders_var.get().split(",") if name.strip()}
+        job = SpriteSheetJob(
+            input_root,
+            layout_mode,
+            columns,
+            padding_mode,
+            padding_value,
+            parse_exclude_folders(self.exclude_folders_var.get()),
+            INDEX_PATH,
+            self.get_scan_threads(),
+            self.get_encoder_config(),
+        )
 
         self.sheet_log.delete("1.0", tk.END)
         self.sheet_running = True
+        self.sheet_control = JobControl()
+        self.set_job_buttons(self.sheet_pause_button, self.sheet_cancel_button, True)
         self.sheet_run_button.configure(state="disabled")
         self.sheet_status_label.configure(text="Scanning...")
         self.sheet_progress.start(10)
         self.run_button.configure(state="disabled")
+        self.resume_button.configure(state="disabled")
         if hasattr(self, "preview_button"):
             self.preview_button.configure(state="disabled")
         self.tile_run_button.configure(state="disabled")
 
         thread = threading.Thread(
-            target=self.sprite_worker,
-            args=(input_root, layout_mode, columns, padding_mode, padding_value, exclude_folders),
+            target=run_sprite_sheets,
+            args=(job, self.queue.put, self.sheet_control),
             daemon=True,
         )
         thread.start()
 
-    def sprite_worker(self, input_root, layout_mode, columns, padding_mode, padding_value, exclude_folders):
-        try:
-            sheet_count = 0
-            folder_count = 0
-            for root, dirs, files in os.walk(input_root):
-                dirs[:] = [d for d in dirs if d not in ("sprite_sheets", "tilemaps")]
-                folder_name = os.path.basename(root)
-                if folder_name in exclude_folders:
-                    dirs[:] = []
-                    continue
-
-                png_files = [f for f in files if f.lower().endswith(".png")]
-                if not png_files:
-                    continue
-                folder_count += 1
-                groups = {}
-                for file in png_files:
-                    prefix = extract_group_prefix(file)
-                    groups.setdefault(prefix, []).append(file)
-
-                for prefix, group_files in groups.items():
-                    group_files.sort(key=sprite_sort_key)
-                    images = []
-                    try:
-                        for file in group_files:
-                            img = Image.open(os.path.join(root, file)).convert("RGBA")
-                            images.append(img)
-                        if not images:
-                            continue
-                        cell_w = max(img.width for img in images)
-                        cell_h = max(img.height for img in images)
-                        if padding_mode == "Frame width":
-                            pad = cell_w
-                        elif padding_mode == "Frame height":
-                            pad = cell_h
-                        else:
-                            pad = padding_value
-
-                        if layout_mode == "Horizontal":
-                            cols = len(images)
-                            rows = 1
-                        elif layout_mode == "Vertical":
-                            cols = 1
-                            rows = len(images)
-                        else:
-                            cols = max(1, columns)
-                            rows = int(math.ceil(len(images) / cols))
-
-                        sheet_w = (cols * cell_w) + (pad * max(0, cols - 1))
-                        sheet_h = (rows * cell_h) + (pad * max(0, rows - 1))
-                        sheet = Image.new("RGBA", (sheet_w, sheet_h), (0, 0, 0, 0))
-                        for idx, img in enumerate(images):
-                            row = idx // cols
-                            col = idx % cols
-                            x = col * (cell_w + pad)
-                            y = row * (cell_h + pad)
-                            sheet.paste(img, (x, y))
-
-                        out_dir = os.path.join(root, "sprite_sheets")
-                        os.makedirs(out_dir, exist_ok=True)
-                        out_name = f"{prefix}_Spritesheet.png"
-                        out_path = os.path.join(out_dir, out_name)
-                        sheet.save(out_path, format="PNG")
-                        sheet_count += 1
-
-                        rel_root = os.path.relpath(root, input_root)
-                        rel_root = "." if rel_root == "." else rel_root
-                        self.queue.put(("sheet_log", f"{rel_root} -> {out_name} ({len(images)} frames)"))
-                    finally:
-                        for img in images:
-                            img.close()
-
-            self.queue.put(("sheet_done", sheet_count, folder_count))
-        except Exception as exc:
-            self.queue.put(("sheet_error", str(exc)))
-
     def run_tilemaps(self):
         if self.running or self.previewing or self.sheet_running or self.tile_running:
             return
@@ -4479,224 +4611,62 @@ class App:
         except ValueError:
             messagebox.showerror("Invalid settings", "Tile size and columns must be numbers.")
             return
-        export_meta = self.tile_export_meta_var.get()
-        exclude_folders = {name.strip() for name in self.exclude_folders_var.get().split(",") if name.strip()}
+        job = TilemapJob(
+            input_root,
+            layout_mode,
+            columns,
+            tile_size,
+            self.tile_export_meta_var.get(),
+            parse_exclude_folders(self.exclude_folders_var.get()),
+            INDEX_PATH,
+            self.get_scan_threads(),
+            self.get_encoder_config(),
+        )
 
         self.tile_log.delete("1.0", tk.END)
         self.tile_running = True
+        self.tile_control = JobControl()
+        self.set_job_buttons(self.tile_pause_button, self.tile_cancel_button, True)
         self.tile_run_button.configure(state="disabled")
         self.tile_status_label.configure(text="Scanning...")
         self.tile_progress.start(10)
         self.run_button.configure(state="disabled")
+        self.resume_button.configure(state="disabled")
         if hasattr(self, "preview_button"):
             self.preview_button.configure(state="disabled")
         self.sheet_run_button.configure(state="disabled")
 
         thread = threading.Thread(
-            target=self.tile_worker,
-            args=(input_root, layout_mode, columns, tile_size, export_meta, exclude_folders),
+            target=run_tilemaps,
+            args=(job, self.queue.put, self.tile_control),
             daemon=True,
         )
         thread.start()
 
-    def tile_worker(self, input_root, layout_mode, columns, tile_size, export_meta, exclude_folders):
-        try:
-            tilemap_count = 0
-            folder_count = 0
-            for root, dirs, files in os.walk(input_root):
-                dirs[:] = [d for d in dirs if d not in ("sprite_sheets", "tilemaps")]
-                folder_name = os.path.basename(root)
-                if folder_name in exclude_folders:
-                    dirs[:] = []
-                    continue
-
-                png_files = sorted([f for f in files if f.lower().endswith(".png")], key=lambda s: s.lower())
-                if not png_files:
-                    continue
-                folder_count += 1
-                images = []
-                try:
-                    for file in png_files:
-                        img = Image.open(os.path.join(root, file)).convert("RGBA")
-                        images.append((file, img))
-
-                    if not images:
-                        continue
-
-                    max_w = max(img.width for _, img in images)
-                    max_h = max(img.height for _, img in images)
-                    cell_w = max(tile_size, max_w)
-                    cell_h = max(tile_size, max_h)
-
-                    if layout_mode == "Horizontal":
-                        cols = len(images)
-                        rows = 1
-                    elif layout_mode == "Vertical":
-                        cols = 1
-                        rows = len(images)
-                    else:
-                        cols = max(1, columns)
-                        rows = int(math.ceil(len(images) / cols))
-
-                    tilemap = Image.new("RGBA", (cols * cell_w, rows * cell_h), (0, 0, 0, 0))
-                    metadata = []
-                    for idx, (file, img) in enumerate(images):
-                        row = idx // cols
-                        col = idx % cols
-                        x = col * cell_w
-                        y = row * cell_h
-                        tilemap.paste(img, (x, y))
-                        metadata.append((file, x, y, img.width, img.height))
-
-                    out_dir = os.path.join(root, "tilemaps")
-                    os.makedirs(out_dir, exist_ok=True)
-                    out_name = f"{folder_name}_tilemap.png"
-                    out_path = os.path.join(out_dir, out_name)
-                    tilemap.save(out_path, format="PNG")
-
-                    if export_meta:
-                        meta_path = os.path.join(out_dir, f"{folder_name}_tilemap.csv")
-                        with open(meta_path, "w", newline="", encoding="utf-8") as handle:
-                            writer = csv.writer(handle)
-                            writer.writerow(["tilemap", "tile", "x", "y", "width", "height"])
-                            for file, x, y, w, h in metadata:
-                                writer.writerow([out_name, file, x, y, w, h])
-
-                    tilemap_count += 1
-                    rel_root = os.path.relpath(root, input_root)
-                    rel_root = "." if rel_root == "." else rel_root
-                    self.queue.put(("tile_log", f"{rel_root} -> {out_name} ({len(images)} tiles)"))
-                finally:
-                    for _, img in images:
-                        img.close()
-
-            self.queue.put(("tile_done", tilemap_count, folder_count))
-        except Exception as exc:
-            self.queue.put(("tile_error", str(exc)))
-
-    def worker(self, input_root, output_root, mode, target_rgbs, replace_pair, fill_rgb, fill_shadows, prefix_re, keep_prefixes, rules, allowed_dirs, skip_existing, skip_existing_files, exclude_folders, dry_run, csv_enabled, csv_path):
-        tasks = []
-        existing_prefix_dirs = {}
-        top_dirs = [d for d in os.listdir(input_root) if os.path.isdir(os.path.join(input_root, d))]
-        top_dirs.sort(key=lambda s: s.lower())
-        for top in top_dirs:
-            if allowed_dirs is not None and top not in allowed_dirs:
-                continue
-            if top in exclude_folders:
-                continue
-            rule = rules.get(top, {})
-            folder_mode = rule.get("mode", "Process")
-            if folder_mode == "Skip":
-                continue
-            custom_colors = rule.get("colors", "").strip()
-            for root, _, files in os.walk(os.path.join(input_root, top)):
-                for file in files:
-                    if not file.lower().endswith(".png"):
-                        continue
-                    in_path = os.path.join(root, file)
-                    prefix_folder = output_prefix_folder(file, prefix_re)
-                    out_dir = output_root if not prefix_folder else os.path.join(output_root, prefix_folder)
-                    if skip_existing and prefix_folder:
-                        exists = existing_prefix_dirs.get(prefix_folder)
-                        if exists is None:
-                            exists = os.path.isdir(out_dir)
-                            existing_prefix_dirs[prefix_folder] = exists
-                        if exists:
-                            continue
-                    out_name = output_filename(file, prefix_re, keep_prefixes)
-                    out_path = os.path.join(out_dir, out_name)
-                    action = "process"
-                    if skip_existing_files and os.path.exists(out_path):
-                        action = "skip_existing_file"
-                    tasks.append({
-                        "in_path": in_path,
-                        "out_path": out_path,
-                        "rel_in": os.path.relpath(in_path, input_root),
-                        "rel_out": os.path.relpath(out_path, output_root),
-                        "folder_mode": folder_mode,
-                        "custom_colors": custom_colors,
-                        "action": action,
-                    })
-
-        total = len(tasks)
-        if total == 0:
-            self.queue.put(("log", "No files to process."))
-            self.queue.put(("status", "Done"))
-            self.queue.put(("done", 0, 0, 0))
-            return
-
-        conflicts = self.detect_conflicts(tasks)
-        if conflicts:
-            self.conflict_choice = None
-            self.conflict_event.clear()
-            conflict_files = sum(len(items) for items in conflicts.values())
-            self.queue.put(("conflicts", len(conflicts), conflict_files))
-            self.conflict_event.wait()
-            if self.conflict_choice == "cancel" or self.conflict_choice is None:
-                self.queue.put(("log", "Canceled due to naming conflicts."))
-                self.queue.put(("status", "Canceled"))
-                self.queue.put(("done", 0, 0, 0))
-                return
-            if self.conflict_choice == "copy":
-                self.apply_copy_suffixes(tasks, conflicts, output_root)
+    def set_job_buttons(self, pause_button, cancel_button, active):
+        state = "normal" if active else "disabled"
+        pause_button.configure(text="Pause", state=state)
+        cancel_button.configure(state=state)
 
-        if csv_enabled:
-            ensure_csv_header(csv_path)
-            csv_handle = open(csv_path, "a", newline="", encoding="utf-8")
-            csv_writer = csv.writer(csv_handle)
+    def toggle_pause(self, control, pause_button, status_label):
+        if control is None or control.is_canceled():
+            return
+        if control.is_paused():
+            control.resume()
+            pause_button.configure(text="Pause")
+            status_label.configure(text="Resumed")
         else:
-            csv_handle = None
-            csv_writer = None
-
-        start = time.time()
-        processed = 0
-        total_converted = 0
-        logged_files = 0
-
-        for task in tasks:
-            action = task["action"]
-            converted = 0
-
-            if action == "skip_existing_file":
-                pass
-            elif task["folder_mode"] == "Rename only":
-                if not dry_run:
-                    os.makedirs(os.path.dirname(task["out_path"]), exist_ok=True)
-                    shutil.copy2(task["in_path"], task["out_path"])
-                action = "rename_only"
-            else:
-                active_colors = target_rgbs
-                if mode == "transparent" and task["folder_mode"] == "Custom colors" and task["custom_colors"]:
-                    try:
-                        custom_list = parse_hex_list(task["custom_colors"])
-                        active_colors = [hex_to_rgb(c) for c in custom_list]
-                    except ValueError:
-                        action = "invalid_custom_colors"
-                    else:
-                        converted = process_image(task["in_path"], task["out_path"], mode, active_colors, replace_pair, fill_rgb, fill_shadows, dry_run)
-                else:
-                    converted = process_image(task["in_path"], task["out_path"], mode, active_colors, replace_pair, fill_rgb, fill_shadows, dry_run)
-
-            if converted > 0:
-                logged_files += 1
-                self.queue.put(("log", f"{task['rel_in']} -> {task['rel_out']} | converted: {converted}"))
+            control.pause()
+            pause_button.configure(text="Resume")
+            status_label.configure(text="Paused")
 
-            if csv_writer is not None:
-                csv_writer.writerow([task["rel_in"], task["rel_out"], action, converted])
-
-            total_converted += converted
-            processed += 1
-
-            if processed % 10 == 0 or processed == total:
-                elapsed = time.time() - start
-                eta = (elapsed / processed) * (total - processed) if processed else 0
-                self.queue.put(("progress", processed, total, eta))
-
-        if csv_handle is not None:
-            csv_handle.close()
-
-        self.queue.put(("status", "Done"))
-        self.queue.put(("done", total, logged_files, total_converted))
+    def cancel_job(self, control, pause_button, cancel_button, status_label):
+        if control is None:
+            return
+        control.cancel()
+        pause_button.configure(text="Pause", state="disabled")
+        cancel_button.configure(state="disabled")
+        status_label.configure(text="Canceling...")
 
     def poll_queue(self):
         try:
@@ -4712,7 +4682,9 @@ class App:
                         self.progress.configure(maximum=total, value=processed)
                         if total:
                             eta_str = time.strftime("%M:%S", time.gmtime(eta))
-                            self.status_label.configure(text=f"{processed}/{total} | ETA {eta_str}")
+                            # Files already in flight keep reporting while the run is paused.
+                            paused = " | Paused" if self.run_control is not None and self.run_control.is_paused() else ""
+                            self.status_label.configure(text=f"{processed}/{total} | ETA {eta_str}{paused}")
                     elif kind == "status":
                         self.status_label.configure(text=msg[1])
                     elif kind == "done":
@@ -4724,14 +4696,13 @@ class App:
                         )
                         if self.dry_run_var.get():
                             self.log.insert(tk.END, "Dry run mode: no files were written.\n")
-                        self.running = False
-                        self.run_button.configure(state="normal")
-                        if hasattr(self, "preview_button") and not self.previewing:
-                            self.preview_button.configure(state="normal")
-                        if hasattr(self, "sheet_run_button") and not self.sheet_running:
-                            self.sheet_run_button.configure(state="normal")
-                        if hasattr(self, "tile_run_button") and not self.tile_running:
-                            self.tile_run_button.configure(state="normal")
+                        self.finish_run()
+                    elif kind == "error":
+                        self.log.insert(tk.END, f"\nError: {msg[1]}\n")
+                        self.log.see(tk.END)
+                        self.status_label.configure(text="Error")
+                        self.finish_run()
+                        messagebox.showerror("Run error", msg[1])
                     elif kind == "conflicts":
                         groups, files = msg[1], msg[2]
                         prompt = (
@@ -4752,18 +4723,21 @@ class App:
                         self.sheet_log.insert(tk.END, msg[1] + "\n")
                         self.sheet_log.see(tk.END)
                     elif kind == "sheet_done":
-                        sheet_count, folder_count = msg[1], msg[2]
+                        sheet_count, folder_count, canceled = msg[1], msg[2], msg[3]
                         self.sheet_log.insert(tk.END, "\n")
                         self.sheet_log.insert(
                             tk.END,
-                            f"Done. Sheets created: {sheet_count}, folders scanned: {folder_count}\n",
+                            f"{'Canceled' if canceled else 'Done'}. Sheets created: {sheet_count}, folders scanned: {folder_count}\n",
                         )
                         self.sheet_running = False
+                        self.sheet_control = None
+                        self.set_job_buttons(self.sheet_pause_button, self.sheet_cancel_button, False)
                         self.sheet_progress.stop()
-                        self.sheet_status_label.configure(text="Done")
+                        self.sheet_status_label.configure(text="Canceled" if canceled else "Done")
                         self.sheet_run_button.configure(state="normal")
                         if not self.running and not self.tile_running:
                             self.run_button.configure(state="normal")
+                            self.resume_button.configure(state="normal")
                             if hasattr(self, "preview_button"):
                                 self.preview_button.configure(state="normal")
                             if hasattr(self, "tile_run_button"):
@@ -4771,11 +4745,14 @@ class App:
                     elif kind == "sheet_error":
                         messagebox.showerror("Sprite sheet error", msg[1])
                         self.sheet_running = False
+                        self.sheet_control = None
+                        self.set_job_buttons(self.sheet_pause_button, self.sheet_cancel_button, False)
                         self.sheet_progress.stop()
                         self.sheet_status_label.configure(text="")
                         self.sheet_run_button.configure(state="normal")
                         if not self.running and not self.tile_running:
                             self.run_button.configure(state="normal")
+                            self.resume_button.configure(state="normal")
                             if hasattr(self, "preview_button"):
                                 self.preview_button.configure(state="normal")
                             if hasattr(self, "tile_run_button"):
@@ -4784,18 +4761,21 @@ class App:
                         self.tile_log.insert(tk.END, msg[1] + "\n")
                         self.tile_log.see(tk.END)
                     elif kind == "tile_done":
-                        tile_count, folder_count = msg[1], msg[2]
+                        tile_count, folder_count, canceled = msg[1], msg[2], msg[3]
                         self.tile_log.insert(tk.END, "\n")
                         self.tile_log.insert(
                             tk.END,
-                            f"Done. Tilemaps created: {tile_count}, folders scanned: {folder_count}\n",
+                            f"{'Canceled' if canceled else 'Done'}. Tilemaps created: {tile_count}, folders scanned: {folder_count}\n",
                         )
                         self.tile_running = False
+                        self.tile_control = None
+                        self.set_job_buttons(self.tile_pause_button, self.tile_cancel_button, False)
                         self.tile_progress.stop()
-                        self.tile_status_label.configure(text="Done")
+                        self.tile_status_label.configure(text="Canceled" if canceled else "Done")
                         self.tile_run_button.configure(state="normal")
                         if not self.running and not self.sheet_running:
                             self.run_button.configure(state="normal")
+                            self.resume_button.configure(state="normal")
                             if hasattr(self, "preview_button"):
                                 self.preview_button.configure(state="normal")
                             if hasattr(self, "sheet_run_button"):
@@ -4803,23 +4783,38 @@ class App:
                     elif kind == "tile_error":
                         messagebox.showerror("Tilemap error", msg[1])
                         self.tile_running = False
+                        self.tile_control = None
+                        self.set_job_buttons(self.tile_pause_button, self.tile_cancel_button, False)
                         self.tile_progress.stop()
                         self.tile_status_label.configure(text="")
                         self.tile_run_button.configure(state="normal")
                         if not self.running and not self.sheet_running:
                             self.run_button.configure(state="normal")
+                            self.resume_button.configure(state="normal")
                             if hasattr(self, "preview_button"):
                                 self.preview_button.configure(state="normal")
                             if hasattr(self, "sheet_run_button"):
                                 self.sheet_run_button.configure(state="normal")
                     elif kind == "preview":
+                        self.routing_plan = msg[2]
                         messagebox.showinfo("Preview routing", msg[1])
                         self.previewing = False
                         if hasattr(self, "preview_button"):
                             self.preview_button.configure(state="normal")
                         if not self.running:
                             self.run_button.configure(state="normal")
+                            self.resume_button.configure(state="normal")
                         self.status_label.configure(text="")
+                    elif kind == "prefix_progress":
+                        counts, scanned, done, total = msg[1], msg[2], msg[3], msg[4]
+                        self.update_prefix_counts(counts)
+                        if not self.prefix_scan_cancel.is_set():
+                            self.prefix_scan_label.configure(text=f"Scanning... {done}/{total} folders, {scanned} PNGs")
+                    elif kind == "prefix_done":
+                        self.finish_prefix_scan(msg[1], msg[3])
+                    elif kind == "prefix_error":
+                        self.finish_prefix_scan({}, True)
+                        messagebox.showerror("Scan error", msg[1])
                     elif kind == "preview_error":
                         messagebox.showerror("Preview error", msg[1])
                         self.previewing = False
@@ -4827,6 +4822,7 @@ class App:
                             self.preview_button.configure(state="normal")
                         if not self.running:
                             self.run_button.configure(state="normal")
+                            self.resume_button.configure(state="normal")
                         self.status_label.configure(text="")
                 else:
                     self.log.insert(tk.END, str(msg) + "\n")
@@ -4837,6 +4833,7 @@ class App:
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     if TkinterDnD is not None:
         root = TkinterDnD.Tk()
     else:
@@ -0,0 +1,45 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+
+def write_png(path, array):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.fromarray(array).save(path)
+
+
+@pytest.fixture
+def settings(tmp_path):
+    """Color Mode settings for tmp_path/in -> tmp_path/out: green becomes transparent."""
+    return {
+        "input": str(tmp_path / "in"),
+        "output": str(tmp_path / "out"),
+        "mode": "transparent",
+        "color_list": "#00FF00",
+        "prefixes": {"Characters": True},
+        "process_all": True,
+        "skip_existing_folders": False,
+        "workers": 1,
+    }
+
+
+@pytest.fixture
+def sprites(tmp_path):
+    """Random RGBA images with a green band, one per call: sprites(rel_path, seed)."""
+
+    def make(rel_path, seed=0, size=(24, 32)):
+        rng = np.random.default_rng(seed)
+        array = rng.integers(0, 256, (size[1], size[0], 4), dtype=np.uint8)
+        array[2:6, :, :3] = (0, 255, 0)
+        path = str(tmp_path / "in" / rel_path)
+        write_png(path, array)
+        return path
+
+    return make
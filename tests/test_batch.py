@@ -0,0 +1,199 @@
+import json
+import os
+
+import pytest
+
+import chromaforge_engine as engine
+
+
+def run(job, control=None, conflicts="copy"):
+    events = []
+    engine.run_batch(job, events.append, lambda groups, files: conflicts, control)
+    return events
+
+
+def logs(events):
+    return [event[1] for event in events if event[0] == "log"]
+
+
+def test_cancel_with_dedupe_skips_duplicates_of_canceled_files(settings, sprites, monkeypatch):
+    # Pipeline duplicates skip the transform stage, so one can arrive after its
+    # first copy was dropped by a cancel.
+    sprites("A/Characters_1_x1.png", seed=1)
+    sprites("B/Characters_2_x2.png", seed=1)
+    job = engine.BatchJob.from_settings(dict(settings, pipeline=True, streaming=True, dedupe_inputs=True), "")
+    control = engine.JobControl()
+    control.cancel()
+
+    def cancel_first_copy(tasks, *args):
+        for task in tasks:
+            if task["action"] == "duplicate":
+                yield task, ("duplicate", [], 0.0, 0, {}, {})
+            else:
+                yield task, engine.CANCELED_RESULT
+
+    monkeypatch.setattr(engine, "iter_pipeline_results", cancel_first_copy)
+    events = run(job, control)
+    assert [event for event in events if event[0] == "error"] == []
+    assert ("status", "Canceled") in events
+    assert events[-1] == ("done", 0, 0, 0)
+
+
+def test_cancel_with_dedupe_mid_run(settings, sprites, tmp_path):
+    for index in range(40):
+        sprites(f"A/Characters_{index}_x{index}.png", seed=index % 4)
+    job = engine.BatchJob.from_settings(dict(settings, pipeline=True, streaming=True, dedupe_inputs=True, workers=2), "")
+    control = engine.JobControl()
+    events = []
+
+    def emit(event):
+        events.append(event)
+        if event[0] == "progress" and event[1] >= 10:
+            control.cancel()
+
+    engine.run_batch(job, emit, lambda groups, files: "copy", control)
+    assert [event for event in events if event[0] == "error"] == []
+    assert ("status", "Canceled") in events
+    assert not list(tmp_path.glob("out/**/*.part"))
+
+
+def conflicting_inputs(sprites):
+    # Both route to characters/x1.png.
+    sprites("A/Characters_1_x1.png", seed=1)
+    sprites("B/Characters_1_x1.png", seed=2)
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_incremental_reruns_reuse_copy_suffix(settings, sprites, tmp_path, streaming):
+    conflicting_inputs(sprites)
+    job = engine.BatchJob.from_settings(dict(settings, incremental=True, streaming=streaming), "")
+    for _ in range(4):
+        events = run(job)
+    assert sorted(path.name for path in tmp_path.glob("out/characters/*.png")) == ["x1.png", "x1_copy1.png"]
+    assert "Unchanged since last run (skipped): 2" in logs(events)
+
+
+def test_resume_reuses_copy_suffix(settings, sprites, tmp_path):
+    conflicting_inputs(sprites)
+    run(engine.BatchJob.from_settings(settings, ""))
+    job = engine.BatchJob.from_settings(settings, "")
+    job.resume = True
+    events = run(job)
+    assert sorted(path.name for path in tmp_path.glob("out/characters/*.png")) == ["x1.png", "x1_copy1.png"]
+    assert "Already done by the interrupted run (skipped): 2" in logs(events)
+
+
+def test_saved_plan_rejects_paths_outside_the_folders(settings, sprites, tmp_path):
+    sprites("A/Characters_1_x1.png", seed=1)
+    sprites("../outside/Characters_2_x2.png", seed=2)
+
+    def entry(rel_in, rel_out):
+        return {"rel_in": rel_in, "rel_out": rel_out, "folder_mode": "Process", "custom_colors": "", "action": "process"}
+
+    plan_path = str(tmp_path / "plan.json")
+    engine.save_plan(engine.RoutingPlan("", [
+        entry("A/Characters_1_x1.png", "characters/x1.png"),
+        entry("A/Characters_1_x1.png", "../escaped.png"),
+        entry("A/Characters_1_x1.png", str(tmp_path / "absolute.png")),
+        entry("../outside/Characters_2_x2.png", "characters/x2.png"),
+        entry("A/../../outside/Characters_2_x2.png", "characters/x3.png"),
+    ]), plan_path)
+    job = engine.BatchJob.from_settings(settings, "")
+    job.plan = engine.load_plan(plan_path)
+    events = run(job)
+    assert "Invalid plan entries outside the input/output folder (skipped): 4" in logs(events)
+    assert events[-1][0] == "done" and events[-1][1] == 1
+    assert sorted(path.name for path in tmp_path.glob("out/**/*.png")) == ["x1.png"]
+    assert not (tmp_path / "escaped.png").exists()
+    assert not (tmp_path / "absolute.png").exists()
+
+
+def test_csv_log_with_other_columns_is_not_appended_to(settings, sprites, tmp_path):
+    sprites("A/Characters_1_x1.png")
+    old_log = tmp_path / "log.csv"
+    old_rows = b"input,output,action,converted,encode_ms\r\nold.png,old.png,process,3,1.0\r\n"
+    old_log.write_bytes(old_rows)
+    job = engine.BatchJob.from_settings(dict(settings, csv_log=True, csv_path=str(old_log), csv_timings=True), "")
+    events = run(job)
+    run(job)
+    assert old_log.read_bytes() == old_rows
+    assert any("writing to" in line and "log-2.csv" in line for line in logs(events))
+    rows = (tmp_path / "log-2.csv").read_text(encoding="utf-8").splitlines()
+    assert rows[0] == ",".join(engine.CSV_COLUMNS + engine.CSV_TIMING_COLUMNS)
+    assert len(rows) == 3
+    assert len(rows[1].split(",")) == len(engine.CSV_COLUMNS + engine.CSV_TIMING_COLUMNS)
+
+    run(engine.BatchJob.from_settings(dict(settings, csv_log=True, csv_path=str(old_log)), ""))
+    rows = (tmp_path / "log-3.csv").read_text(encoding="utf-8").splitlines()
+    assert rows[0] == "input,output,action,converted"
+    assert len(rows) == 2
+
+
+def test_default_csv_log_appends_to_a_baseline_log(settings, sprites, tmp_path):
+    sprites("A/Characters_1_x1.png")
+    log = tmp_path / "log.csv"
+    log.write_bytes(b"input,output,action,converted\r\nold.png,old.png,process,3\r\n")
+    events = run(engine.BatchJob.from_settings(dict(settings, csv_log=True, csv_path=str(log)), ""))
+    assert not any("writing to" in line for line in logs(events))
+    rows = log.read_text(encoding="utf-8").splitlines()
+    assert rows[1] == "old.png,old.png,process,3"
+    assert rows[2].split(",")[2:] == ["process", "96"] and len(rows) == 3
+
+
+def output_bytes(root):
+    return {path.relative_to(root).as_posix(): path.read_bytes() for path in sorted(root.rglob("*.png"))}
+
+
+@pytest.mark.parametrize("pipeline", [False, True])
+@pytest.mark.parametrize("streaming", [False, True])
+def test_overwrite_with_workers_matches_serial(settings, sprites, tmp_path, pipeline, streaming):
+    for index in range(12):
+        sprites(f"{index:02d}/Characters_1_x1.png", seed=index)
+        sprites(f"{index:02d}/Characters_{index + 2}_x{index + 2}.png", seed=index + 20)
+    serial = engine.BatchJob.from_settings(dict(settings, output=str(tmp_path / "serial")), "")
+    run(serial, conflicts="overwrite")
+    job = engine.BatchJob.from_settings(dict(settings, workers=4, pipeline=pipeline, streaming=streaming), "")
+    events = run(job, conflicts="overwrite")
+    assert [event for event in events if event[0] == "error"] == []
+    assert output_bytes(tmp_path / "out") == output_bytes(tmp_path / "serial")
+    assert not list(tmp_path.glob("out/**/*.part"))
+
+
+def test_streaming_skip_existing_files_matches_full_walk(settings, sprites, tmp_path):
+    conflicting_inputs(sprites)
+    sprites("C/Characters_2_x2.png", seed=3)
+    results = {}
+    for streaming in (False, True):
+        out = tmp_path / f"out_{streaming}"
+        (out / "characters").mkdir(parents=True)
+        (out / "characters" / "x2.png").write_bytes(b"old")
+        job = engine.BatchJob.from_settings(dict(settings, output=str(out), skip_existing_files=True, streaming=streaming), "")
+        events = run(job)
+        results[streaming] = (output_bytes(out), events[-1])
+    assert results[True] == results[False]
+    assert sorted(results[True][0]) == ["characters/x1.png", "characters/x1_copy1.png", "characters/x2.png"]
+
+
+def test_outputs_are_fsynced_before_they_are_journaled(settings, sprites, tmp_path, monkeypatch):
+    for index in range(3):
+        sprites(f"A/Characters_{index}_x{index}.png", seed=index)
+    journal_path = str(tmp_path / "out" / engine.JOURNAL_NAME)
+    synced = []
+
+    def record(path):
+        # Every record already in the journal must have had its output synced.
+        if os.path.exists(journal_path):
+            with open(journal_path, encoding="utf-8") as handle:
+                for line in handle:
+                    entry = json.loads(line)
+                    if isinstance(entry, list):
+                        assert os.path.join(str(tmp_path / "out"), entry[1]) in synced
+        synced.append(path)
+
+    monkeypatch.setattr(engine, "fsync_path", record)
+    monkeypatch.setattr(engine, "JOURNAL_BATCH", 2)
+    run(engine.BatchJob.from_settings(settings, ""))
+    outputs = [str(path) for path in tmp_path.glob("out/characters/*.png")]
+    assert len(outputs) == 3
+    assert set(outputs) <= set(synced)
+    assert str(tmp_path / "out" / "characters") in synced
@@ -0,0 +1,18 @@
+import json
+
+import chromaforge_cli as cli
+import chromaforge_engine as engine
+
+
+def test_tolerance_applies_to_every_operation(tmp_path):
+    settings_path = tmp_path / "settings.json"
+    settings_path.write_text(json.dumps({
+        "operations": [
+            {"mode": "transparent", "color_list": "#00FF00", "tolerance": 5},
+            {"mode": "replace", "replace_from": "#FF0000", "replace_to": "#0000FF"},
+            {"mode": "fill", "fill_color": "#010203"},
+        ],
+    }), encoding="utf-8")
+    args = cli.build_parser().parse_args([str(settings_path), "--tolerance", "30"])
+    steps = engine.ColorConfig.from_settings(cli.load_settings(args)).steps()
+    assert [step.tolerance for step in steps] == [30, 30, 0]
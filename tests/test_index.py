@@ -0,0 +1,75 @@
+import os
+import sqlite3
+
+import pytest
+
+import chromaforge_index
+from chromaforge_index import InputIndex
+
+
+def make_tree(root):
+    os.makedirs(os.path.join(root, "A", "B"))
+    for rel in ("A/one.png", "A/B/two.png"):
+        with open(os.path.join(root, rel), "wb") as handle:
+            handle.write(b"png")
+    try:
+        os.symlink("..", os.path.join(root, "A", "loop"), target_is_directory=True)
+    except (OSError, NotImplementedError):
+        pytest.skip("symlinks are not available")
+
+
+@pytest.mark.parametrize("threads", [1, 4])
+@pytest.mark.parametrize("cached", [False, True])
+def test_walk_does_not_follow_symlinked_folders(tmp_path, threads, cached):
+    make_tree(str(tmp_path))
+    top = str(tmp_path / "A")
+    db_path = str(tmp_path / "index.sqlite") if cached else None
+    for _ in range(2 if cached else 1):
+        with InputIndex(db_path, threads) as index:
+            walked = [(os.path.relpath(root, top), dirs, files) for root, dirs, files in index.walk(top)]
+    assert walked == [(".", ["B"], ["one.png"]), ("B", [], ["two.png"])]
+
+
+def walk_names(index, top):
+    return [(os.path.relpath(root, top), dirs, files) for root, dirs, files in index.walk(top)]
+
+
+@pytest.mark.parametrize("threads", [1, 4])
+def test_suspended_walk_does_not_lock_other_instances(tmp_path, monkeypatch, threads):
+    monkeypatch.setattr(chromaforge_index, "LOCK_TIMEOUT", 0.5)
+    for top in ("first", "second"):
+        for name in ("A", "B", "C"):
+            os.makedirs(str(tmp_path / top / name))
+    db_path = str(tmp_path / "index.sqlite")
+    with InputIndex(db_path, threads) as first:
+        walk = first.walk(str(tmp_path / "first"))
+        next(walk)
+        next(walk)
+        with InputIndex(db_path, threads) as second:
+            assert len(walk_names(second, str(tmp_path / "second"))) == 4
+            assert second.listed == 4
+        walk.close()
+    with InputIndex(db_path, threads) as third:
+        walk_names(third, str(tmp_path / "second"))
+        assert third.listed == 0
+
+
+def test_locked_index_falls_back_to_listing(tmp_path, monkeypatch):
+    monkeypatch.setattr(chromaforge_index, "LOCK_TIMEOUT", 0.1)
+    make_tree(str(tmp_path / "tree"))
+    top = str(tmp_path / "tree" / "A")
+    db_path = str(tmp_path / "index.sqlite")
+    with InputIndex(db_path) as index:
+        expected = walk_names(index, top)
+    os.remove(str(tmp_path / "tree" / "A" / "one.png"))
+    expected[0][2].remove("one.png")
+    holder = sqlite3.connect(db_path)
+    holder.execute("BEGIN IMMEDIATE")
+    try:
+        with InputIndex(db_path) as index:
+            assert walk_names(index, top) == expected
+    finally:
+        holder.rollback()
+        holder.close()
+    with InputIndex(db_path) as index:
+        assert walk_names(index, top) == expected
@@ -0,0 +1,140 @@
+import csv
+import os
+import shutil
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import chromaforge_engine as engine
+
+
+@pytest.fixture
+def tree(settings, sprites, tmp_path):
+    """Three top folders (one Rename only) and the serial full-walk run of them into tmp_path/serial."""
+    for index in range(10):
+        sprites(f"A/Characters_{index}_a{index}.png", seed=index)
+    for index in range(6):
+        sprites(f"B/sub/Items_{index}_b{index}.png", seed=20 + index)
+    sprites("B/loose.png", seed=40)
+    for index in range(4):
+        sprites(f"R/Characters_{index}_r{index}.png", seed=50 + index)
+    settings = dict(
+        settings,
+        prefixes={"Characters": True, "Items": True},
+        folder_rules={"R": {"mode": "Rename only"}},
+        csv_log=True,
+    )
+    serial = batch(settings, tmp_path / "serial")
+    return settings, serial
+
+
+def batch(settings, out, conflicts="copy", plan=None, index_path=None, **overrides):
+    """Run a batch into out; returns (output bytes, CSV rows, done event, log lines)."""
+    settings = dict(settings, output=str(out), csv_path=str(out) + ".csv", **overrides)
+    job = engine.BatchJob.from_settings(settings, "", index_path)
+    job.plan = plan
+    events = []
+    engine.run_batch(job, events.append, lambda groups, files: conflicts)
+    assert [event for event in events if event[0] == "error"] == []
+    with open(job.csv_path, newline="", encoding="utf-8") as handle:
+        rows = list(csv.reader(handle))
+    outputs = {path.relative_to(out).as_posix(): path.read_bytes() for path in sorted(out.rglob("*.png"))}
+    return outputs, rows, events[-1], [event[1] for event in events if event[0] == "log"]
+
+
+@pytest.mark.parametrize("overrides", [
+    {"workers": 4},
+    {"workers": 2, "pipeline": True},
+    {"streaming": True},
+    {"workers": 3, "pipeline": True, "streaming": True},
+], ids=["pool", "pipeline", "streaming", "streaming-pipeline-pool"])
+def test_parallel_and_streaming_runs_match_serial(tree, tmp_path, overrides):
+    settings, serial = tree
+    outputs, rows, done, _ = batch(settings, tmp_path / "out", **overrides)
+    assert len(serial[0]) == 21
+    assert outputs == serial[0]
+    assert rows == serial[1]
+    assert done == serial[2]
+
+
+def rgba(path):
+    with Image.open(path) as img:
+        return np.asarray(img.convert("RGBA"))
+
+
+@pytest.mark.parametrize("strategy", ["copy", "hardlink", "reflink", "re-encode"])
+def test_output_strategies_match_the_input(tree, tmp_path, strategy):
+    settings, serial = tree
+    outputs, rows, done, _ = batch(settings, tmp_path / "out", output_strategy=strategy, workers=2)
+    assert sorted(outputs) == sorted(serial[0])
+    assert done == serial[2]
+    for index in range(4):
+        in_path = tmp_path / "in" / "R" / f"Characters_{index}_r{index}.png"
+        out_path = tmp_path / "out" / "characters" / f"r{index}.png"
+        assert np.array_equal(rgba(out_path), rgba(in_path))
+        if strategy != "re-encode":
+            assert out_path.read_bytes() == in_path.read_bytes()
+        if strategy == "hardlink":
+            assert os.path.samefile(str(out_path), str(in_path))
+    # Converted files do not depend on the strategy.
+    assert {name: data for name, data in outputs.items() if "/a" in name} == {
+        name: data for name, data in serial[0].items() if "/a" in name
+    }
+
+
+def test_overwriting_hardlinked_outputs_leaves_the_inputs_alone(tree, tmp_path):
+    settings, _ = tree
+    inputs = {path: path.read_bytes() for path in (tmp_path / "in" / "R").iterdir()}
+    batch(settings, tmp_path / "out", output_strategy="hardlink")
+    batch(settings, tmp_path / "out", conflicts="overwrite", output_strategy="re-encode", png_profile="fast")
+    assert {path: path.read_bytes() for path in inputs} == inputs
+
+
+def preview_plan(settings):
+    events = []
+    engine.run_preview(engine.PreviewJob.from_settings(settings), events.append)
+    return [event for event in events if event[0] == "preview"][0][2]
+
+
+def test_preview_plan_is_reused_until_the_input_changes(tree, sprites, tmp_path):
+    settings, serial = tree
+    settings = dict(settings, output=str(tmp_path / "out"))
+    plan = preview_plan(settings)
+    outputs, rows, done, logs = batch(settings, tmp_path / "out", plan=plan)
+    assert "Using the routing from Preview Routing: 21 file(s)." in logs
+    assert (outputs, rows, done) == serial[:3]
+
+    plan = preview_plan(settings)
+    sprites("A/Characters_99_new.png", seed=99)
+    shutil.rmtree(str(tmp_path / "out"))
+    outputs, _, done, logs = batch(settings, tmp_path / "out", plan=plan)
+    assert "Settings or folders changed since Preview Routing; scanning again." in logs
+    assert sorted(outputs) == sorted(list(serial[0]) + ["characters/new.png"])
+
+
+def test_saved_plan_matches_the_full_walk(tree, tmp_path):
+    settings, serial = tree
+    plan_path = str(tmp_path / "plan.json")
+    engine.save_plan(preview_plan(dict(settings, output=str(tmp_path / "out"))), plan_path)
+    outputs, rows, done, _ = batch(settings, tmp_path / "out", plan=engine.load_plan(plan_path))
+    assert (outputs, rows, done) == serial[:3]
+
+
+@pytest.mark.parametrize("scan_threads", [1, 4])
+def test_cached_index_follows_changes_to_the_input(tree, sprites, tmp_path, scan_threads):
+    settings, serial = tree
+    settings = dict(settings, scan_threads=scan_threads)
+    index_path = str(tmp_path / "index.sqlite")
+    outputs, rows, done, _ = batch(settings, tmp_path / "first", index_path=index_path)
+    assert (outputs, rows, done) == serial[:3]
+
+    sprites("A/Characters_99_new.png", seed=99)
+    sprites("B/sub/deeper/Items_98_deep.png", seed=98)
+    os.remove(str(tmp_path / "in" / "A" / "Characters_0_a0.png"))
+    shutil.rmtree(str(tmp_path / "in" / "R"))
+    cached = batch(settings, tmp_path / "cached", index_path=index_path)
+    uncached = batch(settings, tmp_path / "uncached")
+    assert cached[:3] == uncached[:3]
+    assert "characters/new.png" in cached[0] and "items/deep.png" in cached[0]
+    assert "characters/a0.png" not in cached[0] and "characters/r0.png" not in cached[0]
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+import chromaforge_engine as engine
+
+
+def noisy_image(seed=0, size=(96, 64)):
+    rng = np.random.default_rng(seed)
+    return Image.fromarray(rng.integers(0, 256, (size[1], size[0], 4), dtype=np.uint8))
+
+
+def random_keys(count, seed=1):
+    rng = np.random.default_rng(seed)
+    return [tuple(int(value) for value in rng.integers(0, 256, 3)) for _ in range(count)]
+
+
+@pytest.mark.parametrize("mode", ["transparent", "replace"])
+@pytest.mark.parametrize("count,tolerance", [(3, 0), (20, 0), (20, 40), (300, 12)])
+def test_dry_run_counts_match_the_transform(mode, count, tolerance):
+    img = noisy_image()
+    keys = random_keys(count)
+    # Make sure every key matches something exactly.
+    arr = np.array(img)
+    for idx, key in enumerate(keys[:arr.shape[1]]):
+        arr[0, idx, :3] = key
+    img = Image.fromarray(arr)
+    pairs = tuple((key, (idx % 256, 7, 9)) for idx, key in enumerate(keys))
+    counted_hits = {}
+    counted = engine.count_matches(img, mode, keys, pairs, None, False, counted_hits, tolerance)
+    applied_hits = {}
+    _, applied = engine.process_pixels_numpy(img.copy(), mode, keys, pairs, None, False, False, applied_hits, tolerance)
+    assert counted == applied > 0
+    if mode == "replace":
+        assert counted_hits == applied_hits
+
+
+STEPS = [
+    engine.ColorConfig("transparent", [(0, 255, 0), (40, 40, 40)]),
+    engine.ColorConfig("transparent", [(0, 255, 0)], tolerance=30),
+    engine.ColorConfig("transparent", random_keys(20) + [(0, 255, 0)]),
+    engine.ColorConfig("replace", replace_pair=((0, 255, 0), (9, 8, 7))),
+    engine.ColorConfig("replace", replace_map=[((0, 255, 0), (9, 8, 7)), ((40, 40, 40), (1, 1, 1)), ((41, 40, 40), (2, 2, 2))]),
+    engine.ColorConfig("replace", replace_map=[((0, 255, 0), (9, 8, 7)), ((30, 240, 10), (1, 1, 1))], tolerance=25),
+    engine.ColorConfig("fill", fill_rgb=(5, 6, 7)),
+    engine.ColorConfig("fill", fill_rgb=(5, 6, 7), fill_shadows=True),
+]
+
+
+@pytest.mark.parametrize("step", STEPS, ids=lambda step: f"{step.mode}-{len(step.target_rgbs) or len(step.replace_pairs())}-t{step.tolerance}")
+@pytest.mark.parametrize("dry_run", [False, True])
+def test_numpy_engine_matches_the_pixel_loop(step, dry_run):
+    arr = np.array(noisy_image(seed=3))
+    arr[::4, :, :3] = (0, 255, 0)
+    arr[1::4, ::3, :3] = (40, 40, 40)
+    arr[2::8, :, 3] = 0
+    img = Image.fromarray(arr)
+    args = (step.mode, step.target_rgbs, step.replace_pairs(), step.fill_rgb, step.fill_shadows, dry_run)
+    loop_hits = {}
+    loop_img, loop_count = engine.process_pixels_loop(img.copy(), *args, loop_hits, step.tolerance)
+    numpy_hits = {}
+    numpy_img, numpy_count = engine.process_pixels_numpy(img.copy(), *args, numpy_hits, step.tolerance)
+    assert numpy_count == loop_count > 0
+    assert numpy_hits == loop_hits
+    assert np.array_equal(np.asarray(numpy_img), np.asarray(loop_img))
+
+
+@pytest.mark.parametrize("step", STEPS[:6], ids=lambda step: f"{step.mode}-t{step.tolerance}")
+def test_palette_shortcut_matches_rgba(step):
+    arr = np.array(noisy_image(seed=5))[..., :3]
+    arr[::3] = (0, 255, 0)
+    arr[1::5] = (40, 40, 40)
+    indexed = Image.fromarray(arr).quantize(64)
+    indexed.info["transparency"] = bytes([255, 128] * 32)
+    args = (step.mode, step.target_rgbs, step.replace_pairs(), step.fill_rgb, step.fill_shadows)
+    palette_img, palette_count, save_args = engine.transform_image(indexed.copy(), *args, None, step.tolerance)
+    rgba_img, rgba_count = engine.process_pixels_numpy(indexed.convert("RGBA"), *args, False, None, step.tolerance)
+    palette_img.info["transparency"] = save_args.get("transparency", b"")
+    assert palette_img.mode == "P"
+    assert palette_count == rgba_count > 0
+    assert np.array_equal(np.asarray(palette_img.convert("RGBA")), np.asarray(rgba_img))
@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+import chromaforge_engine as engine
+
+STRIPS = engine.OutputConfig(strip_threshold_mp=0.0005)
+WHOLE = engine.OutputConfig(strip_threshold_mp=0)
+CHAIN = engine.ColorConfig("operations", operations=[
+    engine.ColorConfig("transparent", [(0, 255, 0)]),
+    engine.ColorConfig("fill", fill_rgb=(1, 2, 3)),
+]).steps()
+
+
+def source_array(seed=4, size=(517, 301)):
+    rng = np.random.default_rng(seed)
+    arr = rng.integers(0, 256, (size[1], size[0], 4), dtype=np.uint8)
+    arr[::7, :, :3] = (0, 255, 0)
+    arr[:, ::5, :3] = 40
+    return arr
+
+
+def save_source(path, kind):
+    arr = source_array()
+    if kind == "rgba":
+        Image.fromarray(arr).save(path)
+    elif kind == "rgb_trns":
+        Image.fromarray(arr[..., :3]).save(path, transparency=(40, 40, 40))
+    elif kind == "l_trns":
+        Image.fromarray(arr[..., 0]).save(path, transparency=40)
+    elif kind == "la":
+        Image.merge("LA", (Image.fromarray(arr[..., 0]), Image.fromarray(arr[..., 3]))).save(path)
+    elif kind == "p":
+        Image.fromarray(arr[..., :3]).quantize(200).save(path, transparency=bytes(range(200)))
+    elif kind == "bilevel":
+        Image.fromarray(arr[..., 0]).convert("1").save(path)
+    elif kind == "gray16":
+        Image.fromarray(arr[..., 0].astype(np.uint16) * 257).save(path)
+    elif kind == "idat_per_strip":
+        # Many IDAT chunks and every row filter type.
+        with open(path, "wb") as handle:
+            writer = engine.PngStripWriter(handle, arr.shape[1], arr.shape[0], 6)
+            for top in range(0, arr.shape[0], 9):
+                writer.write(arr[top:top + 9])
+            writer.close()
+
+
+def rgba(path):
+    with Image.open(path) as img:
+        return np.asarray(img.convert("RGBA"))
+
+
+@pytest.mark.parametrize("kind", ["rgba", "rgb_trns", "l_trns", "la", "p", "bilevel", "gray16", "idat_per_strip"])
+def test_strips_match_whole_image(tmp_path, kind):
+    source = str(tmp_path / "in.png")
+    save_source(source, kind)
+    whole = engine.process_image(source, str(tmp_path / "whole.png"), CHAIN, False, WHOLE)
+    strips = engine.process_image(source, str(tmp_path / "strips.png"), CHAIN, False, STRIPS)
+    assert strips[0] == whole[0]
+    assert np.array_equal(rgba(tmp_path / "strips.png"), rgba(tmp_path / "whole.png"))
+
+
+def test_strip_reader_reads_the_file_incrementally(tmp_path):
+    source = str(tmp_path / "in.png")
+    rng = np.random.default_rng(0)
+    Image.fromarray(rng.integers(0, 256, (1200, 1000, 4), dtype=np.uint8)).save(source)
+    with open(source, "rb") as handle:
+        reader = engine.PngStripReader.open(handle)
+        first = reader.read(8)
+        assert handle.tell() <= 2 * engine.PNG_READ_CHUNK
+    assert first.shape == (8, 1000, 4)
+    assert np.array_equal(first, rgba(source)[:8])
+
+
+def test_images_over_the_bomb_limit_use_strips(tmp_path, monkeypatch):
+    source = str(tmp_path / "in.png")
+    Image.fromarray(source_array(size=(100, 60))).save(source)
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    with pytest.raises(Image.DecompressionBombError):
+        Image.open(source)
+    output = engine.OutputConfig(strip_threshold_mp=0.001)
+    counts, _, size, _ = engine.process_image(source, str(tmp_path / "out.png"), CHAIN, False, output)
+    assert counts[0] > 0 and size > 0
+
+
+def test_pipeline_strips_match_serial(settings, tmp_path):
+    for index, kind in enumerate(["rgba", "p", "gray16"]):
+        path = tmp_path / "in" / "A" / f"Characters_{index}_x{index}.png"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        save_source(str(path), kind)
+    settings = dict(settings, strip_threshold_mp=0.0005)
+    for name, pipeline in (("serial", False), ("pipeline", True)):
+        job = engine.BatchJob.from_settings(dict(settings, output=str(tmp_path / name), pipeline=pipeline, workers=2), "")
+        engine.run_batch(job, lambda event: None, lambda groups, files: "copy")
+    serial = sorted((tmp_path / "serial").rglob("*.png"))
+    assert len(serial) == 3
+    for path in serial:
+        assert np.array_equal(rgba(path), rgba(tmp_path / "pipeline" / path.relative_to(tmp_path / "serial")))
+
+
+def test_preview_counts_and_auto_profile_skip_the_bomb_limit(settings, tmp_path, monkeypatch):
+    path = tmp_path / "in" / "A" / "Characters_1_x1.png"
+    path.parent.mkdir(parents=True)
+    Image.fromarray(source_array(size=(100, 60))).save(str(path))
+    expected = engine.count_image_steps(str(path), CHAIN)
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    settings = dict(settings, strip_threshold_mp=0.001, preview_count_pixels=True, png_profile="auto")
+    output = engine.OutputConfig.from_settings(settings)
+    assert engine.count_image_steps(str(path), CHAIN, output) == expected
+    assert engine.sample_images([str(path)], output) == []
+
+    events = []
+    engine.run_preview(engine.PreviewJob.from_settings(settings), events.append)
+    assert [event for event in events if "error" in event[0]] == []
+    events = []
+    engine.run_batch(engine.BatchJob.from_settings(settings, ""), events.append, lambda groups, files: "copy")
+    assert [event for event in events if event[0] == "error"] == []
+    assert (tmp_path / "out" / "characters" / "x1.png").exists()